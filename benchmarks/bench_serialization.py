@@ -0,0 +1,175 @@
+"""
+REST 响应序列化基准
+
+对比 FastAPI 默认路径（jsonable_encoder + JSONResponse）与 FastJSONResponse
+在最大几类响应上的编码耗时。数据为按真实结构构造的合成数据，无需网络。
+
+运行：
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --repeat 50 --output bench_serialization.json
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Any, Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from utils.json_response import FastJSONResponse
+
+
+def build_pairs_payload(count: int = 5000) -> Dict[str, Any]:
+    """/api/pairs?market=all 的典型结构（数千个交易对分组返回）"""
+    rng = random.Random(1)
+    result = {"spot": [], "future": [], "option": []}
+    for i in range(count):
+        group = rng.choice(["spot", "spot", "future", "option"])
+        result[group].append(
+            {
+                "id": i + 1,
+                "exchange": "binance",
+                "pair": f"COIN{i}/USDT" if group == "spot" else f"COIN{i}/USDT:USDT",
+                "active": True,
+                "type": group,
+                "route": "https://www.binance.com",
+            }
+        )
+    return {
+        "code": 0,
+        "msg": "success",
+        "data": {
+            "result": result,
+            "exchange": "binance",
+            "total": count,
+            "groups": ["spot", "future", "option"],
+            "mode": "grouped",
+        },
+        "ts": 1700000000000,
+    }
+
+
+def build_ohlc_payload(periods: int = 6, candles: int = 200) -> Dict[str, Any]:
+    """/api/ohlc?periods=60,300,900,3600,14400,86400 的典型结构"""
+    rng = random.Random(2)
+    result = {}
+    for p in range(periods):
+        price = 30000.0
+        rows = []
+        for i in range(candles):
+            o = price
+            c = o * (1 + rng.uniform(-0.01, 0.01))
+            h = max(o, c) * (1 + rng.uniform(0, 0.005))
+            low = min(o, c) * (1 - rng.uniform(0, 0.005))
+            v = rng.uniform(1, 100)
+            rows.append([1700000000 + i * 60, o, h, low, c, v, round(c * v, 2)])
+            price = c
+        result[str(60 * (p + 1))] = rows
+    return {
+        "code": 0,
+        "msg": "success",
+        "data": {"result": result, "symbol": "BTC/USDT", "exchange": "binance"},
+        "ts": 1700000000000,
+    }
+
+
+def build_contracts_payload(count: int = 100) -> Dict[str, Any]:
+    """/api/contracts/markets?limit=100 的典型结构"""
+    rows = [
+        {
+            "symbol": f"COIN{i}/USDT:USDT",
+            "base": f"COIN{i}",
+            "quote": "USDT",
+            "linear": True,
+            "inverse": False,
+            "maxLeverage": 100,
+            "minLeverage": 1,
+            "exchange": "okx",
+            "fundingRate": 0.0001,
+            "nextFundingTime": 1700000000000,
+        }
+        for i in range(count)
+    ]
+    return {
+        "code": 0,
+        "msg": "success",
+        "data": {
+            "result": rows,
+            "pagination": {
+                "page": 1,
+                "limit": count,
+                "total": 500,
+                "total_pages": 5,
+                "sort": "symbol",
+                "order": "asc",
+            },
+        },
+        "ts": 1700000000000,
+    }
+
+
+PAYLOADS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "pairs_all_5000": build_pairs_payload,
+    "ohlc_6x200": build_ohlc_payload,
+    "contracts_100": build_contracts_payload,
+}
+
+
+def default_path(content: Any) -> bytes:
+    # FastAPI 对 dict 返回值的默认处理：jsonable_encoder 遍历 + JSONResponse 渲染
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_path(content: Any) -> bytes:
+    return FastJSONResponse(content).body
+
+
+def measure(fn: Callable[[Any], bytes], content: Any, repeat: int) -> Dict[str, float]:
+    fn(content)  # 预热
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "mean_ms": round(statistics.mean(samples), 4),
+        "p50_ms": round(statistics.median(samples), 4),
+        "min_ms": round(min(samples), 4),
+    }
+
+
+def run(repeat: int) -> Dict[str, Any]:
+    results = {}
+    for name, builder in PAYLOADS.items():
+        content = builder()
+        default = measure(default_path, content, repeat)
+        fast = measure(fast_path, content, repeat)
+        results[name] = {
+            "bytes": len(fast_path(content)),
+            "default": default,
+            "fast": fast,
+            "speedup": round(default["mean_ms"] / fast["mean_ms"], 2)
+            if fast["mean_ms"]
+            else None,
+        }
+    return {"benchmark": "serialization", "repeat": repeat, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST 响应序列化基准")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default="", help="结果写入的 JSON 文件（默认只打印）")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+对比两次基准结果（benchmarks.run 生成的 JSON）
+
+    python -m benchmarks.compare bench_before.json bench_after.json
+"""
+import argparse
+import json
+from typing import Optional
+
+
+def _delta(before: Optional[float], after: Optional[float]) -> str:
+    if before in (None, 0) or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare(before: dict, after: dict) -> None:
+    print(f"before: {before['meta'].get('revision')}  after: {after['meta'].get('revision')}")
+
+    print("\nREST (rps / p99_ms)")
+    for name, b in before.get("rest", {}).items():
+        a = after.get("rest", {}).get(name)
+        if not a:
+            continue
+        print(
+            f"  {name:<20} rps {b['rps']:>9} -> {a['rps']:>9} ({_delta(b['rps'], a['rps'])})"
+            f"   p99 {b['p99_ms']:>8} -> {a['p99_ms']:>8} ({_delta(b['p99_ms'], a['p99_ms'])})"
+        )
+
+    if before.get("contracts") and after.get("contracts"):
+        print("\nContracts markets (rps / p99_ms)")
+        for name, b in before["contracts"].items():
+            a = after["contracts"].get(name)
+            if not a:
+                continue
+            print(
+                f"  {name:<20} rps {b['rps']:>9} -> {a['rps']:>9} ({_delta(b['rps'], a['rps'])})"
+                f"   p99 {b['p99_ms']:>8} -> {a['p99_ms']:>8} ({_delta(b['p99_ms'], a['p99_ms'])})"
+            )
+
+    for channel in ("ticker", "orderbook"):
+        rows_before = {(r["clients"], r["symbols"]): r for r in before.get("ws", {}).get(channel, [])}
+        rows_after = {(r["clients"], r["symbols"]): r for r in after.get("ws", {}).get(channel, [])}
+        if not rows_before:
+            continue
+        print(f"\nWS {channel} (msg/s / p99_ms)")
+        for key, b in rows_before.items():
+            a = rows_after.get(key)
+            if not a:
+                continue
+            print(
+                f"  {key[0]:>4} clients x {key[1]:>3} symbols"
+                f"   msg/s {b['messages_per_s']:>9} -> {a['messages_per_s']:>9} ({_delta(b['messages_per_s'], a['messages_per_s'])})"
+                f"   p99 {b['p99_ms']} -> {a['p99_ms']} ({_delta(b['p99_ms'], a['p99_ms'])})"
+            )
+
+    sb, sa = before.get("startup"), after.get("startup")
+    if sb and sa:
+        print("\nStartup (ready_ms / idle RSS KB)")
+        for mode, b in sb.items():
+            a = sa.get(mode)
+            if not a:
+                continue
+            print(
+                f"  {mode:<8} ready {b['ready_ms']:>8} -> {a['ready_ms']:>8} ({_delta(b['ready_ms'], a['ready_ms'])})"
+                f"   rss {b['rss_idle_kb']:>8} -> {a['rss_idle_kb']:>8} ({_delta(b['rss_idle_kb'], a['rss_idle_kb'])})"
+            )
+
+    mb, ma = before.get("memory"), after.get("memory")
+    if mb and ma:
+        print(
+            f"\nMemory per WS connection: {mb['kb_per_connection']} KB -> {ma['kb_per_connection']} KB"
+            f" ({_delta(mb['kb_per_connection'], ma['kb_per_connection'])})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次基准结果")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    compare(before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,578 @@
+"""
+端到端基准：启动服务（连接确定性模拟交易所 sim，不需要网络），测量
+
+- REST：每个路由的吞吐量（req/s）和延迟分位数
+- WebSocket 扇出：/api/ws/ticker、/api/ws/orderbook 在 客户端数 × symbol 数 组合下的
+  消息吞吐和推送延迟
+- 每个 WebSocket 连接占用的服务端内存（RSS 增量 / 连接数）
+- /api/contracts/markets 在大量并发调用方（默认 200）下的吞吐：冷启动突发 + 各种排序 / 分页
+- 冷启动：从启动进程到第一个响应的耗时和空闲 RSS，对比 ccxt 按需导入开 / 关（CCXT_LAZY_IMPORT）
+
+--record 把服务收到的上游行情录制下来，--replay 让 WS 场景改为回放录制文件（?exchange=replay），
+用真实流量形态（突发、空档）做可重复的对比：
+
+    python -m benchmarks.run --suites ws --record feed.jsonl
+    python -m benchmarks.run --suites ws --replay feed.jsonl --replay-speed 10
+
+结果写成 JSON，可用 benchmarks/compare.py 对比两次提交：
+
+    python -m benchmarks.run --output bench_before.json
+    python -m benchmarks.run --output bench_after.json
+    python -m benchmarks.compare bench_before.json bench_after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from utils.replay_exchange import EXCHANGE_ID as REPLAY_EXCHANGE_ID, scan_recording
+from utils.sim_exchange import EXCHANGE_ID, KNOWN_BASES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SPOT_SYMBOLS = [f"{base}/USDT" for base in KNOWN_BASES[:10]]
+
+REST_CASES = [
+    ("exchanges", "/api/exchanges", {}),
+    ("ticker", "/api/ticker", {"exchange": EXCHANGE_ID, "symbol": "BTC/USDT"}),
+    ("summary", "/api/summary", {"exchange": EXCHANGE_ID, "symbol": "BTC/USDT"}),
+    ("pairs", "/api/pairs", {"exchange": EXCHANGE_ID}),
+    ("ohlc", "/api/ohlc", {"exchange": EXCHANGE_ID, "symbol": "BTC/USDT", "periods": "60,3600"}),
+    ("orderbook", "/api/orderbook", {"exchange": EXCHANGE_ID, "symbol": "BTC/USDT", "limit": 50}),
+    ("trades", "/api/trades", {"exchange": EXCHANGE_ID, "symbol": "BTC/USDT", "limit": 100}),
+    ("contracts_markets", "/api/contracts/markets", {"exchange": EXCHANGE_ID}),
+]
+
+
+# -----------------------------------------------------------------------
+# 工具函数
+# -----------------------------------------------------------------------
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "mean_ms": round(statistics.mean(ordered), 3),
+    }
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """读取进程常驻内存（Linux /proc），其他平台返回 None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True
+        ).strip()
+    except Exception:
+        return ""
+
+
+# -----------------------------------------------------------------------
+# 服务进程
+# -----------------------------------------------------------------------
+
+
+class ServerProcess:
+    def __init__(self, port: int, log_path: str, env: Optional[Dict[str, str]] = None):
+        self.port = port
+        self.log_path = log_path
+        self.env = env or {}
+        self.proc: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, timeout: float = 30.0, poll_interval: float = 0.2) -> float:
+        """启动服务并等到 /api/exchanges 返回 200，返回耗时（秒）"""
+        started = time.perf_counter()
+        log_file = open(self.log_path, "w")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.server", "--port", str(self.port)],
+            cwd=REPO_ROOT,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            env={**os.environ, **self.env},
+        )
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if self.proc.poll() is not None:
+                    raise RuntimeError(f"服务进程启动失败，日志见 {self.log_path}")
+                try:
+                    async with session.get(self.base_url + "/api/exchanges") as resp:
+                        if resp.status == 200:
+                            return time.perf_counter() - started
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(poll_interval)
+        raise RuntimeError("服务进程启动超时")
+
+    def rss_kb(self) -> Optional[int]:
+        return read_rss_kb(self.proc.pid) if self.proc else None
+
+    def stop(self) -> None:
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+# -----------------------------------------------------------------------
+# REST
+# -----------------------------------------------------------------------
+
+
+async def bench_rest_case(
+    session: aiohttp.ClientSession,
+    url: str,
+    params: Dict[str, Any],
+    requests: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                async with session.get(url, params=params) as resp:
+                    body = await resp.read()
+                    ok = resp.status == 200 and body.startswith(b'{"code":0')
+            except aiohttp.ClientError:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1) if elapsed else None,
+        **percentiles(latencies),
+    }
+
+
+async def bench_rest(base_url: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    results = {}
+    async with aiohttp.ClientSession() as session:
+        for name, path, params in REST_CASES:
+            # 预热：首个请求会创建实例 / 加载市场
+            async with session.get(base_url + path, params=params) as resp:
+                await resp.read()
+            results[name] = await bench_rest_case(
+                session, base_url + path, params, requests, concurrency
+            )
+            print(f"  REST {name}: {results[name]['rps']} req/s, p99 {results[name]['p99_ms']} ms")
+    return results
+
+
+# 合约列表：轮换排序字段 / 方向 / 页码，覆盖全部预排序索引
+CONTRACT_SORTS = ["symbol", "volume_24h", "priceChange", "leverage", "fundingRate"]
+
+
+async def bench_contracts(base_url: str, requests: int, callers: int) -> Dict[str, Any]:
+    """
+    cold：callers 个调用方同时请求一个还没访问过的 (exchange, type)，测冷启动（市场加载单飞）
+    warm：callers 个调用方持续请求，共 requests 次
+    """
+    url = base_url + "/api/contracts/markets"
+    param_sets = [
+        {"exchange": EXCHANGE_ID, "type": "linear", "sort": sort, "order": order, "page": page, "limit": 20}
+        for sort in CONTRACT_SORTS
+        for order in ("asc", "desc")
+        for page in (1, 2)
+    ]
+    results: Dict[str, Any] = {}
+    connector = aiohttp.TCPConnector(limit=callers)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def call(params: Dict[str, Any]) -> bool:
+            try:
+                async with session.get(url, params=params) as resp:
+                    body = await resp.read()
+                    return resp.status == 200 and body.startswith(b'{"code":0')
+            except aiohttp.ClientError:
+                return False
+
+        async def timed(params: Dict[str, Any]):
+            start = time.perf_counter()
+            ok = await call(params)
+            return (time.perf_counter() - start) * 1000, ok
+
+        start = time.perf_counter()
+        cold = await asyncio.gather(*[timed({"exchange": EXCHANGE_ID, "type": "inverse"}) for _ in range(callers)])
+        elapsed = time.perf_counter() - start
+        results["cold"] = {
+            "requests": callers,
+            "concurrency": callers,
+            "errors": sum(1 for _, ok in cold if not ok),
+            "rps": round(callers / elapsed, 1) if elapsed else None,
+            **percentiles([ms for ms, _ in cold]),
+        }
+        print(f"  contracts cold x{callers}: p50 {results['cold']['p50_ms']} ms, p99 {results['cold']['p99_ms']} ms")
+
+        latencies: List[float] = []
+        errors = 0
+        counter = 0
+
+        async def worker():
+            nonlocal counter, errors
+            while counter < requests:
+                params = param_sets[counter % len(param_sets)]
+                counter += 1
+                ms, ok = await timed(params)
+                latencies.append(ms)
+                if not ok:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(callers)])
+        elapsed = time.perf_counter() - start
+        results["warm"] = {
+            "requests": requests,
+            "concurrency": callers,
+            "errors": errors,
+            "rps": round(requests / elapsed, 1) if elapsed else None,
+            **percentiles(latencies),
+        }
+        print(f"  contracts warm x{callers}: {results['warm']['rps']} req/s, p99 {results['warm']['p99_ms']} ms")
+    return results
+
+
+# -----------------------------------------------------------------------
+# WebSocket 扇出
+# -----------------------------------------------------------------------
+
+
+async def _ws_client(
+    session: aiohttp.ClientSession,
+    url: str,
+    subscribe_messages: List[dict],
+    update_action: str,
+    duration: float,
+    stats: Dict[str, Any],
+) -> None:
+    async with session.ws_connect(url) as ws:
+        for msg in subscribe_messages:
+            await ws.send_str(json.dumps(msg))
+        deadline = time.monotonic() + duration
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                message = await ws.receive(timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            payload = json.loads(message.data)
+            data = payload.get("data") or {}
+            if update_action == "ticker":
+                is_update = payload.get("type") == "ticker"
+            else:
+                is_update = data.get("action") == update_action
+            if not is_update:
+                continue
+            stats["messages"] += 1
+            ts = payload.get("ts")
+            if ts:
+                stats["latencies"].append(time.time() * 1000 - ts)
+
+
+async def bench_ws_fanout(
+    base_url: str,
+    path: str,
+    update_action: str,
+    clients: int,
+    symbols: int,
+    duration: float,
+    exchange_id: str = EXCHANGE_ID,
+    symbol_pool: List[str] = SPOT_SYMBOLS,
+) -> Dict[str, Any]:
+    url = base_url.replace("http://", "ws://") + path + f"?exchange={exchange_id}"
+    subscribe = [
+        {"action": "subscribe", "symbol": symbol, "marketType": "swap" if ":" in symbol else "spot"}
+        for symbol in symbol_pool[:symbols]
+    ]
+    stats: Dict[str, Any] = {"messages": 0, "latencies": []}
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(
+            *[
+                _ws_client(session, url, subscribe, update_action, duration, stats)
+                for _ in range(clients)
+            ],
+            return_exceptions=True,
+        )
+    return {
+        "clients": clients,
+        "symbols": symbols,
+        "duration_s": duration,
+        "messages": stats["messages"],
+        "messages_per_s": round(stats["messages"] / duration, 1),
+        **percentiles(stats["latencies"]),
+    }
+
+
+def _most_recorded(index: Dict[str, Any], method: str) -> List[str]:
+    counts = index.get(method)
+    return [symbol for symbol, _ in counts.most_common()] if counts else []
+
+
+async def bench_ws(
+    base_url: str,
+    client_counts: List[int],
+    symbol_counts: List[int],
+    duration: float,
+    replay: Optional[str] = None,
+) -> Dict[str, Any]:
+    exchange_id = EXCHANGE_ID
+    ticker_pool = orderbook_pool = SPOT_SYMBOLS
+    if replay:
+        # 回放模式：按录制文件里出现次数最多的 symbol 订阅
+        exchange_id = REPLAY_EXCHANGE_ID
+        index = scan_recording(replay)
+        ticker_pool = _most_recorded(index, "watch_ticker")
+        orderbook_pool = _most_recorded(index, "watch_order_book")
+
+    results: Dict[str, Any] = {"ticker": [], "orderbook": []}
+    for clients in client_counts:
+        for symbols in symbol_counts:
+            ticker = await bench_ws_fanout(
+                base_url, "/api/ws/ticker", "ticker", clients, symbols, duration,
+                exchange_id, ticker_pool,
+            )
+            results["ticker"].append(ticker)
+            print(f"  WS ticker {clients}x{symbols}: {ticker['messages_per_s']} msg/s")
+            orderbook = await bench_ws_fanout(
+                base_url, "/api/ws/orderbook", "orderbook_update", clients, symbols, duration,
+                exchange_id, orderbook_pool,
+            )
+            results["orderbook"].append(orderbook)
+            print(f"  WS orderbook {clients}x{symbols}: {orderbook['messages_per_s']} msg/s")
+    return results
+
+
+# -----------------------------------------------------------------------
+# 每连接内存
+# -----------------------------------------------------------------------
+
+
+async def bench_memory(server: ServerProcess, connections: int) -> Dict[str, Any]:
+    url = server.base_url.replace("http://", "ws://") + f"/api/ws/ticker?exchange={EXCHANGE_ID}"
+    await asyncio.sleep(1.0)
+    before = server.rss_kb()
+    async with aiohttp.ClientSession() as session:
+        sockets = []
+        for _ in range(connections):
+            ws = await session.ws_connect(url)
+            await ws.send_str(json.dumps({"action": "subscribe", "symbol": "BTC/USDT"}))
+            sockets.append(ws)
+        await asyncio.sleep(2.0)
+        after = server.rss_kb()
+        for ws in sockets:
+            await ws.close()
+
+    if before is None or after is None:
+        return {"connections": connections, "rss_before_kb": None, "rss_after_kb": None, "kb_per_connection": None}
+    return {
+        "connections": connections,
+        "rss_before_kb": before,
+        "rss_after_kb": after,
+        "kb_per_connection": round((after - before) / connections, 2),
+    }
+
+
+# -----------------------------------------------------------------------
+# 冷启动
+# -----------------------------------------------------------------------
+
+
+async def bench_startup(runs: int, log_path: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """
+    每种模式启动 runs 次独立进程：记录到第一个响应的耗时、空闲 RSS，
+    以及第一次用到交易所（sim ticker）之后的 RSS
+    """
+    report: Dict[str, Any] = {}
+    for mode, lazy in (("eager", "0"), ("lazy", "1")):
+        ready_s: List[float] = []
+        idle_kb: List[int] = []
+        used_kb: List[int] = []
+        for _ in range(runs):
+            server = ServerProcess(free_port(), log_path, {**env, "CCXT_LAZY_IMPORT": lazy})
+            try:
+                ready_s.append(await server.start(poll_interval=0.02))
+                idle_kb.append(server.rss_kb() or 0)
+                async with aiohttp.ClientSession() as session:
+                    params = {"exchange": EXCHANGE_ID, "symbol": "BTC/USDT"}
+                    async with session.get(server.base_url + "/api/ticker", params=params) as resp:
+                        await resp.read()
+                used_kb.append(server.rss_kb() or 0)
+            finally:
+                server.stop()
+        report[mode] = {
+            "runs": runs,
+            "ready_ms": round(statistics.median(ready_s) * 1000, 1),
+            "ready_ms_min": round(min(ready_s) * 1000, 1),
+            "rss_idle_kb": int(statistics.median(idle_kb)),
+            "rss_after_first_use_kb": int(statistics.median(used_kb)),
+        }
+    return report
+
+
+# -----------------------------------------------------------------------
+# 入口
+# -----------------------------------------------------------------------
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+async def run(args) -> Dict[str, Any]:
+    sim_env = {
+        "SIM_EXCHANGE_ENABLED": "1",
+        "SIM_EXCHANGE_SEED": str(args.sim_seed),
+        "SIM_EXCHANGE_UPDATE_HZ": str(args.sim_update_hz),
+        "SIM_EXCHANGE_LATENCY_MS": str(args.sim_latency_ms),
+    }
+    if args.record:
+        sim_env["FEED_RECORD_PATH"] = os.path.abspath(args.record)
+    if args.replay:
+        sim_env["FEED_REPLAY_PATH"] = os.path.abspath(args.replay)
+        sim_env["FEED_REPLAY_SPEED"] = args.replay_speed
+    startup = None
+    if "startup" in args.suites:
+        print("Startup ...")
+        startup = await bench_startup(args.startup_runs, args.server_log, sim_env)
+    server = ServerProcess(args.port or free_port(), args.server_log, sim_env)
+    await server.start()
+    try:
+        report: Dict[str, Any] = {
+            "meta": {
+                "revision": git_revision(),
+                "timestamp": int(time.time()),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "params": {
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "ws_clients": args.ws_clients,
+                    "ws_symbols": args.ws_symbols,
+                    "ws_duration": args.ws_duration,
+                    "mem_connections": args.mem_connections,
+                    "contract_requests": args.contract_requests,
+                    "contract_callers": args.contract_callers,
+                    "startup_runs": args.startup_runs,
+                    "sim": sim_env,
+                },
+            },
+            "rss_idle_kb": server.rss_kb(),
+        }
+        if startup is not None:
+            report["startup"] = startup
+        if "rest" in args.suites:
+            print("REST ...")
+            report["rest"] = await bench_rest(server.base_url, args.requests, args.concurrency)
+        if "contracts" in args.suites:
+            print("Contracts ...")
+            report["contracts"] = await bench_contracts(
+                server.base_url, args.contract_requests, args.contract_callers
+            )
+        if "ws" in args.suites:
+            print("WebSocket ...")
+            report["ws"] = await bench_ws(
+                server.base_url,
+                _int_list(args.ws_clients),
+                _int_list(args.ws_symbols),
+                args.ws_duration,
+                args.replay,
+            )
+        if "memory" in args.suites:
+            print("Memory ...")
+            report["memory"] = await bench_memory(server, args.mem_connections)
+        return report
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST / WebSocket 端到端基准")
+    parser.add_argument(
+        "--suites", default="rest,contracts,ws,memory,startup", help="逗号分隔：rest,contracts,ws,memory,startup"
+    )
+    parser.add_argument("--requests", type=int, default=500, help="每个 REST 路由的请求数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ws-clients", default="10,50", help="WS 客户端数，逗号分隔")
+    parser.add_argument("--ws-symbols", default="1,5", help="每个客户端订阅的 symbol 数，逗号分隔")
+    parser.add_argument("--ws-duration", type=float, default=5.0, help="每个 WS 场景持续秒数")
+    parser.add_argument("--mem-connections", type=int, default=200)
+    parser.add_argument("--contract-requests", type=int, default=4000, help="合约列表 warm 场景总请求数")
+    parser.add_argument("--contract-callers", type=int, default=200, help="合约列表并发调用方数")
+    parser.add_argument("--startup-runs", type=int, default=5, help="冷启动场景每种模式启动的进程数")
+    parser.add_argument("--sim-seed", type=int, default=42, help="模拟交易所随机种子")
+    parser.add_argument("--sim-update-hz", type=float, default=10, help="模拟交易所推送频率")
+    parser.add_argument("--sim-latency-ms", type=float, default=0, help="模拟交易所 REST 延迟")
+    parser.add_argument("--record", default="", help="把服务收到的上游行情录制到该文件")
+    parser.add_argument("--replay", default="", help="WS 场景改为回放该录制文件")
+    parser.add_argument("--replay-speed", default="1", help="回放倍速，max 为不等待")
+    parser.add_argument("--port", type=int, default=0, help="服务端口（默认随机）")
+    parser.add_argument("--server-log", default="bench_server.log")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    args.suites = set(s.strip() for s in args.suites.split(","))
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
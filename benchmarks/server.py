@@ -0,0 +1,23 @@
+"""
+基准测试用的服务进程：启动 main:app（main 导入时注册模拟交易所 sim）
+
+    python -m benchmarks.server --port 8765
+"""
+import argparse
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基准测试服务进程")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import main as app_module  # noqa: E402  导入时会应用 ccxt 全局补丁
+
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
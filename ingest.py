@@ -0,0 +1,180 @@
+"""
+行情 ingest 进程：持有全部 ccxt.pro 订阅，通过 Unix socket 向各 API worker 发布行情
+
+    python -m ingest
+    MARKET_DATA_MODE=bus uvicorn main:app --workers 4
+
+- 同一个 (exchange, marketType, method, symbol) 只有一个上游 watch 循环，按 worker 引用计数
+- 最后一个订阅者退订（或断开）后停止 watch 循环
+- 每条更新只编码一次，写给所有订阅的 worker；某个 worker 读得太慢时丢弃它的更新
+- 盘口写进共享内存（utils/shm_orderbook.py），总线上只发一条“已更新”通知，
+  worker 直接从 mmap 读；ORDERBOOK_SHM=0 时退回经 socket 发送完整盘口
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, Set, Tuple
+
+from utils.lazy_ccxt import install_lazy_ccxt
+install_lazy_ccxt()
+
+import ccxt.pro as ccxt_pro
+
+from utils.ccxt_patch import apply_global_ccxt_patch
+from utils.logger import setup_logging
+from utils.market_bus import (
+    BUS_METHODS,
+    BUS_PATH,
+    encode_frame,
+    normalize,
+    read_frame,
+    split_key,
+)
+from utils.replay_exchange import register_replay_exchange
+from utils.shm_orderbook import OrderBookStore, book_key
+from utils.sim_exchange import register_sim_exchange
+
+logger = logging.getLogger("ingest")
+
+# 单个 worker 连接允许积压的字节数，超过后丢弃更新（行情只关心最新值）
+MAX_PENDING_BYTES = 4 * 1024 * 1024
+
+# watch 出错后的重试间隔（秒）
+RETRY_DELAY = 3.0
+
+
+class WorkerConnection:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.keys: Set[str] = set()
+        self.dropped = 0
+
+    def send(self, frame: bytes) -> None:
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            self.dropped += 1
+            return
+        self.writer.write(frame)
+
+
+class IngestServer:
+    def __init__(self, path: str = BUS_PATH):
+        self.path = path
+        self.subscribers: Dict[str, Set[WorkerConnection]] = {}
+        self.pumps: Dict[str, asyncio.Task] = {}
+        self.exchanges: Dict[Tuple[str, str], ccxt_pro.Exchange] = {}
+        self.book_store = OrderBookStore.create() if os.getenv("ORDERBOOK_SHM", "1") != "0" else None
+
+    def _exchange(self, exchange_id: str, market_type: str) -> ccxt_pro.Exchange:
+        key = (exchange_id, market_type)
+        ex = self.exchanges.get(key)
+        if ex is None:
+            ex = getattr(ccxt_pro, exchange_id)({"options": {"defaultType": market_type}})
+            self.exchanges[key] = ex
+        return ex
+
+    def _publish(self, key: str, message: dict) -> None:
+        subscribers = self.subscribers.get(key)
+        if not subscribers:
+            return
+        frame = encode_frame(message)
+        for conn in subscribers:
+            conn.send(frame)
+
+    async def _pump(self, key: str) -> None:
+        exchange_id, market_type, method, symbol = split_key(key)
+        logger.info(f"开始上游订阅: {key}")
+        try:
+            ex = self._exchange(exchange_id, market_type)
+            watch = getattr(ex, method)
+            while True:
+                try:
+                    result = await watch(symbol)
+                    if method == "watch_order_book" and self.book_store is not None:
+                        shm_key = book_key(exchange_id, symbol)
+                        self.book_store.write(
+                            shm_key, result["bids"], result["asks"], result.get("timestamp"), result.get("nonce")
+                        )
+                        self._publish(key, {"key": key, "shm": shm_key})
+                    else:
+                        self._publish(key, {"key": key, "data": normalize(method, result)})
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"上游订阅异常 {key}: {e}")
+                    self._publish(key, {"key": key, "error": {"type": type(e).__name__, "msg": str(e)}})
+                    await asyncio.sleep(RETRY_DELAY)
+        except asyncio.CancelledError:
+            logger.info(f"停止上游订阅: {key}")
+            raise
+
+    def subscribe(self, conn: WorkerConnection, key: str) -> None:
+        exchange_id, _, method, _ = split_key(key)
+        if method not in BUS_METHODS or getattr(ccxt_pro, exchange_id, None) is None:
+            conn.send(encode_frame({"key": key, "error": {"type": "BadRequest", "msg": f"不支持的订阅: {key}"}}))
+            return
+        conn.keys.add(key)
+        self.subscribers.setdefault(key, set()).add(conn)
+        if key not in self.pumps:
+            self.pumps[key] = asyncio.create_task(self._pump(key))
+
+    def unsubscribe(self, conn: WorkerConnection, key: str) -> None:
+        conn.keys.discard(key)
+        subscribers = self.subscribers.get(key)
+        if subscribers is None:
+            return
+        subscribers.discard(conn)
+        if not subscribers:
+            del self.subscribers[key]
+            task = self.pumps.pop(key, None)
+            if task:
+                task.cancel()
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        conn = WorkerConnection(writer)
+        logger.info("worker 已连接")
+        try:
+            while True:
+                message = await read_frame(reader)
+                op = message.get("op")
+                if op == "sub":
+                    self.subscribe(conn, message["key"])
+                elif op == "unsub":
+                    self.unsubscribe(conn, message["key"])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for key in list(conn.keys):
+                self.unsubscribe(conn, key)
+            writer.close()
+            logger.info(f"worker 已断开（丢弃更新 {conn.dropped} 条）")
+
+    async def serve(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle_worker, path=self.path)
+        logger.info(f"行情总线已启动: {self.path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self.pumps.values():
+                task.cancel()
+            for ex in self.exchanges.values():
+                await ex.close()
+
+
+def main():
+    setup_logging()
+    apply_global_ccxt_patch()
+    register_sim_exchange()
+    register_replay_exchange()
+    try:
+        asyncio.run(IngestServer().serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
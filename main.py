@@ -1,3 +1,9 @@
+from contextlib import asynccontextmanager
+
+# 必须在任何 ccxt 导入之前：交易所类改为首次使用时才导入（CCXT_LAZY_IMPORT=0 关闭）
+from utils.lazy_ccxt import install_lazy_ccxt
+install_lazy_ccxt()
+
 from utils.ccxt_patch import apply_global_ccxt_patch
 from fastapi import WebSocket, Query
 
@@ -13,8 +19,23 @@ from routers import order_book
 from routers import trades
 from routers import ws_ticker
 from routers import ws_orderbook
+from routers import metrics
+from routers import admin
+from routers import health
 
 from utils.logger import setup_logging
+from utils.http_cache import build_static_responses
+from utils.json_response import FastJSONResponse
+from utils.metrics import MetricsMiddleware
+from utils.sim_exchange import register_sim_exchange
+from utils.replay_exchange import register_replay_exchange
+from utils.contract_cache import start_contract_pollers, stop_contract_pollers
+from utils.exchange_manager import ExchangeManager
+from utils.http_pool import close_http_sessions
+from utils.proxy_pool import start_proxy_health, stop_proxy_health
+from utils.response_cache import close_response_cache
+from utils.stream_hub import stop_stream_hubs
+from utils.warmup import start_warmup, stop_warmup
 from routers.contracts import contract
 
 setup_logging()
@@ -28,16 +49,50 @@ setup_logging()
 #       3. 所以只能在代码中强制指定代理
 apply_global_ccxt_patch()
 
+# 确定性模拟交易所：设置 SIM_EXCHANGE_ENABLED=1 后 ?exchange=sim 即可离线跑通所有接口（默认关闭）
+register_sim_exchange()
+
+# 行情回放：?exchange=replay 按原始节奏推送 FEED_REPLAY_PATH 录制的数据
+register_replay_exchange()
+
 # -----------------------------------------------------------------------
-# 2. 创建App实例
+# 2. 应用生命周期
+#   启动阶段：预编码静态响应（如 /exchanges），之后请求直接返回 bytes；
+#   启动合约数据后台轮询（FUNDING_POLL_EXCHANGES），退出时停止轮询和共享行情 hub，关闭池化的 ccxt 实例和共享 HTTP 连接池；
+#   后台预热 WARMUP_MARKETS / WARMUP_STREAMS，完成前 /ready 返回 503；代理池主动健康检查
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    build_static_responses()
+    await start_proxy_health()
+    await start_contract_pollers()
+    await start_warmup()
+    yield
+    await stop_warmup()
+    await close_response_cache()
+    await stop_contract_pollers()
+    await stop_stream_hubs()
+    await ExchangeManager.close_all()
+    await close_http_sessions()
+    await stop_proxy_health()
+
+
+# -----------------------------------------------------------------------
+# 3. 创建App实例
 #   创建 FastAPI 应用实例。
 #   设置了 API 的标题、描述、版本，启动后访问 /docs 会看到美观的 Swagger 交互文档
 app = FastAPI(
-    title="CCXT Proxy API", description="简单代理多个交易所的价格获取", version="1.0"
+    title="CCXT Proxy API",
+    description="简单代理多个交易所的价格获取",
+    version="1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
+# 按路由 + exchange 统计请求数 / 耗时 / 错误码，通过 /metrics 导出
+app.add_middleware(MetricsMiddleware)
+
 # -----------------------------------------------------------------------
-# 3. 注册路由（前缀可选）
+# 4. 注册路由（前缀可选）
 app.include_router(ticker.router, prefix="/api")  # 可选加前缀 /api/ticker
 
 app.include_router(pairs.router, prefix="/api")
@@ -55,6 +110,15 @@ app.include_router(trades.router, prefix="/api")
 # 注册合约路由
 app.include_router(contract.router, prefix="/api") 
 
+# 运维接口：上游调用统计等
+app.include_router(admin.router, prefix="/api")
+
+# Prometheus 指标（不加 /api 前缀，符合抓取约定）
+app.include_router(metrics.router)
+
+# 就绪探针（不加 /api 前缀，负载均衡直接探测 /ready）
+app.include_router(health.router)
+
 # app.include_router(ws_ticker.router, prefix="")
 
 
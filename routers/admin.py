@@ -0,0 +1,125 @@
+from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+import logging
+
+from utils.ccxt_instrumentation import (
+    UPSTREAM_BYTES,
+    UPSTREAM_CALLS,
+    UPSTREAM_LATENCY,
+    UPSTREAM_THROTTLE,
+    UPSTREAM_WS_BYTES,
+)
+from utils.circuit_breaker import breaker_report
+from utils.hedging import hedge_report
+from utils.http_pool import HTTP_CONNECTIONS
+from utils.json_response import FastJSONRoute
+from utils.proxy_pool import PROXY_POOL
+from utils.response_cache import RESPONSE_CACHE
+from utils.metrics import histogram_quantile
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=FastJSONRoute)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def build_upstream_report():
+    """按 exchange + method 汇总上游调用埋点"""
+    rows = {}
+
+    def row(exchange_id, method):
+        key = (exchange_id, method)
+        if key not in rows:
+            rows[key] = {
+                "exchange": exchange_id,
+                "method": method,
+                "calls": 0,
+                "errors": {},
+                "latency": None,
+                "throttle": None,
+                "bytes": 0,
+            }
+        return rows[key]
+
+    for (exchange_id, method, outcome), value in UPSTREAM_CALLS.collect().items():
+        r = row(exchange_id, method)
+        r["calls"] += int(value)
+        if outcome != "ok":
+            r["errors"][outcome] = r["errors"].get(outcome, 0) + int(value)
+
+    for (exchange_id, method), series in UPSTREAM_LATENCY.collect().items():
+        buckets = UPSTREAM_LATENCY.buckets
+        count = series[-1]
+        row(exchange_id, method)["latency"] = {
+            "avg_ms": _ms(series[-2] / count) if count else 0.0,
+            "p50_ms": _ms(histogram_quantile(buckets, series, 0.5)),
+            "p95_ms": _ms(histogram_quantile(buckets, series, 0.95)),
+            "p99_ms": _ms(histogram_quantile(buckets, series, 0.99)),
+        }
+
+    for (exchange_id, method), series in UPSTREAM_THROTTLE.collect().items():
+        count = series[-1]
+        row(exchange_id, method)["throttle"] = {
+            "waits": int(count),
+            "total_ms": _ms(series[-2]),
+            "avg_ms": _ms(series[-2] / count) if count else 0.0,
+            "p95_ms": _ms(histogram_quantile(UPSTREAM_THROTTLE.buckets, series, 0.95)),
+        }
+
+    for (exchange_id, method), value in UPSTREAM_BYTES.collect().items():
+        row(exchange_id, method)["bytes"] = int(value)
+
+    ws_bytes = {labels[0]: int(value) for labels, value in UPSTREAM_WS_BYTES.collect().items()}
+
+    # 共享连接池（utils/http_pool.py）按 host 的连接复用情况
+    connections = {}
+    for (host, outcome), value in HTTP_CONNECTIONS.collect().items():
+        connections.setdefault(host, {"created": 0, "reused": 0})[outcome] = int(value)
+    for counts in connections.values():
+        total = counts["created"] + counts["reused"]
+        counts["reuse_rate"] = round(counts["reused"] / total, 4) if total else None
+
+    return {
+        "result": sorted(rows.values(), key=lambda r: (r["exchange"], r["method"])),
+        "ws_bytes": ws_bytes,
+        "connections": connections,
+        "proxies": PROXY_POOL.report(),
+        "breakers": breaker_report(),
+        "cache": RESPONSE_CACHE.report(),
+        "hedging": hedge_report(),
+    }
+
+
+@router.get("/admin/upstream")
+async def get_upstream_stats():
+    """
+    上游交易所调用统计（JSON）
+    每行：调用次数、按异常类分组的错误数、耗时分位数、限速等待、响应字节数
+    connections：共享 HTTP 连接池按 host 的新建 / 复用连接数和复用率
+    proxies：代理出口健康状态，以及被哪些交易所限流冷却中
+    breakers：各 (交易所, 接口类别) 熔断器状态
+    cache：REST 行情服务端缓存按接口的条目数 / 字节数和新鲜期
+    hedging：对冲请求按 (交易所, 方法) 的当前对冲延迟和剩余名额
+    latency 包含 throttle；两者之差即代理 + 交易所的网络耗时
+    """
+    try:
+        report = await run_in_threadpool(build_upstream_report)
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": report,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+
+    except Exception as e:
+        logger.error(f"Admin upstream 异常: {str(e)}")
+        return {
+            "code": 5000,
+            "msg": str(e),
+            "data": None,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
@@ -1,69 +1,42 @@
 # routers/contracts.py
-import ccxt  # 同步版，直接受益于你的全局apply_global_ccxt_patch()
-import ccxt.pro as ccxt_pro
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
-from typing import Dict, List, Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException, Request, Response
+from typing import List, Optional
 import asyncio
+import json
 import logging
+import os
 from datetime import datetime
 
-router = APIRouter()
+from utils.contract_cache import (
+    CONTRACT_CACHE,
+    SORT_FIELDS,
+    SPECIAL_LOAD_PARAMS,
+    build_contract_table,
+    contract_client,
+    contract_markets,
+    load_contract_markets,
+)
+from utils.http_cache import CachePolicy, ConditionalCache
+from utils.json_response import FastJSONRoute
+from utils.logger import SampledLogger
+from utils.stream_hub import ConflatingQueue, HubError, get_ticker_hub
+
+router = APIRouter(route_class=FastJSONRoute)
 logger = logging.getLogger(__name__)
+# 原始 ticker 日志：每个 symbol 每 10 秒最多一条，且只在 DEBUG 级别输出
+_ticker_log = SampledLogger(logger, interval=10.0)
+# 单条推送异常：每个 symbol 每 10 秒最多一条
+_push_error_log = SampledLogger(logger, interval=10.0)
 
-# 预定义常用实例（缓存复用）
-SYNC_INSTANCE_CACHE: Dict[str, ccxt.Exchange] = {}
-
-
-def get_sync_exchange_instance(
-    exchange_name: str = "okx",
-    contract_type: str = "linear"  # linear (U本位) | inverse (币本位)
-) -> ccxt.Exchange:
-    """
-    支持客户端任意传入交易所名称（小写），自动创建ccxt实例
-    客户端示例：?exchange=bybit&type=linear
-              ?exchange=gate&type=inverse
-    """
-    key = f"{exchange_name}_{contract_type}"
-    if key in SYNC_INSTANCE_CACHE:
-        return SYNC_INSTANCE_CACHE[key]
-
-    config = {}  # 故意为空，依赖全局补丁注入代理/timeout/limit
-
-    # 特殊处理需要自定义urls或options的交易所
-    if exchange_name == "binance":
-        config["urls"] = {
-            "api": {
-                "fapi": "https://fapi.binance.com/fapi/v1",
-                "public": "https://fapi.binance.com/fapi/v1",
-                "private": "https://fapi.binance.com/fapi/v1",
-            }
-        }
-        config["options"] = {"defaultType": "future" if contract_type == "linear" else "delivery"}
-    elif exchange_name in ["bybit", "bitget"]:
-        config["options"] = {"defaultType": "swap" if contract_type == "linear" else "inverse"}
-    elif exchange_name in ["okx", "gate", "mexc", "kucoin", "huobi", "htx"]:
-        config["options"] = {"defaultType": "swap" if contract_type == "linear" else "inverse"}
-    else:
-        config["options"] = {"defaultType": "swap" if contract_type == "linear" else "inverse"}
-
-    # 动态创建实例
-    try:
-        exchange_class = getattr(ccxt, exchange_name)
-        ex = exchange_class(config)
-    except AttributeError:
-        raise ValueError(f"CCXT不支持的交易所名称: {exchange_name}（请检查拼写，小写）")
-
-    SYNC_INSTANCE_CACHE[key] = ex
-    return ex
-
-# 某些交易所 load_markets 需要额外参数，否则 WS 会歧义 / 报错
-SPECIAL_LOAD_PARAMS = {
-    "okx": {"type": "swap"},
-    # 如果以后发现其他交易所有类似问题，再加
-}
+# 合约列表含资金费率，短缓存即可
+CONTRACTS_CACHE = ConditionalCache(
+    "contracts_markets", CachePolicy(max_age=15, stale_while_revalidate=60)
+)
 
 @router.get("/contracts/markets")
-def get_contracts_markets(
+async def get_contracts_markets(
+    request: Request,
+    response: Response,
     exchange: str = Query("okx"),
     type: str = Query("linear"),
     page: int = Query(1, ge=1),
@@ -72,62 +45,32 @@ def get_contracts_markets(
     order: str = Query("asc")
 ):
     try:
-        ex = get_sync_exchange_instance(exchange, type)
-
-        ex.load_markets(params=SPECIAL_LOAD_PARAMS.get(exchange, {}))
-
-        # 1. 构建完整交易对列表
-        contracts = [m for m in ex.markets.values() if m.get("swap") and m.get("contract")]
-
-        result = [
-            {
-                "symbol": m["symbol"],
-                "base": m["base"],
-                "quote": m["quote"],
-                "linear": m.get("linear", False),
-                "inverse": m.get("inverse", False),
-                "maxLeverage": m.get("limits", {}).get("leverage", {}).get("max"),
-                "minLeverage": m.get("limits", {}).get("leverage", {}).get("min"),
-                "exchange": exchange,
-                # 预留资金费率字段
-                "fundingRate": -0,
-                "nextFundingTime": -0,
-            }
-            for m in contracts
-        ]
-
-        logger.info('🍌 market info: %s', contracts[0] if contracts else "无合约")
-
-        # 类型过滤 + 排序 + 分页（原有逻辑）
-        if type == "linear":
-            result = [r for r in result if r["linear"]]
-        elif type == "inverse":
-            result = [r for r in result if r["inverse"]]
-
+        # 条件请求：ETag 仍然新鲜时直接 304，不访问交易所
+        cache_key = f"{exchange}:{type}:{page}:{limit}:{sort}:{order}"
+        not_modified = CONTRACTS_CACHE.not_modified(request, cache_key)
+        if not_modified is not None:
+            return not_modified
+
+        # 池化的异步实例（交易所名称不支持时抛 ValueError）
+        ex = contract_client(exchange, type)
+
+        # 合约表（行情 + 资金费率 + 预排序索引）由后台轮询维护，请求路径不访问交易所
+        table = await CONTRACT_CACHE.get(exchange, type)
+        if table is None:
+            # 轮询还没拿到数据（或事件循环未绑定）：用共享市场缓存临时构建，只有占位值
+            await load_contract_markets(ex, type)
+            table = build_contract_table(exchange, contract_markets(ex.markets, type), {}, {})
+
+        # 排序 + 分页
         # 排序字段校验
-        allowed_sort = ["symbol", "volume_24h", "priceChange", "leverage", "fundingRate"]
-        sort = sort if sort in allowed_sort else "symbol"
+        sort = sort if sort in SORT_FIELDS else "symbol"
         reverse = order.lower() == "desc"
-        result.sort(key=lambda x: x.get(sort, 0) if sort != "symbol" else x["symbol"], reverse=reverse)
-
         start = (page - 1) * limit
-        paginated = result[start:start + limit]
-
-        # 2. 批量拉取资金费率（只对当前页的 symbol 拉取，节省请求）
-        symbols = [r["symbol"] for r in paginated]
-        if symbols:
-            try:
-                funding_data = ex.fetch_funding_rates(symbols)  # 批量获取
-                for r in paginated:
-                    funding = funding_data.get(r["symbol"], {})
-                    r["fundingRate"] = funding.get("fundingRate", -0)
-                    r["nextFundingTime"] = funding.get("nextFundingTime", -0) or funding.get("fundingTimestamp", -0)
-                logger.info(f"成功拉取 {len(symbols)} 个合约的资金费率")
-            except Exception as e:
-                logger.warning(f"拉取资金费率失败: {e}，字段保持默认值")
+        paginated = table.page(sort, reverse, start, limit)
+        total = table.total
 
         # 统一返回结构
-        return {
+        payload = {
             "code": 0,
             "msg": "success",
             "data": {
@@ -135,14 +78,16 @@ def get_contracts_markets(
                 "pagination": {
                     "page": page,
                     "limit": limit,
-                    "total": len(result),
-                    "total_pages": (len(result) + limit - 1) // limit,
+                    "total": total,
+                    "total_pages": (total + limit - 1) // limit,
                     "sort": sort,
                     "order": order
                 }
             },
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
+        CONTRACTS_CACHE.apply(response, cache_key, payload)
+        return payload
 
     except ValueError as e:
         logger.error(f"Contracts REST ValueError: {str(e)}")
@@ -171,156 +116,195 @@ DEFAULT_SYMBOLS_INVERSE = [
 ]
 
 
+# 单个连接最多订阅的合约数（上游订阅由 hub 共享，这里只限制单连接的推送量）
+MAX_WS_SYMBOLS = int(os.getenv("WS_CONTRACTS_MAX_SYMBOLS", "200"))
+
+
+def _ws_message(code: int, msg: str, data) -> dict:
+    return {
+        "code": code,
+        "msg": msg,
+        "data": data,
+        "ts": int(datetime.utcnow().timestamp() * 1000)
+    }
+
+
+def contract_ticker_payload(ex_name: str, symbol: str, ticker: dict) -> Optional[dict]:
+    """统一的合约 ticker 推送数据；价格无效时返回 None"""
+    data = {
+        "type": "ticker",
+        "exchange": ex_name,
+        "symbol": symbol,
+        "last": ticker.get("last") or ticker.get("lastPrice") or ticker.get("lastPx"),
+        "change": ticker.get("percentage") or ticker.get("price24hPcnt") or ticker.get("priceChangePercent"),
+        "volume_24h": ticker.get("baseVolume") or ticker.get("volume24h"),
+        "timestamp": ticker.get("timestamp") or ticker.get("ts"),
+        "fundingRate": ticker.get("fundingRate") or ticker.get("funding_rate")
+                       or ticker.get("info", {}).get("fundingRate") or -0,
+        "nextFundingTime": ticker.get("nextFundingTime") or ticker.get("fundingTime")
+                           or ticker.get("info", {}).get("nextFundingTime") or -0,
+        # 合并流（utils/stream_hub.py MergedPerpetualHub）从 mark price 一路补充
+        "markPrice": ticker.get("markPrice"),
+        "indexPrice": ticker.get("indexPrice"),
+        "openInterest": ticker.get("openInterest"),
+    }
+    if data["last"] is None or data["last"] <= 0:
+        return None
+    return data
+
+
+def _message_symbols(msg: dict) -> List[str]:
+    symbols = msg.get("symbols")
+    if isinstance(symbols, str):
+        symbols = symbols.split(",")
+    if not symbols and msg.get("symbol"):
+        symbols = [msg["symbol"]]
+    return [s.strip() for s in symbols or [] if isinstance(s, str) and s.strip()]
+
+
 @router.websocket("/ws/contracts")
 async def ws_dynamic_contracts(
     websocket: WebSocket,
     exchange: str = Query(..., description="任意ccxt.pro支持的小写交易所名，如 bybit、okx、gate、mexc..."),
     type: str = Query("linear", description="linear (U本位) | inverse (币本位)"),
-    symbols: str = Query(None, description="可选，逗号分隔的symbol列表，如 BTCUSDT,ETHUSDT（不传用保底）")
+    symbols: str = Query(None, description="可选，逗号分隔的初始symbol列表（不传用保底），连接后可发消息增减")
 ):
+    """
+    合约 ticker 推送，连接后可随时增减订阅：
+        {"action": "subscribe", "symbols": ["BTC/USDT:USDT", "ETH/USDT:USDT"]}
+        {"action": "unsubscribe", "symbols": ["ETH/USDT:USDT"]}
+        {"action": "ping"}
+    同一交易所 / 类型的所有连接共用一个上游实例，同一合约只有一个上游订阅（utils/stream_hub.py）
+    """
     await websocket.accept()
-    alive = asyncio.Event()
-    alive.set()
     logger.info(f"WS连接成功，交易所: {exchange}，类型: {type}")
 
-    # 动态创建实例
     try:
-        config = {
-            "options": {"defaultType": "swap" if type == "linear" else "inverse"},
-        }
-        exchange_class = getattr(ccxt_pro, exchange)
-        ex = exchange_class(config)
-    except AttributeError:
-        await websocket.send_json({
-            "code": 4001,
-            "msg": f"ccxt.pro不支持该交易所: {exchange}",
-            "data": None,
-            "ts": int(datetime.utcnow().timestamp() * 1000)
-        })
-        await websocket.close(code=1000)
-        return
-    except Exception as e:
-        await websocket.send_json({
-            "code": 5000,
-            "msg": f"创建实例失败: {str(e)}",
-            "data": None,
-            "ts": int(datetime.utcnow().timestamp() * 1000)
-        })
+        hub = get_ticker_hub(
+            exchange, "swap" if type == "linear" else "inverse", SPECIAL_LOAD_PARAMS.get(exchange)
+        )
+    except ValueError as e:
+        await websocket.send_json(_ws_message(4001, str(e), None))
         await websocket.close(code=1000)
         return
 
-    tasks = []
-    try:
-        # 尝试加载市场
-        try:
-            params = SPECIAL_LOAD_PARAMS.get(exchange, {})
-            await ex.load_markets(params=params)
-            logger.info(f"{exchange} markets加载成功")
-        except Exception as e:
-            logger.warning(f"{exchange} markets加载失败: {e}")
-
-        # symbol来源：客户端传 > 保底（区分类型）
-        if symbols:
-            target_symbols = [s.strip() for s in symbols.split(",")][:10]  # 最多 10 个，防滥用
-        else:
-            target_symbols = DEFAULT_SYMBOLS_LINEAR if type == "linear" else DEFAULT_SYMBOLS_INVERSE
+    queue = ConflatingQueue()
+    subscribed = set()
 
-        logger.info(f"{exchange} {type} 开始推送 {len(target_symbols)} 个合约: {target_symbols}")
+    def subscribe(requested: List[str]):
+        added, rejected = [], []
+        for symbol in requested:
+            if symbol in subscribed:
+                continue
+            if len(subscribed) >= MAX_WS_SYMBOLS:
+                rejected.append(symbol)
+                continue
+            subscribed.add(symbol)
+            hub.subscribe(symbol, queue)
+            added.append(symbol)
+        return added, rejected
+
+    def unsubscribe(requested: List[str]):
+        removed = [symbol for symbol in requested if symbol in subscribed]
+        for symbol in removed:
+            subscribed.discard(symbol)
+            hub.unsubscribe(symbol, queue)
+        return removed
+
+    # symbol来源：客户端传 > 保底（区分类型）
+    if symbols:
+        initial = [s.strip() for s in symbols.split(",") if s.strip()]
+    else:
+        initial = DEFAULT_SYMBOLS_LINEAR if type == "linear" else DEFAULT_SYMBOLS_INVERSE
+    subscribe(initial)
+    logger.info(f"{exchange} {type} 开始推送 {len(subscribed)} 个合约: {sorted(subscribed)}")
 
-        for symbol in target_symbols:
-            tasks.append(asyncio.create_task(ticker_task(ex, symbol, websocket, exchange, alive)))
+    sender = asyncio.create_task(push_contract_tickers(websocket, queue, subscribed, exchange))
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                await websocket.send_json(_ws_message(4000, "消息必须是 JSON", None))
+                continue
+            if not isinstance(msg, dict):
+                await websocket.send_json(_ws_message(4000, "消息必须是 JSON 对象", None))
+                continue
 
-        await asyncio.gather(*tasks, return_exceptions=True)
+            action = msg.get("action")
+            if action == "subscribe":
+                added, rejected = subscribe(_message_symbols(msg))
+                await websocket.send_json(_ws_message(0, "success", {"action": "subscribed", "symbols": added}))
+                if rejected:
+                    await websocket.send_json(_ws_message(
+                        4003,
+                        f"单个连接最多订阅 {MAX_WS_SYMBOLS} 个合约",
+                        {"action": "subscribe", "rejected": rejected},
+                    ))
+            elif action == "unsubscribe":
+                removed = unsubscribe(_message_symbols(msg))
+                await websocket.send_json(_ws_message(0, "success", {"action": "unsubscribed", "symbols": removed}))
+            elif action == "ping":
+                await websocket.send_json(_ws_message(0, "success", {"action": "pong"}))
+            else:
+                await websocket.send_json(_ws_message(4000, f"不支持的 action: {action}", None))
 
     except WebSocketDisconnect:
         logger.info("WS客户端正常断开")
     except Exception as e:
         logger.error(f"WS异常: {e}")
         try:
-            await websocket.send_json({
-                "code": 5000,
-                "msg": f"WS异常: {str(e)}",
-                "data": None,
-                "ts": int(datetime.utcnow().timestamp() * 1000)
-            })
+            await websocket.send_json(_ws_message(5000, f"WS异常: {str(e)}", None))
         except:
             pass
     finally:
-        alive.clear()
-        await asyncio.sleep(0.1)
-        for task in tasks:
-            task.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
-        await ex.close()
+        # 先同步退订，后面的 await 即使被取消也不会漏掉
+        sender.cancel()
+        unsubscribe(list(subscribed))
+        await asyncio.gather(sender, return_exceptions=True)
         logger.info("WS资源已清理")
 
 
-# ticker任务（保持原有异常处理风格，只加关闭检测 + 统一响应格式）
-async def ticker_task(
-    ex: ccxt_pro.Exchange,
-    symbol: str,
+# 推送任务：从 hub 的合并队列取最新 ticker 发给客户端（保持原有异常处理风格）
+async def push_contract_tickers(
     ws: WebSocket,
+    queue: ConflatingQueue,
+    subscribed: set,
     ex_name: str,
-    alive: asyncio.Event,
 ):
-    while alive.is_set():
-        try:
-            ticker = await ex.watch_ticker(symbol)
-            logger.info('🌹 ticker info: %s', ticker)
-
-            if not alive.is_set() or ws.client_state.name != "CONNECTED":
-                logger.debug(f"{ex_name} {symbol} WS已关闭，停止任务")
-                break
-
-            data = {
-                "type": "ticker",
-                "exchange": ex_name,
-                "symbol": symbol,
-                "last": ticker.get("last") or ticker.get("lastPrice") or ticker.get("lastPx"),
-                "change": ticker.get("percentage") or ticker.get("price24hPcnt") or ticker.get("priceChangePercent"),
-                "volume_24h": ticker.get("baseVolume") or ticker.get("volume24h"),
-                "timestamp": ticker.get("timestamp") or ticker.get("ts"),
-                "fundingRate": ticker.get("fundingRate") or ticker.get("funding_rate")
-                               or ticker.get("info", {}).get("fundingRate") or -0,
-                "nextFundingTime": ticker.get("nextFundingTime") or ticker.get("fundingTime")
-                                   or ticker.get("info", {}).get("nextFundingTime") or -0,
-            }
-
-            if data["last"] is None or data["last"] <= 0:
-                logger.warning(f"{ex_name} {symbol} 无效价格，跳过")
-                await asyncio.sleep(5)
-                continue
+    while True:
+        updates = await queue.get()
+        for symbol, ticker in updates.items():
+            try:
+                if isinstance(ticker, HubError):
+                    if ticker.fatal:
+                        # ❌ 不支持的 symbol —— 不可恢复，hub 已停止该订阅
+                        subscribed.discard(symbol)
+                        await ws.send_json(_ws_message(4002, f"symbol not supported: {symbol}", None))
+                    continue
+
+                _ticker_log.debug('🌹 ticker info: %s', ticker, key=(ex_name, symbol))
+                data = contract_ticker_payload(ex_name, symbol, ticker)
+                if data is None:
+                    logger.warning(f"{ex_name} {symbol} 无效价格，跳过")
+                    continue
+
+                # 统一 WS 推送格式
+                await ws.send_json(_ws_message(0, "success", data))
+
+            except WebSocketDisconnect:
+                logger.info(f"{ex_name} WS 客户端断开")
+                return
+
+            except RuntimeError as e:
+                # WS 已 close 再 send 会进这里
+                logger.info(f"{ex_name} WS 已关闭: {e}")
+                return
 
-            # 统一 WS 推送格式
-            await ws.send_json({
-                "code": 0,
-                "msg": "success",
-                "data": data,
-                "ts": ex.milliseconds()
-            })
-
-        except ccxt.BadSymbol as e:
-            # ❌ 不支持的 symbol —— 不可恢复
-            logger.warning(f"{ex_name} {symbol} 不存在: {e}")
-            if ws.client_state.name == "CONNECTED":
-                await ws.send_json({
-                    "code": 4002,
-                    "msg": f"symbol not supported: {symbol}",
-                    "data": None,
-                    "ts": ex.milliseconds()
-                })
-            break  # 直接结束这个 symbol 的 task
-
-        except WebSocketDisconnect:
-            logger.info(f"{ex_name} {symbol} WS 客户端断开")
-            break
-
-        except RuntimeError as e:
-            # WS 已 close 再 send 会进这里
-            logger.info(f"{ex_name} {symbol} WS 已关闭: {e}")
-            break
-
-        except Exception as e:
-            # ✅ 网络抖动、临时错误，允许 retry
-            logger.warning(f"{ex_name} {symbol} ticker 临时异常: {type(e).__name__}: {e}")
-            await asyncio.sleep(5)
\ No newline at end of file
+            except Exception as e:
+                # 单条数据异常（字段类型不对、无法编码等）只跳过这一条，推送任务不能就此结束
+                _push_error_log.warning(
+                    "%s %s ticker 推送失败，跳过: %s: %s", ex_name, symbol, type(e).__name__, e,
+                    key=(ex_name, symbol),
+                )
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Response
+from datetime import datetime
+
+from utils.json_response import FastJSONRoute
+from utils.warmup import WARMUP
+
+router = APIRouter(route_class=FastJSONRoute)
+
+
+@router.get("/ready", include_in_schema=False)
+async def get_ready(response: Response):
+    """
+    就绪探针（负载均衡用）：启动预热（utils/warmup.py）结束前返回 503，之后返回 200
+    data 为预热报告：每个步骤的结果和耗时
+    """
+    report = WARMUP.report()
+    if not report["ready"]:
+        response.status_code = 503
+        return {
+            "code": 5003,
+            "msg": "warming up",
+            "data": report,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+    return {
+        "code": 0,
+        "msg": "success",
+        "data": report,
+        "ts": int(datetime.utcnow().timestamp() * 1000)
+    }
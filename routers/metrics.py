@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Response
+from starlette.concurrency import run_in_threadpool
+
+from utils.metrics import REGISTRY
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus 抓取接口
+    合并分片 + 渲染文本放到线程池执行，指标再多也不阻塞事件循环
+    """
+    body = await run_in_threadpool(REGISTRY.render)
+    return Response(content=body, media_type=PROMETHEUS_CONTENT_TYPE)
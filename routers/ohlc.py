@@ -1,16 +1,31 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request, Response
 import ccxt.async_support as ccxt_async  # 注意：异步版本
 import asyncio
 import logging
 from datetime import datetime  # 用于 fallback ts
 
+from utils.circuit_breaker import LAST_GOOD, stale_response
+from utils.exchange_manager import load_rest_markets
+from utils.http_cache import CachePolicy, ConditionalCache
+from utils.json_response import FastJSONRoute
+from utils.response_cache import RESPONSE_CACHE
+
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# 含未收盘 K 线：最后一根随成交实时变化，只做短缓存
+OPEN_CANDLE_POLICY = CachePolicy(max_age=5, stale_while_revalidate=30)
+# 全部已收盘：历史 K 线不会再变化，可长期缓存
+CLOSED_CANDLE_POLICY = CachePolicy(max_age=86400, stale_while_revalidate=86400)
+
+OHLC_CACHE = ConditionalCache("ohlc", OPEN_CANDLE_POLICY)
 
 
 @router.get("/ohlc")
 async def get_pair_ohlc(
+    request: Request,
+    response: Response,
     exchange: str = Query("binance", example="binance"),
     symbol: str = Query("BTC/USDT", example="BTC/USDT"),
     periods: str = Query(
@@ -24,11 +39,16 @@ async def get_pair_ohlc(
     使用 ccxt.async_support，避免阻塞事件循环
     返回统一结构：{"code": 0, "msg": "success", "data": {"result": {...}}, "ts": ...}
     """
-    try:
-        exchange_id = exchange.lower().strip()
+    exchange_id = exchange.lower().strip()
+    cache_key = f"{exchange_id}:{symbol}:{periods}:{after}:{before}"
+
+    async def fetch_ohlc():
+        """访问交易所；缓存后台刷新时也会调用，实例在这里创建和关闭"""
         ex_class = getattr(ccxt_async, exchange_id)
 
         async with ex_class({'enableRateLimit': True}) as ex:  # 加限速，推荐
+            # fetch_ohlcv 内部会 load_markets，先从共享市场缓存取
+            await load_rest_markets(ex)
             period_list = [p.strip() for p in periods.split(",") if p.strip()]
 
             timeframe_map = {
@@ -75,17 +95,53 @@ async def get_pair_ohlc(
                     for candle in ohlcv
                 ]
 
-            # 统一返回结构
-            return {
-                "code": 0,
-                "msg": "success",
-                "data": {
-                    "result": result,
-                    "symbol": symbol,
-                    "exchange": exchange_id,
-                },
-                "ts": int(ex.milliseconds())
+            # 数据版本：每个周期的 K 线数量 + 最后一根 K 线
+            # 所有周期的最后一根都已收盘时，整份数据不会再变化
+            now_sec = int(ex.milliseconds() / 1000)
+            all_closed = True
+            version = []
+            for period, candles in result.items():
+                last = candles[-1] if candles else None
+                version.append((period, len(candles), last))
+                period_sec = ex.parse_timeframe(timeframe_map.get(period, "1h"))
+                if last is not None and last[0] + period_sec > now_sec:
+                    all_closed = False
+
+            data = {
+                "result": result,
+                "symbol": symbol,
+                "exchange": exchange_id,
             }
+            LAST_GOOD.remember("ohlc", cache_key, data)
+            return data, version, all_closed
+
+    try:
+        # 条件请求：ETag 仍然新鲜时直接 304，不访问交易所
+        not_modified = OHLC_CACHE.not_modified(request, cache_key)
+        if not_modified is not None:
+            return not_modified
+
+        # 服务端缓存：新鲜期内直接返回，过期后先返回旧数据并在后台刷新（utils/response_cache.py）
+        (data, version, all_closed), cache_outcome = await RESPONSE_CACHE.get("ohlc", cache_key, fetch_ohlc)
+        response.headers["X-Cache"] = cache_outcome
+        if cache_outcome == "stale":
+            data = RESPONSE_CACHE.mark_stale("ohlc", cache_key, data)
+
+        OHLC_CACHE.apply(
+            response,
+            cache_key,
+            version=version,
+            # 带 stale 标记的响应不按已收盘 K 线长期缓存
+            policy=CLOSED_CANDLE_POLICY if all_closed and cache_outcome != "stale" else OPEN_CANDLE_POLICY,
+        )
+
+        # 统一返回结构
+        return {
+            "code": 0,
+            "msg": "success",
+            "data": data,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
 
     except AttributeError:
         logger.error(f"OHLC REST AttributeError: 不支持的交易所 '{exchange}'")
@@ -105,6 +161,19 @@ async def get_pair_ohlc(
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
+    except ccxt_async.NetworkError as e:
+        # 超时 / 连接失败 / 熔断中：有旧数据就先返回旧数据
+        stale = stale_response("ohlc", cache_key, e)
+        if stale is not None:
+            return stale
+        logger.error(f"OHLC REST NetworkError: {str(e)}")
+        return {
+            "code": 5001,
+            "msg": f"网络错误: {str(e)}",
+            "data": None,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+
     except ccxt_async.ExchangeError as e:
         logger.error(f"OHLC REST ExchangeError: {str(e)}")
         return {
@@ -1,15 +1,23 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
+from starlette.concurrency import run_in_threadpool
 import ccxt
 import logging
 from datetime import datetime  # 用于 fallback ts
 
+from utils.circuit_breaker import LAST_GOOD, stale_response
+from utils.hedging import hedge_instance, hedged
+from utils.json_response import FastJSONRoute
+from utils.market_bus import MODE_BUS, market_data_mode, shared_orderbook_snapshot
+from utils.response_cache import RESPONSE_CACHE
+
 logger = logging.getLogger(__name__)
 
-router = APIRouter()  # 创建路由器
+router = APIRouter(route_class=FastJSONRoute)  # 创建路由器
 
 
 @router.get("/orderbook")
 async def get_order_book(
+    response: Response,
     exchange: str = Query(
         "binance",
         description="交易所名称（小写），如 binance, okx, bybit, gate, kraken",
@@ -26,12 +34,26 @@ async def get_order_book(
         example=100,
     ),
 ):
-    try:
-        exchange = exchange.lower().strip()
+    exchange = exchange.lower().strip()
+    # 服务端缓存 key，也是上游不可用时兜底旧数据的 key
+    stale_key = (exchange, symbol, limit)
+
+    async def fetch_order_book():
         ex_class = getattr(ccxt, exchange)
-        ex = ex_class({"enableRateLimit": True})  # 建议加限速，避免被 ban
+        # 同步 ccxt 的实例构造和请求都放到线程池执行，缓存后台刷新时也不阻塞事件循环
+        ex = await run_in_threadpool(ex_class, {"enableRateLimit": True})  # 建议加限速，避免被 ban
+
+        def fetch_hedge_sync(route):
+            hedge_ex = hedge_instance(ex_class, route, primary=ex)
+            return hedge_ex.fetch_order_book(symbol, limit=limit)
 
-        orderbook = ex.fetch_order_book(symbol, limit=limit)
+        # 开启对冲（utils/hedging.py）时慢请求经另一个出口再发一次
+        orderbook = await hedged(
+            ex,
+            "fetch_order_book",
+            lambda: run_in_threadpool(ex.fetch_order_book, symbol, limit=limit),
+            lambda route: run_in_threadpool(fetch_hedge_sync, route),
+        )
 
         logger.info("🌈 orderbook query params: %s %s %s", exchange, symbol, limit)
 
@@ -52,13 +74,42 @@ async def get_order_book(
             "action": "fetch",
             "marketType": "",
         }
+        LAST_GOOD.remember("orderbook", stale_key, data)
+        return data
+
+    try:
+        # 总线模式：优先读 ingest 写入共享内存的盘口（全机一份），没有或过旧再走 REST
+        if market_data_mode() == MODE_BUS:
+            book = shared_orderbook_snapshot(exchange, symbol, limit)
+            if book is not None:
+                return {
+                    "code": 0,
+                    "msg": "success",
+                    "data": {
+                        "asks": book["asks"],
+                        "bids": book["bids"],
+                        "nonce": book["nonce"],
+                        "timestamp": book["timestamp"] or book["writtenAt"],
+                        "symbol": symbol,
+                        "exchange": exchange,
+                        "action": "fetch",
+                        "marketType": "",
+                    },
+                    "ts": int(datetime.utcnow().timestamp() * 1000),
+                }
+
+        # 服务端缓存：新鲜期内直接返回，过期后先返回旧数据并在后台刷新（utils/response_cache.py）
+        data, cache_outcome = await RESPONSE_CACHE.get("orderbook", stale_key, fetch_order_book)
+        response.headers["X-Cache"] = cache_outcome
+        if cache_outcome == "stale":
+            data = RESPONSE_CACHE.mark_stale("orderbook", stale_key, data)
 
         # 统一返回结构
         return {
             "code": 0,
             "msg": "success",
             "data": data,
-            "ts": int(ex.milliseconds()),  # 或用 datetime.utcnow().timestamp() * 1000
+            "ts": int(datetime.utcnow().timestamp() * 1000),
         }
 
     except AttributeError:
@@ -78,6 +129,10 @@ async def get_order_book(
         }
 
     except ccxt.NetworkError as e:
+        # 超时 / 连接失败 / 熔断中：有旧数据就先返回旧数据
+        stale = stale_response("orderbook", stale_key, e)
+        if stale is not None:
+            return stale
         return {
             "code": 5001,
             "msg": f"网络错误: {str(e)}",
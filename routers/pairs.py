@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request, Response
 import ccxt.async_support as ccxt_async  # 使用异步版本
 import logging
 from datetime import datetime  # 用于 fallback ts
 
+from utils.circuit_breaker import LAST_GOOD, stale_response
+from utils.exchange_manager import load_rest_markets
+from utils.http_cache import CachePolicy, ConditionalCache
+from utils.json_response import FastJSONRoute
+from utils.response_cache import RESPONSE_CACHE
+
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# 交易对列表变化很慢：1 分钟内视为新鲜，之后 5 分钟内允许先用旧数据
+PAIRS_CACHE = ConditionalCache("pairs", CachePolicy(max_age=60, stale_while_revalidate=300))
 
 # 定义主流币基础报价货币（优先排前）
 MAJOR_BASES = {
@@ -15,6 +24,8 @@ MAJOR_BASES = {
 
 @router.get("/pairs")
 async def get_pairs(
+    request: Request,
+    response: Response,
     exchange: str = Query(
         "binance",
         description="交易所名称（小写），如 binance, okx, bybit, gate, kraken",
@@ -28,16 +39,19 @@ async def get_pairs(
     page: int = Query(1, ge=1, description="页码（仅单组模式有效）"),
     page_size: int = Query(100, ge=1, le=500, description="每页数量（仅单组模式有效）"),
 ):
-    try:
-        exchange_id = exchange.lower().strip()
+    exchange_id = exchange.lower().strip()
+    cache_key = f"{exchange_id}:{market}:{page}:{page_size}"
+
+    async def fetch_pairs():
+        """访问交易所；缓存后台刷新时也会调用，实例在这里创建和关闭"""
         ex_class = getattr(ccxt_async, exchange_id)
         if not ex_class:
             raise AttributeError(f"不支持的交易所: '{exchange}'")
 
         # 使用 async with 管理异步实例，自动关闭连接
         async with ex_class({'enableRateLimit': True}) as ex:
-            # 异步加载市场信息
-            await ex.load_markets()
+            # 异步加载市场信息（共享市场缓存）
+            await load_rest_markets(ex)
 
             # 尝试异步获取 tickers 用于交易量排序（很多交易所支持）
             try:
@@ -142,18 +156,36 @@ async def get_pairs(
                     "mode": mode,
                 }
 
-            # 统一返回结构
-            return {
-                "code": 0,
-                "msg": "success",
-                "data": {
-                    "result": result,
-                    "exchange": exchange_id,
-                    "total": total,
-                    **extra
-                },
-                "ts": int(ex.milliseconds())
+            data = {
+                "result": result,
+                "exchange": exchange_id,
+                "total": total,
+                **extra
             }
+            LAST_GOOD.remember("pairs", cache_key, data)
+            return data
+
+    try:
+        # 条件请求：ETag 仍然新鲜时直接 304，不访问交易所
+        not_modified = PAIRS_CACHE.not_modified(request, cache_key)
+        if not_modified is not None:
+            return not_modified
+
+        # 服务端缓存：新鲜期内直接返回，过期后先返回旧数据并在后台刷新（utils/response_cache.py）
+        data, cache_outcome = await RESPONSE_CACHE.get("pairs", cache_key, fetch_pairs)
+        response.headers["X-Cache"] = cache_outcome
+        if cache_outcome == "stale":
+            data = RESPONSE_CACHE.mark_stale("pairs", cache_key, data)
+
+        # 统一返回结构
+        payload = {
+            "code": 0,
+            "msg": "success",
+            "data": data,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+        PAIRS_CACHE.apply(response, cache_key, payload)
+        return payload
 
     except AttributeError as e:
         logger.error(f"Pairs REST AttributeError: {str(e)}")
@@ -164,7 +196,7 @@ async def get_pairs(
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
-    except ccxt.BadSymbol as e:
+    except ccxt_async.BadSymbol as e:
         logger.error(f"Pairs REST BadSymbol: {str(e)}")
         return {
             "code": 4002,
@@ -173,6 +205,19 @@ async def get_pairs(
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
+    except ccxt_async.NetworkError as e:
+        # 超时 / 连接失败 / 熔断中：有旧数据就先返回旧数据
+        stale = stale_response("pairs", cache_key, e)
+        if stale is not None:
+            return stale
+        logger.error(f"Pairs REST NetworkError: {str(e)}")
+        return {
+            "code": 5001,
+            "msg": f"网络错误: {str(e)}",
+            "data": None,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+
     except Exception as e:
         logger.error(f"Pairs REST 异常: {str(e)}")
         return {
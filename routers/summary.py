@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 import ccxt.async_support as ccxt_async  # ← 异步版
 import asyncio
 import logging
 from datetime import datetime  # 用于 fallback ts
 
+from utils.circuit_breaker import LAST_GOOD, stale_response
+from utils.exchange_manager import load_rest_markets
+from utils.json_response import FastJSONRoute
+from utils.response_cache import RESPONSE_CACHE
+
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.get("/summary")
 async def get_pair_summary(
+    response: Response,
     exchange: str = Query(
         "binance",
         description="交易所名称（小写），如 binance, okx, bybit, gate, kraken",
@@ -29,60 +35,74 @@ async def get_pair_summary(
     """
     exchange = exchange.lower().strip()
     symbol = symbol.upper().strip()
-    ex: ccxt_async.Exchange | None = None
+    # 服务端缓存 key，也是上游不可用时兜底旧数据的 key
+    stale_key = (exchange, symbol)
 
-    try:
+    async def fetch_summary():
+        """访问交易所；缓存后台刷新时也会调用，实例在这里创建和关闭"""
         ex_class = getattr(ccxt_async, exchange, None)
         if not ex_class:
             raise AttributeError(f"不支持的交易所: '{exchange}'")
 
         ex = ex_class({'enableRateLimit': True})  # 建议加限速
-
-        # 异步加载市场数据（关键！避免 symbol 映射错误）
-        await ex.load_markets()
-
-        if symbol not in ex.markets:
-            raise ccxt_async.BadSymbol(f"无效的交易对: '{symbol}' 在 {exchange} 不存在或未激活")
-
-        market = ex.markets[symbol]
-        standardized_symbol = market["symbol"]
-
-        # 异步获取 ticker
-        ticker = await ex.fetch_ticker(standardized_symbol)
-
-        # 可选：校验返回的 symbol 是否匹配（防御性编程）
-        returned_symbol = ticker.get("symbol")
-        if returned_symbol and returned_symbol != standardized_symbol:
-            logger.warning(
-                "[WARNING] %s ticker symbol 不匹配: 请求 %s, 返回 %s",
-                exchange, standardized_symbol, returned_symbol
-            )
-
-        result = {
-            "symbol": standardized_symbol,
-            "price": {
-                "last": ticker.get("last"),
-                "high": ticker.get("high"),
-                "low": ticker.get("low"),
-                "change": {
-                    "percentage": ticker.get("percentage"),
-                    "absolute": ticker.get("change"),
+        try:
+            # 异步加载市场数据（关键！避免 symbol 映射错误；走共享市场缓存）
+            await load_rest_markets(ex)
+
+            if symbol not in ex.markets:
+                raise ccxt_async.BadSymbol(f"无效的交易对: '{symbol}' 在 {exchange} 不存在或未激活")
+
+            market = ex.markets[symbol]
+            standardized_symbol = market["symbol"]
+
+            # 异步获取 ticker
+            ticker = await ex.fetch_ticker(standardized_symbol)
+
+            # 可选：校验返回的 symbol 是否匹配（防御性编程）
+            returned_symbol = ticker.get("symbol")
+            if returned_symbol and returned_symbol != standardized_symbol:
+                logger.warning(
+                    "[WARNING] %s ticker symbol 不匹配: 请求 %s, 返回 %s",
+                    exchange, standardized_symbol, returned_symbol
+                )
+
+            result = {
+                "symbol": standardized_symbol,
+                "price": {
+                    "last": ticker.get("last"),
+                    "high": ticker.get("high"),
+                    "low": ticker.get("low"),
+                    "change": {
+                        "percentage": ticker.get("percentage"),
+                        "absolute": ticker.get("change"),
+                    },
                 },
-            },
-            "volume": ticker.get("baseVolume") or ticker.get("volume") or 0.0,
-            "volumeQuote": ticker.get("quoteVolume") or 0.0,
-            "timestamp": ticker.get("timestamp")
-                         or int(asyncio.get_event_loop().time() * 1000),
-        }
+                "volume": ticker.get("baseVolume") or ticker.get("volume") or 0.0,
+                "volumeQuote": ticker.get("quoteVolume") or 0.0,
+                "timestamp": ticker.get("timestamp")
+                             or int(asyncio.get_event_loop().time() * 1000),
+            }
+
+            data = {"result": result}
+            LAST_GOOD.remember("summary", stale_key, data)
+            return data
+        finally:
+            # 【重要】异步版本必须关闭连接，防止连接泄漏
+            await ex.close()
+
+    try:
+        # 服务端缓存：新鲜期内直接返回，过期后先返回旧数据并在后台刷新（utils/response_cache.py）
+        data, cache_outcome = await RESPONSE_CACHE.get("summary", stale_key, fetch_summary)
+        response.headers["X-Cache"] = cache_outcome
+        if cache_outcome == "stale":
+            data = RESPONSE_CACHE.mark_stale("summary", stale_key, data)
 
         # 统一返回结构
         return {
             "code": 0,
             "msg": "success",
-            "data": {
-                "result": result
-            },
-            "ts": int(ex.milliseconds())
+            "data": data,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
     except AttributeError as e:
@@ -103,6 +123,19 @@ async def get_pair_summary(
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
+    except ccxt_async.NetworkError as e:
+        # 超时 / 连接失败 / 熔断中：有旧数据就先返回旧数据
+        stale = stale_response("summary", stale_key, e)
+        if stale is not None:
+            return stale
+        logger.error(f"Summary REST NetworkError: {str(e)}")
+        return {
+            "code": 5001,
+            "msg": f"网络错误: {str(e)}",
+            "data": None,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+
     except ccxt_async.ExchangeError as e:
         logger.error(f"Summary REST ExchangeError: {str(e)}")
         return {
@@ -120,8 +153,3 @@ async def get_pair_summary(
             "data": None,
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
-
-    finally:
-        # 【重要】异步版本必须关闭连接，防止连接泄漏
-        if ex is not None:
-            await ex.close()
\ No newline at end of file
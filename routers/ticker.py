@@ -5,9 +5,14 @@ from typing import Dict, Any
 import logging
 from datetime import datetime  # 用于 fallback ts
 
+from utils.circuit_breaker import LAST_GOOD, stale_response
+from utils.exchange_manager import load_rest_markets
+from utils.hedging import hedge_instance, hedged
+from utils.json_response import FastJSONRoute
+
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
 
 
 @router.get("/ticker")
@@ -38,6 +43,8 @@ async def get_pair_ticker(
     symbol = symbol.upper().strip()
     market_type = market_type.lower().strip()
     ex: ccxt_async.Exchange | None = None
+    # 上游不可用时兜底的旧数据 key
+    stale_key = (exchange, symbol, market_type)
 
     try:
         # 获取交易所类
@@ -52,8 +59,8 @@ async def get_pair_ticker(
         }
         ex = ex_class(config)
 
-        # 异步加载市场
-        await ex.load_markets()
+        # 异步加载市场（共享市场缓存，预热后不再访问交易所）
+        await load_rest_markets(ex, market_type)
 
         # 标准化 symbol（防御性）
         if symbol not in ex.markets:
@@ -62,8 +69,15 @@ async def get_pair_ticker(
         market = ex.markets[symbol]
         standardized_symbol = market["symbol"]
 
-        # 获取 ticker（异步）
-        ticker_raw = await ex.fetch_ticker(standardized_symbol)
+        async def fetch_hedge(route):
+            hedge_ex = hedge_instance(ex_class, route, primary=ex, config=config)
+            try:
+                return await hedge_ex.fetch_ticker(standardized_symbol)
+            finally:
+                await hedge_ex.close()
+
+        # 获取 ticker（异步）；开启对冲（utils/hedging.py）时慢请求经另一个出口再发一次
+        ticker_raw = await hedged(ex, "fetch_ticker", lambda: ex.fetch_ticker(standardized_symbol), fetch_hedge)
 
         # 根据 market_type 构建不同的 Ticker 数据（核心逻辑不变）
         ticker_data: Dict[str, Any] = {
@@ -121,13 +135,14 @@ async def get_pair_ticker(
             "timestamp": ticker_data["timestamp"],
         }
 
+        data = {"result": result}
+        LAST_GOOD.remember("ticker", stale_key, data)
+
         # 统一返回结构
         return {
             "code": 0,
             "msg": "success",
-            "data": {
-                "result": result
-            },
+            "data": data,
             "ts": int(ex.milliseconds())
         }
 
@@ -149,6 +164,19 @@ async def get_pair_ticker(
             "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
+    except ccxt_async.NetworkError as e:
+        # 超时 / 连接失败 / 熔断中：有旧数据就先返回旧数据
+        stale = stale_response("ticker", stale_key, e)
+        if stale is not None:
+            return stale
+        logger.error(f"Ticker REST NetworkError: {str(e)}")
+        return {
+            "code": 5001,
+            "msg": f"网络错误: {str(e)}",
+            "data": None,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
+        }
+
     except ccxt_async.ExchangeError as e:
         logger.error(f"Ticker REST ExchangeError: {str(e)}")
         return {
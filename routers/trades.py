@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
+from starlette.concurrency import run_in_threadpool
 import ccxt
 import logging
 from datetime import datetime  # 用于 fallback ts
 
+from utils.circuit_breaker import LAST_GOOD, stale_response
+from utils.json_response import FastJSONRoute
+from utils.response_cache import RESPONSE_CACHE
+
 logger = logging.getLogger(__name__)
 
-router = APIRouter()  # 创建路由器
+router = APIRouter(route_class=FastJSONRoute)  # 创建路由器
 
 
 @router.get("/trades")
 async def get_trades(
+    response: Response,
     exchange: str = Query(
         "binance",
         description="交易所名称（小写），如 binance, okx, bybit, gate, kraken",
@@ -30,8 +36,11 @@ async def get_trades(
     完全兼容旧 CryptoWatch 的 /markets/{exchange}/{pair}/trades 接口
     返回统一结构：{"code": 0, "msg": "success", "data": {"result": [[...], ...]}, "ts": ...}
     """
-    try:
-        exchange = exchange.lower().strip()
+    exchange = exchange.lower().strip()
+    # 服务端缓存 key，也是上游不可用时兜底旧数据的 key
+    stale_key = (exchange, symbol, limit)
+
+    def fetch_trades_sync():
         ex_class = getattr(ccxt, exchange)
         ex = ex_class({'enableRateLimit': True})  # 建议加限速，避免被 ban
 
@@ -52,15 +61,30 @@ async def get_trades(
 
         logger.info("🌈 trades query params: %s %s %s (fetched %d trades)", exchange, symbol, limit, len(trades))
 
+        data = {
+            "result": result,
+            "symbol": symbol,  # 可选加回，便于客户端确认
+        }
+        LAST_GOOD.remember("trades", stale_key, data)
+        return data
+
+    async def fetch_trades():
+        """同步 ccxt 放到线程池执行，缓存后台刷新时也不阻塞事件循环"""
+        return await run_in_threadpool(fetch_trades_sync)
+
+    try:
+        # 服务端缓存：新鲜期内直接返回，过期后先返回旧数据并在后台刷新（utils/response_cache.py）
+        data, cache_outcome = await RESPONSE_CACHE.get("trades", stale_key, fetch_trades)
+        response.headers["X-Cache"] = cache_outcome
+        if cache_outcome == "stale":
+            data = RESPONSE_CACHE.mark_stale("trades", stale_key, data)
+
         # 统一返回结构
         return {
             "code": 0,
             "msg": "success",
-            "data": {
-                "result": result,
-                "symbol": symbol,  # 可选加回，便于客户端确认
-            },
-            "ts": int(ex.milliseconds())
+            "data": data,
+            "ts": int(datetime.utcnow().timestamp() * 1000)
         }
 
     except AttributeError:
@@ -80,6 +104,10 @@ async def get_trades(
         }
 
     except ccxt.NetworkError as e:
+        # 超时 / 连接失败 / 熔断中：有旧数据就先返回旧数据
+        stale = stale_response("trades", stale_key, e)
+        if stale is not None:
+            return stale
         return {
             "code": 5001,
             "msg": f"网络错误: {str(e)}",
@@ -6,6 +6,8 @@ from fastapi import WebSocket, WebSocketDisconnect
 import ccxt.pro as ccxt_pro
 import logging
 
+from utils.market_bus import create_stream_exchange
+
 logger = logging.getLogger(__name__)
 
 # ----------------------- 配置常量（全局可调） -----------------------
@@ -13,9 +15,6 @@ SUBSCRIBE_DEPTH = 50  # 向交易所订阅的深度（top N levels），建议 5
 CLIENT_DEPTH = 20  # 最终推送给客户端的最新档位数（首页推荐 10~30）
 PUSH_INTERVAL = 1.0  # 推送间隔（秒），全量快照推送频率，0.2~1.0 之间平衡延迟与流量
 
-# 缓存：{exchange:market_type:symbol → orderbook dict}
-orderbook_cache: Dict[str, dict] = {}
-
 
 async def watch_orderbook_task(
     ex: ccxt_pro.Exchange,
@@ -25,8 +24,6 @@ async def watch_orderbook_task(
     exchange_id: str,
 ):
     """单个 symbol 的 orderbook 监听任务"""
-    cache_key = f"{exchange_id}:{market_type}:{symbol}"
-
     while True:
         try:
             # 这里会读取当前的 ex.options["defaultType"]
@@ -41,9 +38,6 @@ async def watch_orderbook_task(
                 "nonce": ob.get("nonce") or 0,
             }
 
-            # 更新缓存
-            orderbook_cache[cache_key] = processed_ob
-
             # 统一响应结构 - orderbook_update
             await websocket.send_json(
                 {
@@ -99,15 +93,18 @@ async def websocket_orderbook(websocket: WebSocket, exchange: str = "binance"):
     logger.info(f"New orderbook WS connection: {exchange}")
 
     try:
-        # 获取 ccxt.pro 实例（已打过代理补丁）
-        ex = getattr(ccxt_pro, exchange)(
+        # 获取 ccxt.pro 实例（已打过代理补丁）；总线模式下返回 ingest 进程的代理
+        ex = create_stream_exchange(
+            exchange,
             {
                 "enableRateLimit": True,
                 "options": {
                     "defaultType": "spot",  # 初始默认 spot
                 },
-            }
+            },
         )
+        if ex is None:
+            raise ValueError(f"不支持的交易所: {exchange}")
 
         # 该连接下的所有监听任务 {task_key: task}
         active_tasks: Dict[str, asyncio.Task] = {}
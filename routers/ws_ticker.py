@@ -1,10 +1,20 @@
 import asyncio
 import json
 import logging
-import ccxt.pro as ccxt_pro
+import time
 from fastapi import WebSocket, WebSocketDisconnect, Query
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from utils.logger import LazyPretty, SampledLogger
+from utils.stream_hub import ConflatingQueue, HubError, TickerHub, get_ticker_hub
+
 logger = logging.getLogger(__name__)
+# 推送日志：每个 symbol 每 5 秒最多一条，完整 payload 只在 DEBUG 级别输出
+_push_log = SampledLogger(logger, interval=5.0)
+_push_payload_log = SampledLogger(logger, interval=5.0)
+# 允许订阅的 marketType（与 REST /api/ticker 一致，另含 ccxt 的 swap / future）；
+# 每个 (交易所, marketType) 对应一个共享 hub 和上游实例，不能由客户端任意创建
+MARKET_TYPES = ("spot", "perpetual", "delivery", "option", "margin", "swap", "future")
 def to_float(v):
     if v is None:
         return None
@@ -29,17 +39,6 @@ def to_int(v):
         except ValueError:
             return None
     return None
-# 全局交易所缓存 (ccxt.pro 实例)
-exchanges: Dict[str, ccxt_pro.Exchange] = {}
-async def get_exchange_pro(exchange_name: str) -> ccxt_pro.Exchange:
-    exchange_name = exchange_name.lower().strip()
-    if exchange_name not in exchanges:
-        ex_class = getattr(ccxt_pro, exchange_name, None)
-        if not ex_class:
-            raise ValueError(f"不支持的交易所: {exchange_name}")
-        # 实例化时补丁会自动注入代理和 defaultType
-        exchanges[exchange_name] = ex_class()
-    return exchanges[exchange_name]
 def has_meaningful_change(old: Dict, new: Dict, price_threshold: float = 1e-8, pct_threshold: float = 0.01) -> bool:
     """对比价格和涨跌幅是否有意义的变动"""
     old_last = old.get("last")
@@ -52,128 +51,173 @@ def has_meaningful_change(old: Dict, new: Dict, price_threshold: float = 1e-8, p
     if old_pct is not None and new_pct is not None:
         if abs(new_pct - old_pct) > pct_threshold:
             return True
+    # 合约：标记价按价格阈值比较，资金费率有变化就推
+    old_mark = old.get("markPrice")
+    new_mark = new.get("markPrice")
+    if old_mark and new_mark:
+        if abs(new_mark - old_mark) / abs(old_mark) > price_threshold:
+            return True
+    if old.get("fundingRate") != new.get("fundingRate"):
+        return True
     return False
-async def watch_ticker_task(
-    exchange: ccxt_pro.Exchange,
-    symbol: str,
-    market_type: str,
-    websocket: WebSocket
+def build_ticker_payload(symbol: str, market_type: str, ticker_raw: Dict[str, Any]) -> Dict[str, Any]:
+    """统一构建推送数据结构（兼容你的 freezed TickerModel），支持多市场类型"""
+    info = ticker_raw.get("info", {})
+    current_payload: Dict[str, Any] = {
+        "symbol": symbol,
+        "marketType": market_type,
+        "last": ticker_raw.get("last"),
+        "open": ticker_raw.get("open"),
+        "high": ticker_raw.get("high"),
+        "low": ticker_raw.get("low"),
+        "bid": ticker_raw.get("bid"),
+        "ask": ticker_raw.get("ask"),
+        "change": ticker_raw.get("change"),
+        "percentage": ticker_raw.get("percentage"),
+        "baseVolume": ticker_raw.get("baseVolume") or 0.0,
+        "quoteVolume": ticker_raw.get("quoteVolume") or 0.0,
+        "timestamp": ticker_raw.get("timestamp") or int(time.time() * 1000),
+        "vwap": ticker_raw.get("vwap"),
+        "info": info,
+    }
+    # 补充市场类型专有字段
+    if market_type in ["perpetual", "delivery", "swap", "future"]:
+        current_payload.update({
+            "markPrice": to_float(
+                ticker_raw.get("markPrice") or info.get("markPrice") or info.get("mark_price")
+            ),
+            "indexPrice": to_float(
+                ticker_raw.get("indexPrice") or info.get("indexPrice") or info.get("index_price")
+            ),
+            "fundingRate": to_float(
+                ticker_raw.get("fundingRate") or info.get("fundingRate") or info.get("funding_rate")
+            ),
+            "nextFundingTime": to_int(
+                ticker_raw.get("nextFundingTime") or info.get("nextFundingTime") or info.get("next_funding_time")
+            ),
+            "openInterest": to_float(
+                ticker_raw.get("openInterest") or info.get("openInterest") or info.get("open_interest")
+            ),
+        })
+    elif market_type == "option":
+        current_payload.update({
+            "strikePrice": ticker_raw.get("strike"),
+            "expiryDate": ticker_raw.get("expiry"),
+            "optionType": "call" if "C" in symbol.upper() else "put",
+            "impliedVolatility": ticker_raw.get("impliedVolatility"),
+            "underlyingPrice": ticker_raw.get("underlyingPrice"),
+        })
+    return current_payload
+async def push_tickers(
+    websocket: WebSocket,
+    queue: ConflatingQueue,
+    subscribed: Dict[str, TickerHub],
+    last_sent: Dict[str, Dict[str, Any]],
 ):
-    """真正的 WebSocket 推送任务，支持多市场类型，带首次推送和 Diff 过滤"""
-    logger.info(f"🚀 开始监听 {symbol} ({market_type}) WebSocket...")
-    last_sent_data = None
+    """
+    连接的推送任务：从共享 hub 的合并队列取每个 symbol 的最新 ticker，
+    带首次推送和 Diff 过滤（上游订阅由 hub 共享，见 utils/stream_hub.py）
+    """
     try:
         while True:
-            # 1. 等待交易所真实推送（ccxt.pro watch_ticker 是异步阻塞式）
-            ticker_raw = await exchange.watch_ticker(symbol)
-            info = ticker_raw.get("info", {})
-            # 2. 统一构建推送数据结构（兼容你的 freezed TickerModel）
-            current_payload: Dict[str, Any] = {
-                "symbol": symbol,
-                "marketType": market_type,
-                "last": ticker_raw.get("last"),
-                "open": ticker_raw.get("open"),
-                "high": ticker_raw.get("high"),
-                "low": ticker_raw.get("low"),
-                "bid": ticker_raw.get("bid"),
-                "ask": ticker_raw.get("ask"),
-                "change": ticker_raw.get("change"),
-                "percentage": ticker_raw.get("percentage"),
-                "baseVolume": ticker_raw.get("baseVolume") or 0.0,
-                "quoteVolume": ticker_raw.get("quoteVolume") or 0.0,
-                "timestamp": ticker_raw.get("timestamp") or int(asyncio.get_event_loop().time() * 1000),
-                "vwap": ticker_raw.get("vwap"),
-                "info": info,
-            }
-            # 补充市场类型专有字段
-            if market_type in ["perpetual", "delivery", "swap", "future"]:
-                
-                current_payload.update({
-                    "markPrice": to_float(
-                        ticker_raw.get("markPrice") or info.get("markPrice") or info.get("mark_price")
-                    ),
-                    "indexPrice": to_float(
-                        ticker_raw.get("indexPrice") or info.get("indexPrice") or info.get("index_price")
-                    ),
-                    "fundingRate": to_float(
-                        ticker_raw.get("fundingRate") or info.get("fundingRate") or info.get("funding_rate")
-                    ),
-                    "nextFundingTime": to_int(
-                        ticker_raw.get("nextFundingTime") or info.get("nextFundingTime") or info.get("next_funding_time")
-                    ),
-                    "openInterest": to_float(
-                        ticker_raw.get("openInterest") or info.get("openInterest") or info.get("open_interest")
-                    ),
-                })
-            elif market_type == "option":
-                current_payload.update({
-                    "strikePrice": ticker_raw.get("strike"),
-                    "expiryDate": ticker_raw.get("expiry"),
-                    "optionType": "call" if "C" in symbol.upper() else "put",
-                    "impliedVolatility": ticker_raw.get("impliedVolatility"),
-                    "underlyingPrice": ticker_raw.get("underlyingPrice"),
-                })
-            # 3. Diff 检查：首次强制推送，否则只推送有意义变化
-            should_send = False
-            if last_sent_data is None:
-                should_send = True
-            else:
-                old_comp = {
-                    "last": last_sent_data.get("last"),
-                    "percentage": last_sent_data.get("percentage"),
-                }
-                new_comp = {
-                    "last": current_payload.get("last"),
-                    "percentage": current_payload.get("percentage"),
-                }
-                if has_meaningful_change(old_comp, new_comp):
+            updates = await queue.get()
+            for symbol, ticker_raw in updates.items():
+                hub = subscribed.get(symbol)
+                if hub is None:
+                    continue
+                market_type = hub.market_type
+                if isinstance(ticker_raw, HubError):
+                    if ticker_raw.fatal:
+                        # 不存在的 symbol：hub 已停止订阅，通知客户端
+                        subscribed.pop(symbol, None)
+                        last_sent.pop(symbol, None)
+                        await websocket.send_text(json.dumps({
+                            "code": 4002,
+                            "msg": f"symbol not supported: {symbol}",
+                            "data": {"symbol": symbol, "marketType": market_type},
+                            "ts": int(time.time() * 1000),
+                        }, ensure_ascii=False))
+                    continue
+                current_payload = build_ticker_payload(symbol, market_type, ticker_raw)
+                # Diff 检查：首次强制推送，否则只推送有意义变化
+                previous = last_sent.get(symbol)
+                should_send = False
+                if previous is None:
                     should_send = True
-            # 4. 推送
-            if should_send:
-                await websocket.send_text(json.dumps({
-                    "code": 0,
-                    "msg": "success",
-                    "data": current_payload,
-                    "ts": exchange.milliseconds(),
-                    "type": "ticker"
-                }, ensure_ascii=False))
-                last_sent_data = current_payload.copy()
-                logger.pretty(f"📤 {symbol} ({market_type}) 更新推送: {current_payload }")
-            # else:
-            # logger.debug(f"⏳ {symbol} 变化太小，跳过推送")
-    except asyncio.CancelledError:
-        logger.info(f"🛑 {symbol} ({market_type}) 监听任务已取消")
-    except Exception as e:
-        logger.error(f"⚠️ {symbol} ({market_type}) 监听异常: {e}")
-        await asyncio.sleep(5) # 重试间隔
+                else:
+                    old_comp = {
+                        "last": previous.get("last"),
+                        "percentage": previous.get("percentage"),
+                        "markPrice": previous.get("markPrice"),
+                        "fundingRate": previous.get("fundingRate"),
+                    }
+                    new_comp = {
+                        "last": current_payload.get("last"),
+                        "percentage": current_payload.get("percentage"),
+                        "markPrice": current_payload.get("markPrice"),
+                        "fundingRate": current_payload.get("fundingRate"),
+                    }
+                    if has_meaningful_change(old_comp, new_comp):
+                        should_send = True
+                # 推送
+                if should_send:
+                    await websocket.send_text(json.dumps({
+                        "code": 0,
+                        "msg": "success",
+                        "data": current_payload,
+                        "ts": int(time.time() * 1000),
+                        "type": "ticker"
+                    }, ensure_ascii=False))
+                    last_sent[symbol] = current_payload
+                    _push_log.info(
+                        "📤 %s (%s) 更新推送: last=%s percentage=%s",
+                        symbol, market_type, current_payload["last"], current_payload["percentage"],
+                        key=symbol,
+                    )
+                    _push_payload_log.debug(
+                        "📤 %s (%s) payload:\n%s", symbol, market_type, LazyPretty(current_payload),
+                        key=symbol,
+                    )
+                # else:
+                # logger.debug(f"⏳ {symbol} 变化太小，跳过推送")
+    except (WebSocketDisconnect, RuntimeError) as e:
+        # 连接已关闭（RuntimeError 为 close 之后再 send）
+        logger.info(f"ticker 推送结束: {e!r}")
 async def websocket_ticker(
     websocket: WebSocket,
     exchange: str = "binance"
 ):
     await websocket.accept()
     logger.info(f"New WS connection: {exchange}")
+    exchange = exchange.lower().strip()
+    queue = ConflatingQueue()
+    # 该连接订阅的 symbol -> 所属 hub（每个 marketType 一个共享 hub）
+    subscribed: Dict[str, TickerHub] = {}
+    last_sent: Dict[str, Dict[str, Any]] = {}
+    sender: Optional[asyncio.Task] = None
     try:
-        ex = await get_exchange_pro(exchange)
-        # 该连接下的所有监听任务 {symbol: task}
-        active_tasks: Dict[str, asyncio.Task] = {}
+        # 校验交易所（不支持时抛 ValueError）
+        get_ticker_hub(exchange, "spot")
+        sender = asyncio.create_task(push_tickers(websocket, queue, subscribed, last_sent))
         while True:
             raw = await websocket.receive_text()
             msg = json.loads(raw)
             action = msg.get("action")
             symbol = msg.get("symbol", "").upper().strip()
-            market_type = msg.get("marketType", "spot").lower()
-            # market_type = 'future'
-            if market_type != "spot":
-                # 为每个 marketType 创建/缓存单独实例
-                # perpetual / swap / future / option 等
-                # ex = await get_exchange_pro(f"{exchange}_{market_type}")
-                ex.options["defaultType"] = market_type
+            market_type = str(msg.get("marketType", "spot")).lower().strip()
             if action == "subscribe" and symbol:
-                if symbol not in active_tasks:
-                    task = asyncio.create_task(
-                        watch_ticker_task(ex, symbol, market_type, websocket)
-                    )
-                    active_tasks[symbol] = task
+                if market_type not in MARKET_TYPES:
+                    await websocket.send_text(json.dumps({
+                        "code": 4000,
+                        "msg": f"不支持的 marketType: '{market_type}'，可选 {', '.join(MARKET_TYPES)}",
+                        "data": {"symbol": symbol, "marketType": market_type},
+                        "ts": int(time.time() * 1000),
+                    }, ensure_ascii=False))
+                    continue
+                if symbol not in subscribed:
+                    hub = get_ticker_hub(exchange, market_type)
+                    subscribed[symbol] = hub
+                    hub.subscribe(symbol, queue)
                     logger.info(f"✅ Subscribed: {symbol} ({market_type})")
                     await websocket.send_text(json.dumps({
                         "code": 0,
@@ -183,29 +227,30 @@ async def websocket_ticker(
                             "symbol": symbol,
                             "marketType": market_type
                         },
-                        "ts": ex.milliseconds(),
+                        "ts": int(time.time() * 1000),
                     }, ensure_ascii=False))
             elif action == "unsubscribe" and symbol:
-                task = active_tasks.pop(symbol, None)
-                if task:
-                    task.cancel()
-                    logger.info(f"❌ Unsubscribed: {symbol} ({market_type})")
+                hub = subscribed.pop(symbol, None)
+                if hub:
+                    hub.unsubscribe(symbol, queue)
+                    last_sent.pop(symbol, None)
+                    logger.info(f"❌ Unsubscribed: {symbol} ({hub.market_type})")
                     await websocket.send_text(json.dumps({
                         "code": 0,
                         "msg": "success",
                         "data": {
                             "action": "unsubscribed",
                             "symbol": symbol,
-                            "marketType": market_type
+                            "marketType": hub.market_type
                         },
-                        "ts": ex.milliseconds(),
+                        "ts": int(time.time() * 1000),
                     }, ensure_ascii=False))
             elif action == "ping":
                 await websocket.send_text(json.dumps({
                     "code": 0,
                     "msg": "success",
                     "data": {"action": "pong"},
-                    "ts": ex.milliseconds()
+                    "ts": int(time.time() * 1000)
                 }, ensure_ascii=False))
     except WebSocketDisconnect:
         logger.info("WS connection closed by client")
@@ -215,104 +260,14 @@ async def websocket_ticker(
             "code": 5000,
             "msg": str(e),
             "data": None,
-            "ts": ex.milliseconds() if 'ex' in locals() else int(asyncio.get_event_loop().time() * 1000)
+            "ts": int(time.time() * 1000)
         }, ensure_ascii=False))
     finally:
-        # 清理所有任务
-        for task in active_tasks.values():
-            task.cancel()
-        active_tasks.clear()
-        logger.info(f"Cleaned up {len(active_tasks)} tasks for closed connection")
-# 并发多个监听
-async def watch_ticker_task_pro(
-    exchange: ccxt_pro.Exchange,
-    symbol: str,
-    market_type: str,
-    websocket: WebSocket
-):
-    """真正的 WebSocket 推送任务，同时监听 ticker + markPrice（合约专用）"""
-    logger.info(f"🚀 开始监听 {symbol} ({market_type}) WebSocket...")
-    last_sent_data = None
-    # 合约类型才监听 markPrice（包含 fundingRate）
-    is_contract = market_type in ["perpetual", "delivery", "swap", "future"]
-    async def ticker_loop():
-        while True:
-            ticker = await exchange.watch_ticker(symbol)
-            return {"type": "ticker", "data": ticker} # 只返回一次用于初始化
-    async def mark_price_loop():
-        if not is_contract:
-            return None
-        while True:
-            mark = await exchange.watch_mark_price(symbol)
-            return {"type": "mark_price", "data": mark}
-    # 合并两个 loop 的结果（用 asyncio.gather 并发等待）
-    try:
-        while True:
-            # 并发等待下一个 ticker 或 mark_price 更新
-            done, pending = await asyncio.wait(
-                [ticker_loop(), mark_price_loop()] if is_contract else [ticker_loop()],
-                return_when=asyncio.FIRST_COMPLETED
-            )
-            for task in done:
-                result = task.result()
-                if result:
-                    # 合并到 current_payload
-                    current_payload = {
-                        "symbol": symbol,
-                        "marketType": market_type,
-                        "last": result["data"].get("last"),
-                        "open": result["data"].get("open"),
-                        "high": result["data"].get("high"),
-                        "low": result["data"].get("low"),
-                        "bid": result["data"].get("bid"),
-                        "ask": result["data"].get("ask"),
-                        "change": result["data"].get("change"),
-                        "percentage": result["data"].get("percentage"),
-                        "baseVolume": result["data"].get("baseVolume") or 0.0,
-                        "quoteVolume": result["data"].get("quoteVolume") or 0.0,
-                        "timestamp": result["data"].get("timestamp") or int(asyncio.get_event_loop().time() * 1000),
-                        "vwap": result["data"].get("vwap"),
-                        "info": result["data"].get("info", {}),
-                    }
-                    # 总是从 mark_price 补充（如果有）
-                    if is_contract and result["type"] == "mark_price":
-                        current_payload.update({
-                            "markPrice": result["data"].get("markPrice"),
-                            "indexPrice": result["data"].get("indexPrice"),
-                            "fundingRate": result["data"].get("fundingRate"), # ← 这里就是资金费率！
-                            "nextFundingTime": result["data"].get("nextFundingTime"),
-                            "openInterest": result["data"].get("openInterest"),
-                        })
-                    # Diff 检查 + 推送（逻辑不变）
-                    should_send = False
-                    if last_sent_data is None:
-                        should_send = True
-                    else:
-                        old_comp = {
-                            "last": last_sent_data.get("last"),
-                            "percentage": last_sent_data.get("percentage"),
-                            "fundingRate": last_sent_data.get("fundingRate"),
-                        }
-                        new_comp = {
-                            "last": current_payload.get("last"),
-                            "percentage": current_payload.get("percentage"),
-                            "fundingRate": current_payload.get("fundingRate"),
-                        }
-                        if has_meaningful_change(old_comp, new_comp, pct_threshold=0.0005): # fundingRate 阈值可调小
-                            should_send = True
-                    if should_send:
-                        await websocket.send_text(json.dumps({
-                            "code": 0,
-                            "msg": "success",
-                            "data": current_payload
-                        }, ensure_ascii=False))
-                        last_sent_data = current_payload.copy()
-                        # logger.info(f"📤 {symbol} ({market_type}) 更新推送: last={current_payload.get('last')}, fundingRate={current_payload.get('fundingRate')}")
-                    # 取消已完成的 pending task，避免内存泄漏
-                    for p in pending:
-                        p.cancel()
-    except asyncio.CancelledError:
-        logger.info(f"🛑 {symbol} ({market_type}) 监听任务已取消")
-    except Exception as e:
-        logger.error(f"⚠️ {symbol} ({market_type}) 监听异常: {e}")
-        await asyncio.sleep(5)
\ No newline at end of file
+        # 退订所有 symbol（同步完成，之后的 await 被取消也不会漏）
+        if sender is not None:
+            sender.cancel()
+        count = len(subscribed)
+        for symbol, hub in subscribed.items():
+            hub.unsubscribe(symbol, queue)
+        subscribed.clear()
+        logger.info(f"Cleaned up {count} subscriptions for closed connection")
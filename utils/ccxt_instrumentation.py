@@ -0,0 +1,213 @@
+import asyncio
+import inspect
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+import ccxt
+import ccxt.async_support as ccxt_async
+from ccxt.async_support.base.ws.client import Client as WsClient
+
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# =======================================================================
+# 上游（ccxt）调用埋点
+#
+# 每个 fetch_* / watch_* / load_markets 调用记录：
+#   - 总耗时（包含限速等待 + 代理 + 交易所）
+#   - ccxt 内置限速器的等待时间（throttle）
+#   - 收到的响应字节数
+#   - 结果：ok 或异常类名
+# 总耗时 - 限速等待 ≈ 网络耗时（代理 + 交易所）
+# =======================================================================
+
+UPSTREAM_CALLS = Counter(
+    "ccxt_calls_total",
+    "ccxt 调用次数，outcome 为 ok 或异常类名",
+    ("exchange", "method", "outcome"),
+)
+UPSTREAM_LATENCY = Histogram(
+    "ccxt_call_duration_seconds",
+    "ccxt 调用总耗时（秒），包含限速等待",
+    ("exchange", "method"),
+)
+UPSTREAM_THROTTLE = Histogram(
+    "ccxt_throttle_wait_seconds",
+    "ccxt 限速器等待时间（秒）",
+    ("exchange", "method"),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+UPSTREAM_BYTES = Counter(
+    "ccxt_response_bytes_total",
+    "ccxt REST 响应字节数",
+    ("exchange", "method"),
+)
+UPSTREAM_WS_BYTES = Counter(
+    "ccxt_ws_received_bytes_total",
+    "ccxt.pro WebSocket 收到的字节数",
+    ("exchange",),
+)
+
+# 不在任何被埋点方法内部发生的请求（如直接调用隐式 API）
+UNATTRIBUTED = "unattributed"
+
+
+class _CallRecord:
+    __slots__ = ("method", "throttle_wait", "bytes")
+
+    def __init__(self, method: str):
+        self.method = method
+        self.throttle_wait = 0.0
+        self.bytes = 0
+
+
+# 当前正在执行的 ccxt 调用；asyncio task / run_in_threadpool 都会复制上下文
+_current_call: ContextVar[Optional[_CallRecord]] = ContextVar(
+    "ccxt_current_call", default=None
+)
+
+_instrumented_classes = set()
+
+
+def _should_instrument(name: str) -> bool:
+    return name.startswith("fetch_") or name.startswith("watch_") or name == "load_markets"
+
+
+def _finish(exchange_id: str, record: _CallRecord, elapsed: float, outcome: str) -> None:
+    UPSTREAM_CALLS.inc(exchange_id, record.method, outcome)
+    UPSTREAM_LATENCY.observe(elapsed, exchange_id, record.method)
+    if record.throttle_wait:
+        UPSTREAM_THROTTLE.observe(record.throttle_wait, exchange_id, record.method)
+    if record.bytes:
+        UPSTREAM_BYTES.inc(exchange_id, record.method, value=record.bytes)
+
+
+def _wrap_async(name: str, fn):
+    @wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        record = _CallRecord(name)
+        token = _current_call.set(record)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await fn(self, *args, **kwargs)
+        except asyncio.CancelledError:
+            outcome = "CancelledError"
+            raise
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            _current_call.reset(token)
+            _finish(self.id, record, time.perf_counter() - start, outcome)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def _wrap_sync(name: str, fn):
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        record = _CallRecord(name)
+        token = _current_call.set(record)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return fn(self, *args, **kwargs)
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            _current_call.reset(token)
+            _finish(self.id, record, time.perf_counter() - start, outcome)
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+
+def instrument_exchange_class(cls) -> None:
+    """
+    给具体交易所类的 fetch_* / watch_* / load_markets 方法加埋点
+    每个类只处理一次（首次实例化时），之后实例化没有额外开销
+    """
+    if cls in _instrumented_classes:
+        return
+    _instrumented_classes.add(cls)
+
+    for name in dir(cls):
+        if not _should_instrument(name):
+            continue
+        fn = getattr(cls, name, None)
+        # 父类已经埋点过的方法直接继承，避免重复计数
+        if not inspect.isfunction(fn) or getattr(fn, "__instrumented__", False):
+            continue
+        if inspect.iscoroutinefunction(fn):
+            setattr(cls, name, _wrap_async(name, fn))
+        else:
+            setattr(cls, name, _wrap_sync(name, fn))
+
+
+def install_base_hooks() -> None:
+    """在 ccxt 基类上挂限速等待 / 响应字节 / WS 字节的钩子（进程内执行一次）"""
+    if getattr(ccxt.Exchange, "__instrumented_hooks__", False):
+        return
+
+    original_async_throttle = ccxt_async.Exchange.throttle
+
+    async def async_throttle(self, cost=None):
+        start = time.perf_counter()
+        try:
+            return await original_async_throttle(self, cost)
+        finally:
+            _add_throttle_wait(self.id, time.perf_counter() - start)
+
+    original_sync_throttle = ccxt.Exchange.throttle
+
+    def sync_throttle(self, cost=None):
+        start = time.perf_counter()
+        try:
+            return original_sync_throttle(self, cost)
+        finally:
+            _add_throttle_wait(self.id, time.perf_counter() - start)
+
+    # 异步版 Exchange 继承自同步版基类，on_rest_response 两者共用
+    original_on_rest_response = ccxt.Exchange.on_rest_response
+
+    def on_rest_response(self, code, reason, url, method, response_headers, response_body, request_headers, request_body):
+        if response_body:
+            size = len(response_body)
+            record = _current_call.get()
+            if record is not None:
+                record.bytes += size
+            else:
+                UPSTREAM_BYTES.inc(self.id, UNATTRIBUTED, value=size)
+        return original_on_rest_response(
+            self, code, reason, url, method, response_headers, response_body, request_headers, request_body
+        )
+
+    original_ws_handle_message = WsClient.handle_message
+
+    def ws_handle_message(self, message):
+        data = getattr(message, "data", None)
+        if isinstance(data, (str, bytes)):
+            exchange = getattr(self.on_message_callback, "__self__", None)
+            UPSTREAM_WS_BYTES.inc(getattr(exchange, "id", "unknown"), value=len(data))
+        return original_ws_handle_message(self, message)
+
+    ccxt_async.Exchange.throttle = async_throttle
+    ccxt.Exchange.throttle = sync_throttle
+    ccxt.Exchange.on_rest_response = on_rest_response
+    WsClient.handle_message = ws_handle_message
+    ccxt.Exchange.__instrumented_hooks__ = True
+
+
+def _add_throttle_wait(exchange_id: str, waited: float) -> None:
+    record = _current_call.get()
+    if record is not None:
+        record.throttle_wait += waited
+    else:
+        UPSTREAM_THROTTLE.observe(waited, exchange_id, UNATTRIBUTED)
@@ -27,11 +27,23 @@ import ccxt
 import ccxt.async_support as ccxt_async
 import ccxt.pro as ccxt_pro  # 必须导入 pro 才能对其打补丁
 
+from utils.ccxt_instrumentation import install_base_hooks, instrument_exchange_class
+from utils.circuit_breaker import guard_exchange_class
+from utils.feed_recorder import tap_exchange_class
+from utils.http_pool import attach_shared_session
+from utils.proxy_pool import PROXY_POOL, egress_of, install_proxy_hooks
+from utils.rate_limiter import install_rate_limit_scheduler
+
+
+# 调用方在 config 里自己指定代理时，代理池不接管
+PROXY_CONFIG_KEYS = (
+    "proxies", "aiohttp_proxy", "proxy", "proxyUrl", "httpProxy", "httpsProxy", "socksProxy",
+    "http_proxy", "https_proxy", "socks_proxy",
+)
+
 
 # 同时支持同步和异步的REST API 和 WebSocket
 def apply_global_ccxt_patch():
-    proxy_url = "http://127.0.0.1:7890"
-
     def patch_factory(original_init, mode: str):
         def patched_init(self, config=None):
             if config is None:
@@ -42,37 +54,39 @@ def apply_global_ccxt_patch():
 
             config.setdefault("timeout", 60000)
 
-            # 2. 根据模式注入互斥的代理参数
-            if mode == "sync":
-                # 同步版 ccxt 使用原生的 proxies 结构
-                config.setdefault(
-                    "proxies",
-                    {
-                        "http": proxy_url,
-                        "https": proxy_url,
-                    },
-                )
-            else:
-                # 异步 (ccxt_async) 和 Pro (ccxt_pro) 使用新的属性映射
-                # 这样可以避开 "conflicting proxy settings" 错误
-                # config.setdefault("httpsProxy", proxy_url)
-                config.setdefault("aiohttp_proxy", proxy_url)
-
-                # 注入 WebSocket 专用配置
-                if mode == "pro":
-                    if "options" not in config:
-                        config["options"] = {}
-                    if "ws" not in config["options"]:
-                        config["options"]["ws"] = {}
-                    config["options"]["ws"].setdefault("proxy", proxy_url)
+            # 2. 代理出口由代理池按交易所分配（utils/proxy_pool.py）：
+            #    同步版写 proxies，异步 / Pro 写 aiohttp_proxy + options.ws.proxy，互不冲突
+            explicit_proxy = any(key in config for key in PROXY_CONFIG_KEYS) or (
+                "proxy" in config.get("options", {}).get("ws", {})
+            )
 
             # 统一设置默认交易类型
             if "options" not in config:
                 config["options"] = {}
             config["options"].setdefault("defaultType", "spot")
 
+            # 异步 REST 实例共用连接池（utils/http_pool.py），不再每个实例一个会话
+            shared_session = mode == "async" and attach_shared_session(type(self), config)
+
             original_init(self, config)
 
+            if shared_session:
+                # close 时不用再等自己的连接器关闭
+                self.timeout_on_exit = 0
+
+            # 异步实例的 __init__ 会经过 "pro" / "async" / "sync" 三层补丁，出口只分配一次
+            if not explicit_proxy and egress_of(self) is None:
+                PROXY_POOL.bind(self)
+
+            # 上游调用埋点（每个交易所类只处理一次）
+            instrument_exchange_class(type(self))
+
+            # 按 (交易所, 接口类别) 熔断，包在埋点外层（utils/circuit_breaker.py）
+            guard_exchange_class(type(self))
+
+            # 行情录制（设置了 FEED_RECORD_PATH 才生效）
+            tap_exchange_class(type(self))
+
         return patched_init
 
     # --- 精确打补丁，解决冲突 ---
@@ -80,4 +94,13 @@ def apply_global_ccxt_patch():
     ccxt_async.Exchange.__init__ = patch_factory(ccxt_async.Exchange.__init__, "async")
     ccxt_pro.Exchange.__init__ = patch_factory(ccxt_pro.Exchange.__init__, "pro")
 
+    # 进程级按交易所限速（所有实例共享令牌桶，区分前台 / 后台优先级）
+    install_rate_limit_scheduler()
+
+    # 按出口上报请求成败，出口不可用时实例自动换下一个
+    install_proxy_hooks()
+
+    # 限速等待 / 响应字节 / WS 字节埋点（包在全局限速外层，统计的是真实排队时间）
+    install_base_hooks()
+
     print("🚀 CCXT 智能代理补丁已加载，同时支持同步和异步的REST API 和 WebSocket")
@@ -0,0 +1,331 @@
+"""
+上游熔断：按 (交易所, 接口类别) 快速失败，熔断期间返回最近一次成功的数据
+
+交易所或代理挂掉时，每个请求都要等满 ccxt 的 timeout（ccxt_patch 60s / ExchangeManager 30s），
+请求越积越多把服务拖垮。这里：
+
+- 每个 (交易所, 接口类别) 一个熔断器，接口类别见 ENDPOINT_CLASSES（ticker / orderbook / trades / ohlcv / markets）
+- closed：连续 CB_FAILURE_THRESHOLD 次网络错误（超时、连接失败、5xx、限流）后转 open；
+  交易所正常返回的业务错误（BadSymbol 等）不计为失败
+- open：CB_OPEN_SECONDS 秒内该类调用直接抛 CircuitOpenError（ccxt.ExchangeNotAvailable 子类，
+  原有 NetworkError 分支照常处理），不访问交易所
+- half_open：到期后只放行一个探测请求，成功转 closed，失败重新 open；探测期间其余调用仍快速失败
+- 嵌套调用（fetch_ticker 内部的 load_markets 等）只按最外层计一次
+- 路由把成功的数据记进 LAST_GOOD（有条数上限、按 JSON 编码字节数估算的内存上限和最长保留时间），上游失败或熔断时
+  stale_response() 返回这份数据，data 里带 "stale": true 和 "staleAgeMs"
+
+环境变量：
+    CB_ENABLED              设为 0 时关闭熔断
+    CB_FAILURE_THRESHOLD    连续失败多少次后熔断，默认 5
+    CB_OPEN_SECONDS         熔断持续秒数，默认 30
+    CB_STALE_MAX_AGE        旧数据最长可用秒数，默认 600
+    CB_STALE_MAX_ENTRIES    保留的旧数据条数上限，默认 2000
+    CB_STALE_MAX_MB         旧数据总大小上限，默认 32
+"""
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import ccxt
+
+from utils.json_response import dumps
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+CB_ENABLED = os.getenv("CB_ENABLED", "1") != "0"
+CB_FAILURE_THRESHOLD = int(os.getenv("CB_FAILURE_THRESHOLD", "5"))
+CB_OPEN_SECONDS = float(os.getenv("CB_OPEN_SECONDS", "30"))
+CB_STALE_MAX_AGE = float(os.getenv("CB_STALE_MAX_AGE", "600"))
+CB_STALE_MAX_ENTRIES = int(os.getenv("CB_STALE_MAX_ENTRIES", "2000"))
+CB_STALE_MAX_MB = float(os.getenv("CB_STALE_MAX_MB", "32"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# ccxt 方法 -> 接口类别（同一类别共用一个熔断器）
+ENDPOINT_CLASSES = {
+    "fetch_ticker": "ticker",
+    "fetch_tickers": "ticker",
+    "fetch_order_book": "orderbook",
+    "fetch_trades": "trades",
+    "fetch_ohlcv": "ohlcv",
+    "load_markets": "markets",
+}
+
+CIRCUIT_STATE_CHANGES = Counter(
+    "circuit_state_changes_total",
+    "熔断器状态变化次数，state 为 open / half_open / closed",
+    ("exchange", "endpoint", "state"),
+)
+CIRCUIT_REJECTED = Counter(
+    "circuit_rejected_total",
+    "熔断期间被快速失败的上游调用数",
+    ("exchange", "endpoint"),
+)
+STALE_SERVED = Counter(
+    "stale_responses_total",
+    "上游不可用时返回旧数据的次数，outcome 为 served（有旧数据）/ miss（没有可用旧数据）",
+    ("endpoint", "outcome"),
+)
+
+
+class CircuitOpenError(ccxt.ExchangeNotAvailable):
+    """熔断中，调用没有发往交易所"""
+
+    def __init__(self, exchange_id: str, endpoint: str, retry_after: float):
+        super().__init__(f"{exchange_id} {endpoint} 熔断中，{retry_after:.0f}s 后重试")
+        self.exchange_id = exchange_id
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def is_failure(exc: BaseException) -> bool:
+    """只有网络层面的错误计为失败；交易所正常返回的业务错误说明链路是通的"""
+    return isinstance(exc, (ccxt.NetworkError, asyncio.TimeoutError)) and not isinstance(exc, CircuitOpenError)
+
+
+class CircuitBreaker:
+    def __init__(self, exchange_id: str, endpoint: str):
+        self.exchange_id = exchange_id
+        self.endpoint = endpoint
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        """调用方需持有 _lock"""
+        if self.state == state:
+            return
+        self.state = state
+        CIRCUIT_STATE_CHANGES.inc(self.exchange_id, self.endpoint, state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            logger.warning(f"⚡ {self.exchange_id} {self.endpoint} 熔断 {CB_OPEN_SECONDS:.0f}s: {self.last_error}")
+        elif state == CLOSED:
+            self.opened_at = None
+            logger.info(f"{self.exchange_id} {self.endpoint} 熔断恢复")
+
+    def before_call(self) -> None:
+        """放行则返回；熔断中抛 CircuitOpenError"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + CB_OPEN_SECONDS - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        CIRCUIT_REJECTED.inc(self.exchange_id, self.endpoint)
+        raise CircuitOpenError(self.exchange_id, self.endpoint, max(remaining, 0.0))
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._transition(CLOSED)
+
+    def on_failure(self, exc: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            if self.state == HALF_OPEN:
+                # 探测失败：重新熔断并重新计时
+                self._probing = False
+                self._transition(OPEN)
+            elif self.state == CLOSED and self.failures >= CB_FAILURE_THRESHOLD:
+                self._transition(OPEN)
+
+    def on_abort(self) -> None:
+        """调用被取消：不算成败，只释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = round(max(self.opened_at + CB_OPEN_SECONDS - time.monotonic(), 0.0), 1)
+            return {
+                "exchange": self.exchange_id,
+                "endpoint": self.endpoint,
+                "state": self.state,
+                "failures": self.failures,
+                "retry_after": retry_after,
+                "last_error": self.last_error,
+            }
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(exchange_id: str, endpoint: str) -> CircuitBreaker:
+    key = (exchange_id, endpoint)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(key, CircuitBreaker(exchange_id, endpoint))
+    return breaker
+
+
+def breaker_report() -> List[Dict[str, Any]]:
+    return [b.report() for _, b in sorted(_breakers.items())]
+
+
+# ---------------- 包装 ccxt 方法 ----------------
+
+# 已经在某个受保护调用内部（嵌套调用不重复计数）
+_inside_guard: ContextVar[bool] = ContextVar("circuit_inside_guard", default=False)
+
+_guarded_classes = set()
+
+
+def _wrap_async(endpoint: str, fn):
+    @wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        if _inside_guard.get():
+            return await fn(self, *args, **kwargs)
+        breaker = get_breaker(self.id, endpoint)
+        breaker.before_call()
+        token = _inside_guard.set(True)
+        try:
+            result = await fn(self, *args, **kwargs)
+        except asyncio.CancelledError:
+            breaker.on_abort()
+            raise
+        except Exception as e:
+            if is_failure(e):
+                breaker.on_failure(e)
+            else:
+                breaker.on_success()
+            raise
+        finally:
+            _inside_guard.reset(token)
+        breaker.on_success()
+        return result
+
+    wrapper.__circuit_guarded__ = True
+    return wrapper
+
+
+def _wrap_sync(endpoint: str, fn):
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if _inside_guard.get():
+            return fn(self, *args, **kwargs)
+        breaker = get_breaker(self.id, endpoint)
+        breaker.before_call()
+        token = _inside_guard.set(True)
+        try:
+            result = fn(self, *args, **kwargs)
+        except Exception as e:
+            if is_failure(e):
+                breaker.on_failure(e)
+            else:
+                breaker.on_success()
+            raise
+        finally:
+            _inside_guard.reset(token)
+        breaker.on_success()
+        return result
+
+    wrapper.__circuit_guarded__ = True
+    return wrapper
+
+
+def guard_exchange_class(cls) -> None:
+    """
+    给具体交易所类的行情方法加熔断（每个类只处理一次，首次实例化时）
+    在埋点之后调用：熔断拒绝的调用不计入上游调用统计
+    """
+    if not CB_ENABLED or cls in _guarded_classes:
+        return
+    _guarded_classes.add(cls)
+
+    for name, endpoint in ENDPOINT_CLASSES.items():
+        fn = getattr(cls, name, None)
+        if not inspect.isfunction(fn) or getattr(fn, "__circuit_guarded__", False):
+            continue
+        if inspect.iscoroutinefunction(fn):
+            setattr(cls, name, _wrap_async(endpoint, fn))
+        else:
+            setattr(cls, name, _wrap_sync(endpoint, fn))
+
+
+# ---------------- 旧数据兜底 ----------------
+
+class LastGoodStore:
+    """每个请求（路由 + 参数）最近一次成功的 data，超出条数或字节上限时按 LRU 淘汰"""
+
+    def __init__(self, max_entries: int, max_age: float, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        # (endpoint, key) -> (保存时间, data, 编码后字节数)
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def remember(self, endpoint: str, key: Hashable, data: Any) -> None:
+        size = len(dumps(data))
+        with self._lock:
+            old = self._entries.pop((endpoint, key), None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[(endpoint, key)] = (time.time(), data, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+    def lookup(self, endpoint: str, key: Hashable) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._entries.get((endpoint, key))
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.max_age:
+                del self._entries[(endpoint, key)]
+                self._bytes -= entry[2]
+                return None
+            return entry[0], entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+LAST_GOOD = LastGoodStore(CB_STALE_MAX_ENTRIES, CB_STALE_MAX_AGE, int(CB_STALE_MAX_MB * 1024 * 1024))
+
+
+def stale_response(endpoint: str, key: Hashable, exc: BaseException) -> Optional[Dict[str, Any]]:
+    """
+    上游网络错误 / 熔断时调用：有可用的旧数据就返回完整响应（data 带 stale 标记），否则返回 None
+    """
+    entry = LAST_GOOD.lookup(endpoint, key)
+    if entry is None:
+        STALE_SERVED.inc(endpoint, "miss")
+        return None
+    saved_at, data = entry
+    STALE_SERVED.inc(endpoint, "served")
+    logger.info(f"{endpoint} 上游不可用，返回 {time.time() - saved_at:.0f}s 前的数据: {exc}")
+    return {
+        "code": 0,
+        "msg": "success",
+        "data": {**data, "stale": True, "staleAgeMs": int((time.time() - saved_at) * 1000)},
+        "ts": int(datetime.utcnow().timestamp() * 1000),
+    }
@@ -0,0 +1,359 @@
+"""
+合约数据后台缓存：资金费率 + 24h 行情
+
+/api/contracts/markets 原来每次请求只对当前页的 symbol 同步拉资金费率，
+按 fundingRate 排序时排的是占位值，volume_24h / priceChange 更是从来没有数据。
+这里为每个 (exchange, type) 起一个后台轮询：
+
+- 拉取该类型全部永续合约的资金费率和 fetch_tickers 快照，请求路径只读缓存，不访问交易所
+- 资金费率刷新对齐结算：在最近的 nextFundingTime 之后 FUNDING_SETTLE_DELAY 秒刷新，
+  两次结算之间最多间隔 FUNDING_REFRESH_INTERVAL 秒（预测费率会持续变化）
+- 行情快照每 CONTRACT_TICKER_INTERVAL 秒刷新一次
+- 每次刷新后重建合约表（ContractTable）：完整行 + 每个排序字段一份预排序索引，
+  任意排序方式的分页都只需 O(page)
+- 上游请求按后台优先级排队（utils/rate_limiter.py），不挤占用户请求的限额
+- 第一次被请求时按需启动，FUNDING_IDLE_TIMEOUT 秒内无人读取则停止；
+  FUNDING_POLL_EXCHANGES 里配置的在启动时就开始轮询且常驻
+
+环境变量：
+    FUNDING_POLL_EXCHANGES     启动即轮询的列表，如 "okx:linear,binance:linear"
+    FUNDING_REFRESH_INTERVAL   默认 300
+    FUNDING_SETTLE_DELAY       默认 5
+    FUNDING_FIRST_WAIT         首次请求等待第一份数据的秒数，默认 5
+    FUNDING_IDLE_TIMEOUT       默认 3600
+    CONTRACT_TICKER_INTERVAL   行情快照刷新间隔，默认 30
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.exchange_manager import ExchangeManager
+from utils.metrics import Counter
+from utils.rate_limiter import background_priority
+
+logger = logging.getLogger(__name__)
+
+FUNDING_REFRESH_INTERVAL = float(os.getenv("FUNDING_REFRESH_INTERVAL", "300"))
+FUNDING_SETTLE_DELAY = float(os.getenv("FUNDING_SETTLE_DELAY", "5"))
+FUNDING_FIRST_WAIT = float(os.getenv("FUNDING_FIRST_WAIT", "5"))
+FUNDING_IDLE_TIMEOUT = float(os.getenv("FUNDING_IDLE_TIMEOUT", "3600"))
+TICKER_INTERVAL = float(os.getenv("CONTRACT_TICKER_INTERVAL", "30"))
+
+# 刷新失败后的重试间隔（秒）
+FUNDING_RETRY_DELAY = 30.0
+
+CONTRACT_POLLS = Counter(
+    "contract_cache_polls_total",
+    "合约缓存后台刷新次数，kind 为 funding / tickers，outcome 为 ok 或异常类名",
+    ("exchange", "type", "kind", "outcome"),
+)
+
+# 可排序字段 -> 行里的取值字段
+SORT_FIELDS = {
+    "symbol": "symbol",
+    "volume_24h": "volume_24h",
+    "priceChange": "priceChange",
+    "leverage": "maxLeverage",
+    "fundingRate": "fundingRate",
+}
+
+# 某些交易所 load_markets 需要额外参数，否则 WS 会歧义 / 报错
+SPECIAL_LOAD_PARAMS = {
+    "okx": {"type": "swap"},
+    # 如果以后发现其他交易所有类似问题，再加
+}
+
+
+def contract_exchange_config(exchange_name: str, contract_type: str) -> dict:
+    """合约接口使用的实例配置（代理 / timeout / 限速由全局补丁注入）"""
+    config = {}
+
+    # 特殊处理需要自定义urls或options的交易所
+    if exchange_name == "binance":
+        config["urls"] = {
+            "api": {
+                "fapi": "https://fapi.binance.com/fapi/v1",
+                "public": "https://fapi.binance.com/fapi/v1",
+                "private": "https://fapi.binance.com/fapi/v1",
+            }
+        }
+        config["options"] = {"defaultType": "future" if contract_type == "linear" else "delivery"}
+    else:
+        config["options"] = {"defaultType": "swap" if contract_type == "linear" else "inverse"}
+    return config
+
+
+def contract_markets(markets: Dict[str, dict], contract_type: str) -> List[dict]:
+    """永续合约列表，按 linear / inverse 过滤"""
+    contracts = [m for m in markets.values() if m.get("swap") and m.get("contract")]
+    if contract_type == "linear":
+        return [m for m in contracts if m.get("linear")]
+    if contract_type == "inverse":
+        return [m for m in contracts if m.get("inverse")]
+    return contracts
+
+
+def contract_client(exchange_name: str, contract_type: str):
+    """合约接口的池化异步实例（交易所不存在时抛 ValueError）"""
+    return ExchangeManager.get_client(
+        exchange_name,
+        key=f"contracts:{contract_type}",
+        config=contract_exchange_config(exchange_name, contract_type),
+    )
+
+
+async def load_contract_markets(ex, contract_type: str) -> dict:
+    """走共享市场缓存的 load_markets"""
+    return await ExchangeManager.load_markets(
+        ex, key=f"contracts:{contract_type}", params=SPECIAL_LOAD_PARAMS.get(ex.id, {})
+    )
+
+
+class ContractTable:
+    """
+    某个 (exchange, type) 的合约行快照，构建后只读
+
+    每个排序字段一份升序索引；没有该字段数据的行单独放在 missing 里，
+    无论升序降序都排在最后
+    """
+
+    def __init__(
+        self,
+        rows: List[dict],
+        present: Dict[str, List[dict]],
+        missing: Dict[str, List[dict]],
+        updated_at: int,
+    ):
+        self.rows = rows
+        self.total = len(rows)
+        self._present = present
+        self._missing = missing
+        self.updated_at = updated_at
+
+    def page(self, sort: str, reverse: bool, start: int, limit: int) -> List[dict]:
+        present = self._present[sort]
+        missing = self._missing[sort]
+        n = len(present)
+        end = min(start + limit, self.total)
+        result = []
+        for i in range(start, end):
+            if i < n:
+                result.append(present[n - 1 - i] if reverse else present[i])
+            else:
+                result.append(missing[i - n])
+        return result
+
+
+def _contract_row(exchange_name: str, market: dict, funding: Optional[tuple], ticker: Optional[dict]) -> dict:
+    leverage = market.get("limits", {}).get("leverage", {})
+    funding_rate, next_funding_time = funding or (None, None)
+    ticker = ticker or {}
+    volume = ticker.get("quoteVolume")
+    if volume is None and ticker.get("baseVolume") is not None and ticker.get("last") is not None:
+        volume = ticker["baseVolume"] * ticker["last"]
+    return {
+        "symbol": market["symbol"],
+        "base": market["base"],
+        "quote": market["quote"],
+        "linear": market.get("linear", False),
+        "inverse": market.get("inverse", False),
+        "maxLeverage": leverage.get("max"),
+        "minLeverage": leverage.get("min"),
+        "exchange": exchange_name,
+        "lastPrice": ticker.get("last"),
+        "volume_24h": volume,
+        "priceChange": ticker.get("percentage"),
+        "fundingRate": funding_rate,
+        "nextFundingTime": next_funding_time,
+    }
+
+
+def build_contract_table(
+    exchange_name: str,
+    contracts: List[dict],
+    funding: Dict[str, tuple],
+    tickers: Dict[str, dict],
+) -> ContractTable:
+    """合并市场、资金费率和行情，构建每个排序字段的升序索引"""
+    rows = [
+        _contract_row(exchange_name, m, funding.get(m["symbol"]), tickers.get(m["symbol"]))
+        for m in contracts
+    ]
+    rows.sort(key=lambda row: row["symbol"])
+    present = {"symbol": rows}
+    missing = {"symbol": []}
+    for sort, field in SORT_FIELDS.items():
+        if sort != "symbol":
+            # rows 已按 symbol 排好，稳定排序保证同值时顺序确定
+            present[sort] = sorted((row for row in rows if row[field] is not None), key=lambda row: row[field])
+            missing[sort] = [row for row in rows if row[field] is None]
+    # 资金费率缺失时沿用接口原来的占位值
+    for row in rows:
+        if row["fundingRate"] is None:
+            row["fundingRate"] = -0
+        if not row["nextFundingTime"]:
+            row["nextFundingTime"] = -0
+    return ContractTable(rows, present, missing, int(time.time() * 1000))
+
+
+class ContractPoller:
+    """单个 (exchange, type) 的资金费率 + 行情轮询，维护 ContractTable"""
+
+    def __init__(self, exchange_name: str, contract_type: str, persistent: bool = False):
+        self.exchange_name = exchange_name
+        self.contract_type = contract_type
+        self.persistent = persistent
+        self.contracts: List[dict] = []
+        # symbol -> (fundingRate, nextFundingTime)
+        self.rates: Dict[str, Tuple[Optional[float], Optional[int]]] = {}
+        self.tickers: Dict[str, dict] = {}
+        self.table: Optional[ContractTable] = None
+        self.ready = asyncio.Event()
+        self.last_access = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+    def touch(self) -> None:
+        self.last_access = time.monotonic()
+
+    async def run(self) -> None:
+        # 与 /api/contracts/markets 共用同一个池化实例和市场缓存
+        ex = contract_client(self.exchange_name, self.contract_type)
+        due = {"funding": 0.0, "tickers": 0.0}
+        refreshers = {"funding": self.refresh_funding, "tickers": self.refresh_tickers}
+        with background_priority():
+            while True:
+                now = time.monotonic()
+                for kind, refresh in refreshers.items():
+                    if due[kind] > now:
+                        continue
+                    try:
+                        await self.load_contracts(ex)
+                        due[kind] = now + await refresh(ex)
+                        CONTRACT_POLLS.inc(self.exchange_name, self.contract_type, kind, "ok")
+                    except Exception as e:
+                        logger.warning(f"合约缓存刷新失败 {self.exchange_name}:{self.contract_type} {kind}: {e}")
+                        CONTRACT_POLLS.inc(self.exchange_name, self.contract_type, kind, type(e).__name__)
+                        due[kind] = now + FUNDING_RETRY_DELAY
+                if self.contracts:
+                    self.table = build_contract_table(self.exchange_name, self.contracts, self.rates, self.tickers)
+                    self.ready.set()
+                await asyncio.sleep(max(min(due.values()) - time.monotonic(), 1.0))
+                if not self.persistent and time.monotonic() - self.last_access > FUNDING_IDLE_TIMEOUT:
+                    logger.info(f"合约缓存轮询空闲停止: {self.exchange_name}:{self.contract_type}")
+                    return
+
+    async def load_contracts(self, ex) -> None:
+        await load_contract_markets(ex, self.contract_type)
+        self.contracts = contract_markets(ex.markets, self.contract_type)
+
+    async def refresh_funding(self, ex) -> float:
+        """刷新资金费率，返回距离下一次刷新的秒数"""
+        symbols = [m["symbol"] for m in self.contracts]
+        if not symbols:
+            data = {}
+        elif ex.has.get("fetchFundingRates"):
+            data = await ex.fetch_funding_rates(symbols)
+        else:
+            # 不支持批量的交易所逐个拉取（后台优先级，受全局限速约束）
+            data = {}
+            for symbol in symbols:
+                data[symbol] = await ex.fetch_funding_rate(symbol)
+
+        rates = {}
+        for symbol, funding in data.items():
+            rates[symbol] = (
+                funding.get("fundingRate"),
+                funding.get("nextFundingTime") or funding.get("fundingTimestamp"),
+            )
+        self.rates = rates
+        return self.next_funding_delay()
+
+    async def refresh_tickers(self, ex) -> float:
+        """刷新 24h 行情快照；不支持批量 fetch_tickers 的交易所不拉（逐个拉代价太高）"""
+        symbols = [m["symbol"] for m in self.contracts]
+        if symbols and ex.has.get("fetchTickers"):
+            self.tickers = await ex.fetch_tickers(symbols)
+        return TICKER_INTERVAL
+
+    def next_funding_delay(self) -> float:
+        """下一次刷新：最近一次结算之后，且不超过 FUNDING_REFRESH_INTERVAL"""
+        now = time.time() * 1000
+        upcoming = [t for _, t in self.rates.values() if t and t > now]
+        delay = FUNDING_REFRESH_INTERVAL
+        if upcoming:
+            delay = min(delay, (min(upcoming) - now) / 1000 + FUNDING_SETTLE_DELAY)
+        return max(delay, 1.0)
+
+
+class ContractCache:
+    """所有合约轮询的入口"""
+
+    def __init__(self):
+        self._pollers: Dict[Tuple[str, str], ContractPoller] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def _start(self, poller: ContractPoller) -> None:
+        # 在事件循环线程内执行
+        if poller.task is None or poller.task.done():
+            poller.task = asyncio.get_running_loop().create_task(poller.run())
+
+    def ensure(self, exchange_name: str, contract_type: str, persistent: bool = False) -> Optional[ContractPoller]:
+        """取得（必要时启动）轮询；事件循环还没绑定时返回 None"""
+        if self._loop is None:
+            return None
+        key = (exchange_name, contract_type)
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                poller = ContractPoller(exchange_name, contract_type, persistent)
+                self._pollers[key] = poller
+        poller.touch()
+        if poller.task is None or poller.task.done():
+            self._loop.call_soon_threadsafe(self._start, poller)
+        return poller
+
+    async def get(self, exchange_name: str, contract_type: str, wait: float = FUNDING_FIRST_WAIT) -> Optional[ContractTable]:
+        """
+        返回最新的合约表，还没有数据时返回 None
+        第一次请求最多等待 wait 秒拿第一份数据，之后只读缓存
+        """
+        poller = self.ensure(exchange_name, contract_type)
+        if poller is None:
+            return None
+        if not poller.ready.is_set() and wait > 0:
+            try:
+                await asyncio.wait_for(poller.ready.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        return poller.table
+
+    async def stop(self) -> None:
+        tasks = [p.task for p in self._pollers.values() if p.task is not None and not p.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+CONTRACT_CACHE = ContractCache()
+
+
+async def start_contract_pollers() -> None:
+    """应用启动时调用：绑定事件循环，启动 FUNDING_POLL_EXCHANGES 中配置的常驻轮询"""
+    CONTRACT_CACHE.bind_loop(asyncio.get_running_loop())
+    for item in os.getenv("FUNDING_POLL_EXCHANGES", "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        exchange_name, _, contract_type = item.partition(":")
+        CONTRACT_CACHE.ensure(exchange_name.lower(), contract_type or "linear", persistent=True)
+
+
+async def stop_contract_pollers() -> None:
+    await CONTRACT_CACHE.stop()
@@ -1,29 +1,49 @@
+"""
+异步 ccxt 客户端池 + 进程内共享的市场缓存
+
+- get_client：按 (exchange, key) 复用异步实例（同一个 aiohttp 会话，连接可复用），
+  不用每个请求都新建实例、重新握手
+- load_markets：同一 (exchange, key) 的 load_markets 单飞执行，结果按 MARKETS_TTL 秒缓存，
+  同 key 的其他实例（包括每个请求新建的临时实例）直接共享已解析的市场结构
+  （set_markets_from_exchange），不访问交易所，也不重新解析（上千个市场 set_markets 要几百毫秒）；
+  缓存过期后的重新加载按后台优先级排队（utils/rate_limiter.py），冷启动加载仍按触发它的请求的优先级
+- close_all：应用退出时关闭全部池化实例
+
+环境变量：
+    MARKETS_TTL   市场缓存有效期（秒），默认 3600
+"""
+import asyncio
+import os
+import time
+from contextlib import nullcontext
+from typing import Dict, Optional, Tuple
+
 import ccxt.async_support as ccxt_async
 
+from utils.rate_limiter import background_priority
+
+MARKETS_TTL = float(os.getenv("MARKETS_TTL", "3600"))
+
 
 #  方案B和C可以完美支持异步接口
 class ExchangeManager:
     _instances = {}
 
+    # (exchange_id, key) -> 池化的异步实例
+    _clients: Dict[Tuple[str, str], ccxt_async.Exchange] = {}
+    # (exchange_id, key) -> (加载时间, 已加载市场的实例)
+    _markets: Dict[Tuple[str, str], Tuple[float, ccxt_async.Exchange]] = {}
+    _markets_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
     @classmethod
     async def get_exchange(cls, exchange_id: str):
         exchange_id = exchange_id.lower()
         if exchange_id not in cls._instances:
             ex_class = getattr(ccxt_async, exchange_id)
 
-            # 💡 针对异步版的终极代理配置
-            proxy_url = "http://127.0.0.1:7890"
+            # 代理出口由代理池分配（utils/proxy_pool.py，经 ccxt_patch 注入）
             config = {
                 "enableRateLimit": True,
-                # 方案 A: 标准 proxies
-                # "proxies": {
-                #     "http": proxy_url,
-                #     "https": proxy_url,
-                # },
-                # # 方案 B: 强制指定 aiohttp 代理（有些环境只认这个）
-                "aiohttp_proxy": proxy_url,
-                # 方案 C: CCXT 内部属性
-                # "httpsProxy": proxy_url,
                 "options": {"defaultType": "spot"},
                 "timeout": 30000,
             }
@@ -34,3 +54,52 @@ class ExchangeManager:
             cls._instances[exchange_id] = instance
 
         return cls._instances[exchange_id]
+
+    @classmethod
+    def get_client(cls, exchange_id: str, key: str = "default", config: Optional[dict] = None) -> ccxt_async.Exchange:
+        """
+        取池化的异步实例；key 区分同一交易所的不同配置（如合约 linear / inverse）
+        交易所不存在时抛 ValueError
+        """
+        pool_key = (exchange_id, key)
+        client = cls._clients.get(pool_key)
+        if client is None:
+            ex_class = getattr(ccxt_async, exchange_id, None)
+            if ex_class is None:
+                raise ValueError(f"CCXT不支持的交易所名称: {exchange_id}（请检查拼写，小写）")
+            client = ex_class(dict(config or {}))
+            cls._clients[pool_key] = client
+        return client
+
+    @classmethod
+    async def load_markets(cls, ex: ccxt_async.Exchange, key: str = "default", params: Optional[dict] = None) -> dict:
+        """带共享缓存的 load_markets：并发的冷启动只请求一次交易所"""
+        cache_key = (ex.id, key)
+        cached = cls._markets.get(cache_key)
+        if cached is None or time.monotonic() - cached[0] > MARKETS_TTL:
+            lock = cls._markets_locks.setdefault(cache_key, asyncio.Lock())
+            async with lock:
+                cached = cls._markets.get(cache_key)
+                if cached is None or time.monotonic() - cached[0] > MARKETS_TTL:
+                    # TTL 到期的刷新是后台工作，不和用户请求抢限速额度
+                    with background_priority() if cached is not None else nullcontext():
+                        await ex.load_markets(reload=cached is not None, params=params or {})
+                    cached = (time.monotonic(), ex)
+                    cls._markets[cache_key] = cached
+        if getattr(ex, "_shared_markets_at", None) != cached[0]:
+            if ex is not cached[1]:
+                ex.set_markets_from_exchange(cached[1])
+            ex._shared_markets_at = cached[0]
+        return ex.markets
+
+    @classmethod
+    async def close_all(cls) -> None:
+        clients = list(cls._clients.values()) + list(cls._instances.values())
+        cls._clients.clear()
+        cls._instances.clear()
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+
+async def load_rest_markets(ex: ccxt_async.Exchange, market_type: str = "spot") -> dict:
+    """REST 路由（每个请求新建实例）走共享市场缓存的 load_markets，按 defaultType 区分"""
+    return await ExchangeManager.load_markets(ex, key=f"rest:{market_type}")
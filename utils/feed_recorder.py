@@ -0,0 +1,146 @@
+"""
+上游行情录制
+
+把 watch_ticker / watch_order_book 的原始结果追加写入文件，用于复现线上问题、
+以及用真实流量形态做基准（回放见 utils/replay_exchange.py）。
+
+开启：设置环境变量 FEED_RECORD_PATH（可包含 {pid}，多 worker 时每个进程一个文件）
+    FEED_RECORD_DEPTH   盘口录制档数，默认 50
+
+文件格式：每行一个 JSON 数组（orjson 编码），只追加
+    [接收时间 ms, exchange, method, symbol, data]
+
+- 事件循环里只做一次浅拷贝 + 入队，编码和写文件在后台线程
+- 队列满时丢弃并计数，不阻塞行情处理
+"""
+import atexit
+import inspect
+import logging
+import os
+import queue
+import threading
+import time
+from functools import wraps
+from typing import Any, Optional
+
+from utils.json_response import dumps
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# 录制的方法
+RECORDED_METHODS = ("watch_ticker", "watch_order_book")
+
+# 回放出来的数据不再录制
+SKIP_EXCHANGES = {"replay"}
+
+FEED_RECORDED = Counter(
+    "feed_records_total",
+    "已录制的行情条数",
+    ("exchange", "method"),
+)
+FEED_RECORD_DROPPED = Counter(
+    "feed_records_dropped_total",
+    "录制队列已满被丢弃的行情条数",
+    ("exchange",),
+)
+
+
+class FeedRecorder:
+    """后台线程批量写文件的录制器"""
+
+    def __init__(self, path: str, depth: int = 50, max_queue: int = 100000):
+        self.path = path
+        self.depth = depth
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="feed-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, exchange_id: str, method: str, symbol: str, data: Any) -> None:
+        try:
+            self._queue.put_nowait((round(time.time() * 1000, 3), exchange_id, method, symbol, data))
+        except queue.Full:
+            FEED_RECORD_DROPPED.inc(exchange_id)
+            return
+        FEED_RECORDED.inc(exchange_id, method)
+
+    def snapshot(self, method: str, result: Any) -> Any:
+        """拷贝一份当前结果：ccxt.pro 会在下一次更新时原地修改 orderbook"""
+        if method == "watch_order_book":
+            return {
+                "bids": [list(level) for level in result["bids"][: self.depth]],
+                "asks": [list(level) for level in result["asks"][: self.depth]],
+                "timestamp": result.get("timestamp"),
+                "nonce": result.get("nonce"),
+            }
+        return dict(result)
+
+    def _run(self) -> None:
+        with open(self.path, "ab") as f:
+            while True:
+                item = self._queue.get()
+                batch = []
+                while item is not None:
+                    batch.append(dumps(list(item)))
+                    if len(batch) >= 1000:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    batch.append(b"")
+                    f.write(b"\n".join(batch))
+                    f.flush()
+                if item is None:
+                    return
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+_recorder: Optional[FeedRecorder] = None
+_tapped_classes = set()
+
+
+def get_recorder() -> Optional[FeedRecorder]:
+    """按环境变量创建进程内唯一的录制器，未开启时返回 None"""
+    global _recorder
+    if _recorder is None:
+        path = os.getenv("FEED_RECORD_PATH")
+        if not path:
+            return None
+        path = path.format(pid=os.getpid())
+        _recorder = FeedRecorder(path, depth=int(os.getenv("FEED_RECORD_DEPTH", "50")))
+        atexit.register(_recorder.close)
+        logger.info(f"行情录制已开启: {path}")
+    return _recorder
+
+
+def _tap(method: str, fn):
+    @wraps(fn)
+    async def wrapper(self, symbol, *args, **kwargs):
+        result = await fn(self, symbol, *args, **kwargs)
+        if _recorder is not None and self.id not in SKIP_EXCHANGES:
+            _recorder.record(self.id, method, result.get("symbol") or symbol, _recorder.snapshot(method, result))
+        return result
+
+    wrapper.__feed_tapped__ = True
+    return wrapper
+
+
+def tap_exchange_class(cls) -> None:
+    """
+    给交易所类的 watch_ticker / watch_order_book 挂录制钩子
+    未开启录制时什么都不做；每个类只处理一次
+    """
+    if get_recorder() is None or cls in _tapped_classes:
+        return
+    _tapped_classes.add(cls)
+
+    for method in RECORDED_METHODS:
+        fn = getattr(cls, method, None)
+        if not inspect.iscoroutinefunction(fn) or getattr(fn, "__feed_tapped__", False):
+            continue
+        setattr(cls, method, _tap(method, fn))
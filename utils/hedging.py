@@ -0,0 +1,210 @@
+"""
+对冲上游请求：压低 /api/ticker、/api/orderbook 的长尾延迟
+
+这两个接口的中位数正常，p99 主要来自偶发的慢代理 / 慢交易所响应。开启 HEDGE_ENABLED 后：
+
+- 按 (交易所, 方法) 记录最近 HEDGE_WINDOW 次上游调用的耗时，
+  对冲延迟取其 HEDGE_PERCENTILE 分位数（限制在 HEDGE_MIN_DELAY_MS ~ HEDGE_MAX_DELAY_MS；
+  样本不足 HEDGE_MIN_SAMPLES 时用上限）
+- 主请求超过这个延迟还没返回，就用另一个实例再发一次相同请求：优先换到代理池里的另一个
+  出口（utils/proxy_pool.py），没有其他可用出口时走同一出口的新实例；先成功返回的结果胜出，另一个取消
+- 不突破限速：对冲请求同样经过全局限速调度（utils/rate_limiter.py），且只在目标出口的令牌桶
+  能立即放行时才发；另外每次主请求积累 HEDGE_MAX_RATIO 个对冲名额，对冲总数不超过主请求的这个比例
+- 同步 ccxt 在线程池里执行，输掉的一方只是不再等待，线程里的请求照常跑完
+
+环境变量：
+    HEDGE_ENABLED         设为 1 时开启，默认关闭
+    HEDGE_PERCENTILE      默认 0.95
+    HEDGE_MIN_DELAY_MS    默认 50
+    HEDGE_MAX_DELAY_MS    默认 2000
+    HEDGE_MIN_SAMPLES     默认 20
+    HEDGE_WINDOW          默认 200
+    HEDGE_MAX_RATIO       默认 0.1
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import Counter
+from utils.proxy_pool import PROXY_POOL, apply_proxy, egress_of
+from utils.rate_limiter import SCHEDULER
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_MAX_DELAY_MS = float(os.getenv("HEDGE_MAX_DELAY_MS", "2000"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+
+# 对冲名额最多攒多少个（突发的慢请求可以连续对冲几次）
+HEDGE_BURST = 10.0
+
+HEDGE_FIRED = Counter(
+    "hedge_fired_total",
+    "发出的对冲请求数，route 为 alternate（换出口）/ same（同出口新实例）",
+    ("exchange", "method", "route"),
+)
+HEDGE_WON = Counter(
+    "hedge_won_total",
+    "对冲请求先于主请求成功返回的次数",
+    ("exchange", "method"),
+)
+HEDGE_SKIPPED = Counter(
+    "hedge_skipped_total",
+    "到了对冲延迟但没有发对冲的次数，reason 为 budget（超出对冲比例）/ ratelimit（目标出口需要排队）",
+    ("exchange", "method", "reason"),
+)
+
+
+class HedgeStats:
+    """单个 (交易所, 方法) 的耗时窗口和对冲名额"""
+
+    def __init__(self):
+        self.samples: deque = deque(maxlen=HEDGE_WINDOW)
+        self.budget = 1.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def delay(self) -> float:
+        """对冲延迟（秒）"""
+        with self._lock:
+            samples = sorted(self.samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_MAX_DELAY_MS / 1000
+        value = samples[min(int(len(samples) * HEDGE_PERCENTILE), len(samples) - 1)]
+        return min(max(value, HEDGE_MIN_DELAY_MS / 1000), HEDGE_MAX_DELAY_MS / 1000)
+
+    def earn(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.budget = min(self.budget + HEDGE_MAX_RATIO, HEDGE_BURST)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.budget < 1:
+                return False
+            self.budget -= 1
+            return True
+
+
+_stats: Dict[Tuple[str, str], HedgeStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _get_stats(exchange_id: str, method: str) -> HedgeStats:
+    key = (exchange_id, method)
+    stats = _stats.get(key)
+    if stats is None:
+        with _stats_lock:
+            stats = _stats.setdefault(key, HedgeStats())
+    return stats
+
+
+def hedge_report() -> List[Dict[str, Any]]:
+    rows = []
+    for (exchange_id, method), stats in sorted(_stats.items()):
+        rows.append({
+            "exchange": exchange_id,
+            "method": method,
+            "calls": stats.calls,
+            "samples": len(stats.samples),
+            "delay_ms": round(stats.delay() * 1000, 1),
+            "budget": round(stats.budget, 2),
+        })
+    return rows
+
+
+def hedge_instance(ex_class, route: Optional[str], primary=None, config: Optional[dict] = None):
+    """
+    创建对冲用的实例：走 route 出口，共用主实例已加载的市场（不再 load_markets）
+    route 为 None 时保持代理池给新实例分配的出口
+    """
+    # 主实例的 config 已被 ccxt_patch 写入共享会话，去掉后由补丁重新注入（才会把 timeout_on_exit 置 0）
+    config = {k: v for k, v in (config or {"enableRateLimit": True}).items() if k != "session"}
+    ex = ex_class(config)
+    if route is not None:
+        apply_proxy(ex, route)
+    if primary is not None and primary.markets:
+        ex.set_markets_from_exchange(primary)
+    return ex
+
+
+def _settle(tasks) -> None:
+    """取走已结束任务的异常，避免 "exception was never retrieved" """
+    for task in tasks:
+        if task.done() and not task.cancelled():
+            task.exception()
+
+
+async def hedged(
+    ex,
+    method: str,
+    primary: Callable[[], Awaitable[Any]],
+    hedge: Callable[[Optional[str]], Awaitable[Any]],
+) -> Any:
+    """
+    执行 primary()；超过对冲延迟仍未返回时再执行 hedge(route)，返回先成功的结果
+    ex 是主请求用的实例（用于确定交易所和当前出口）；两边都失败时抛主请求的异常
+    """
+    if not HEDGE_ENABLED:
+        return await primary()
+
+    stats = _get_stats(ex.id, method)
+    stats.earn()
+    started = time.monotonic()
+    first = asyncio.ensure_future(primary())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=stats.delay())
+        if done:
+            if first.exception() is None:
+                stats.observe(time.monotonic() - started)
+            return first.result()
+
+        current = egress_of(ex)
+        route = PROXY_POOL.alternate(ex.id, current) if current is not None else None
+        # 先看限速再扣名额：发不出去的对冲不消耗 HEDGE_MAX_RATIO 名额
+        if not SCHEDULER.has_headroom(ex.id, route if route is not None else current):
+            HEDGE_SKIPPED.inc(ex.id, method, "ratelimit")
+            return await _finish_primary(first, stats, started)
+        if not stats.spend():
+            HEDGE_SKIPPED.inc(ex.id, method, "budget")
+            return await _finish_primary(first, stats, started)
+
+        HEDGE_FIRED.inc(ex.id, method, "alternate" if route is not None else "same")
+        second = asyncio.ensure_future(hedge(route))
+        tasks.add(second)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    continue
+                # 主请求的耗时至少是到现在为止（被对冲赢了也记下，窗口才能反映慢请求）
+                stats.observe(time.monotonic() - started)
+                if task is second:
+                    HEDGE_WON.inc(ex.id, method)
+                return task.result()
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        _settle(tasks)
+
+
+async def _finish_primary(first: asyncio.Future, stats: HedgeStats, started: float) -> Any:
+    result = await first
+    stats.observe(time.monotonic() - started)
+    return result
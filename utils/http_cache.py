@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from utils.json_response import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    判断请求头 If-None-Match 是否命中当前 ETag
+    按 RFC 7232，If-None-Match 使用弱比较：忽略 W/ 前缀，支持逗号分隔多个值和 "*"
+    """
+    if not if_none_match or not etag:
+        return False
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def make_etag(body: bytes) -> str:
+    """根据响应字节计算强 ETag（内容不变则 ETag 不变）"""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class StaticResponse:
+    """
+    进程内只计算一次的静态 JSON 响应
+    - 启动时调用 builder 生成 payload，并一次性编码成 bytes + 强 ETag
+    - 之后每次请求直接返回预编码的 bytes，不再走 dict 构建 / jsonable_encoder / json.dumps
+    - 请求携带匹配的 If-None-Match 时直接返回 304
+
+    用法：
+        EXCHANGES = register_static_response("exchanges", build_payload)
+
+        @router.get("/exchanges")
+        async def get_exchanges(request: Request):
+            return EXCHANGES.respond(request)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        builder: Callable[[], Any],
+        cache_control: str = "public, max-age=3600",
+    ):
+        self.name = name
+        self.cache_control = cache_control
+        self._builder = builder
+        self.body: bytes = b""
+        self.etag: str = ""
+        self.built = False
+
+    def build(self) -> None:
+        payload = self._builder()
+        self.body = dumps(payload)
+        self.etag = make_etag(self.body)
+        self.built = True
+        logger.info(
+            "静态响应已预编码: %s (%d bytes, etag=%s)", self.name, len(self.body), self.etag
+        )
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"ETag": self.etag, "Cache-Control": self.cache_control}
+
+    def respond(self, request: Request) -> Response:
+        if not self.built:
+            # 兜底：未经过启动阶段（如单独挂载路由）时在首个请求时构建
+            self.build()
+
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=self.headers)
+
+        return Response(
+            content=self.body, media_type="application/json", headers=self.headers
+        )
+
+
+# 全局注册表：启动时统一预编码
+STATIC_RESPONSES: List[StaticResponse] = []
+
+
+def register_static_response(
+    name: str,
+    builder: Callable[[], Any],
+    cache_control: str = "public, max-age=3600",
+) -> StaticResponse:
+    static = StaticResponse(name, builder, cache_control)
+    STATIC_RESPONSES.append(static)
+    return static
+
+
+def build_static_responses() -> None:
+    """在应用启动阶段预编码所有已注册的静态响应"""
+    for static in STATIC_RESPONSES:
+        try:
+            static.build()
+        except Exception as e:
+            # 构建失败不阻塞启动，首个请求时会再尝试一次
+            logger.error(f"静态响应预编码失败 {static.name}: {str(e)}")
+
+
+# =======================================================================
+# 条件请求 + Cache-Control（动态行情接口）
+# =======================================================================
+
+
+class CachePolicy:
+    """
+    单个接口的 HTTP 缓存策略
+    - max_age: 客户端 / CDN 认为响应新鲜的秒数
+    - stale_while_revalidate: 过期后仍可先返回旧数据、后台再校验的秒数
+    """
+
+    def __init__(self, max_age: int, stale_while_revalidate: int = 0, public: bool = True):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.public = public
+
+    @property
+    def header(self) -> str:
+        parts = ["public" if self.public else "private", f"max-age={self.max_age}"]
+        if self.stale_while_revalidate:
+            parts.append(f"stale-while-revalidate={self.stale_while_revalidate}")
+        return ", ".join(parts)
+
+
+class ConditionalCache:
+    """
+    记录每个资源（按查询参数组成的 key）最近一次响应的 ETag 和新鲜期
+
+    请求进入时先调用 not_modified()：
+        如果 If-None-Match 命中、且该 ETag 仍在 max-age 内，直接返回 304，
+        不创建交易所实例、不访问上游
+    成功拿到数据后调用 apply()：
+        根据数据版本（时间戳 / 内容）计算 ETag，写入 ETag + Cache-Control 响应头并记录
+    """
+
+    def __init__(self, name: str, policy: CachePolicy, max_entries: int = 10000):
+        self.name = name
+        self.policy = policy
+        self.max_entries = max_entries
+        # key -> (etag, 新鲜期截止时间 monotonic, 命中时返回的 Cache-Control)
+        self._entries: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+
+    def not_modified(self, request: Request, key: str) -> Optional[Response]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        etag, fresh_until, cache_control = entry
+        if time.monotonic() >= fresh_until:
+            return None
+
+        if not etag_matches(request.headers.get("if-none-match"), etag):
+            return None
+
+        return Response(
+            status_code=304, headers={"ETag": etag, "Cache-Control": cache_control}
+        )
+
+    def apply(
+        self,
+        response: Response,
+        key: str,
+        payload: Any = None,
+        version: Any = None,
+        policy: Optional[CachePolicy] = None,
+    ) -> str:
+        """
+        写入缓存响应头并记录 ETag
+        - version: 数据版本（如最后一根 K 线时间戳）；不传时使用 payload["data"] 的内容哈希
+        - policy: 覆盖默认策略（如已收盘 K 线使用更长的 max-age）
+        """
+        policy = policy or self.policy
+
+        if version is None:
+            data = payload.get("data") if isinstance(payload, dict) else payload
+            raw_version = dumps(data)
+        else:
+            raw_version = repr(version).encode("utf-8")
+        digest = hashlib.sha1(key.encode("utf-8") + b"|" + raw_version).hexdigest()
+        etag = f'"{digest}"'
+
+        cache_control = policy.header
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = cache_control
+
+        self._entries[key] = (etag, time.monotonic() + policy.max_age, cache_control)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        return etag
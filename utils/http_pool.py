@@ -0,0 +1,135 @@
+"""
+共享 HTTP 连接池：所有 ccxt.async_support REST 实例共用一个 aiohttp 会话
+
+ccxt 异步实例默认各自创建 aiohttp 会话和连接器，路由里每个请求新建实例、用完 close，
+于是每个请求都要重新建 TCP 连接、TLS 握手、经代理 CONNECT，close 时还固定 sleep 250ms
+（timeout_on_exit，等自己的连接器关闭）。这里：
+
+- 每个事件循环一个 ClientSession + TCPConnector：keep-alive 连接池、总连接数 / 单 host 连接数上限、
+  DNS 缓存；经 aiohttp_proxy 的 CONNECT 隧道同样按 (host, proxy) 复用
+- ccxt_patch 创建异步实例时注入 session（ccxt 不会关闭外部传入的会话），并把 timeout_on_exit 置 0
+- ccxt.pro 实例不注入：WS 长连接会占住连接池名额
+- TraceConfig 统计新建 / 复用的连接数和 DNS 缓存命中，/metrics 导出，复用率 = reused / (reused + created)
+
+环境变量：
+    HTTP_POOL_ENABLED      设为 0 时恢复 ccxt 默认（每个实例自己的会话）
+    HTTP_POOL_LIMIT        总连接数上限，默认 200
+    HTTP_POOL_PER_HOST     单 host 连接数上限，默认 32
+    HTTP_KEEPALIVE         空闲连接保留秒数，默认 30
+    HTTP_DNS_TTL           DNS 缓存秒数，默认 300
+"""
+import asyncio
+import logging
+import os
+import ssl
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import aiohttp
+import certifi
+
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_ENABLED = os.getenv("HTTP_POOL_ENABLED", "1") != "0"
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "200"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "32"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "30"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+
+HTTP_CONNECTIONS = Counter(
+    "http_pool_connections_total",
+    "共享连接池取连接次数，outcome 为 created（新建）或 reused（复用 keep-alive 连接）",
+    ("host", "outcome"),
+)
+HTTP_DNS = Counter(
+    "http_pool_dns_total",
+    "共享连接池 DNS 解析，outcome 为 hit（缓存命中）或 miss",
+    ("outcome",),
+)
+
+# 事件循环 -> 共享会话
+_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+
+def _host(ctx: SimpleNamespace) -> str:
+    return getattr(ctx, "host", None) or "unknown"
+
+
+async def _on_request_start(session, ctx, params: aiohttp.TraceRequestStartParams) -> None:
+    ctx.host = params.url.host
+
+
+async def _on_connection_create_end(session, ctx, params) -> None:
+    HTTP_CONNECTIONS.inc(_host(ctx), "created")
+
+
+async def _on_connection_reuseconn(session, ctx, params) -> None:
+    HTTP_CONNECTIONS.inc(_host(ctx), "reused")
+
+
+async def _on_dns_cache_hit(session, ctx, params) -> None:
+    HTTP_DNS.inc("hit")
+
+
+async def _on_dns_cache_miss(session, ctx, params) -> None:
+    HTTP_DNS.inc("miss")
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_connection_create_end.append(_on_connection_create_end)
+    trace.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace.on_dns_cache_hit.append(_on_dns_cache_hit)
+    trace.on_dns_cache_miss.append(_on_dns_cache_miss)
+    return trace
+
+
+def shared_session() -> Optional[aiohttp.ClientSession]:
+    """当前事件循环的共享会话；不在事件循环内（或已关闭连接池）时返回 None"""
+    if not HTTP_POOL_ENABLED:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        # 与 ccxt 默认一致：certifi 证书
+        connector = aiohttp.TCPConnector(
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            use_dns_cache=True,
+            enable_cleanup_closed=True,
+        )
+        session = aiohttp.ClientSession(connector=connector, trace_configs=[_trace_config()])
+        _sessions[loop] = session
+    return session
+
+
+def attach_shared_session(exchange_class: type, config: dict) -> bool:
+    """
+    创建 ccxt 异步实例前调用：注入共享会话，返回是否注入
+    调用方自己传了 session、关闭了证书校验或要求 trust_env 时不注入；ccxt.pro 实例不注入
+    """
+    if "session" in config or config.get("verify") is False or config.get("aiohttp_trust_env"):
+        return False
+    if exchange_class.__module__.startswith("ccxt.pro."):
+        return False
+    session = shared_session()
+    if session is None:
+        return False
+    config["session"] = session
+    return True
+
+
+async def close_http_sessions() -> None:
+    """应用退出时调用"""
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
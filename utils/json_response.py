@@ -0,0 +1,105 @@
+import asyncio
+import inspect
+import json
+from functools import wraps
+from typing import Any, Callable
+
+from fastapi import Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+
+# orjson 为可选依赖：未安装时退回标准库 json（行为一致，只是更慢）
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        """把已是 JSON 安全结构的数据直接编码为 UTF-8 bytes（紧凑格式）"""
+        return orjson.dumps(content, default=str, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+
+else:
+
+    def dumps(content: Any) -> bytes:
+        """把已是 JSON 安全结构的数据直接编码为 UTF-8 bytes（紧凑格式）"""
+        return json.dumps(
+            content, ensure_ascii=False, separators=(",", ":"), default=str
+        ).encode("utf-8")
+
+    loads = json.loads
+
+
+class FastJSONResponse(Response):
+    """基于 orjson 的 JSON 响应，直接编码，不经过 jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _to_fast_response(content: Any, kwargs: dict) -> Response:
+    if isinstance(content, Response):
+        return content
+
+    response = FastJSONResponse(content)
+
+    # 合并处理函数通过注入的 Response 参数设置的状态码 / 响应头（如 ETag、Cache-Control）
+    for value in kwargs.values():
+        if isinstance(value, Response):
+            if value.status_code:
+                response.status_code = value.status_code
+            response.raw_headers.extend(value.raw_headers)
+            break
+
+    return response
+
+
+def _fast_json_endpoint(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    # functools.wraps 保留 __wrapped__，FastAPI 解析参数时仍使用原函数签名
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            return _to_fast_response(await endpoint(*args, **kwargs), kwargs)
+
+        return async_wrapper
+
+    @wraps(endpoint)
+    def sync_wrapper(*args, **kwargs):
+        return _to_fast_response(endpoint(*args, **kwargs), kwargs)
+
+    return sync_wrapper
+
+
+class FastJSONRoute(APIRoute):
+    """
+    REST 路由类：处理函数返回 dict / list 时直接用 FastJSONResponse 编码
+
+    FastAPI 默认会先对返回值做一次 jsonable_encoder 递归遍历，再交给 json.dumps，
+    对 /api/pairs、/api/ohlc 这类大响应开销明显。我们的处理函数返回的本来就是
+    JSON 安全的数据（来自 ccxt 的 dict / list / 数字 / 字符串），可以跳过这次遍历。
+
+    声明了 response_model 或返回类型注解的路由仍走 FastAPI 默认的校验 + 序列化流程。
+
+    用法：
+        router = APIRouter(route_class=FastJSONRoute)
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        response_model = kwargs.get("response_model")
+        has_model = response_model is not None and not isinstance(
+            response_model, DefaultPlaceholder
+        )
+        has_annotation = (
+            inspect.signature(endpoint).return_annotation is not inspect.Signature.empty
+        )
+        if not has_model and not has_annotation:
+            endpoint = _fast_json_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
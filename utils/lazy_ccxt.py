@@ -0,0 +1,122 @@
+"""
+ccxt 按需导入
+
+ccxt、ccxt.async_support、ccxt.pro 三个包的 __init__ 会把 100 多个交易所类全部导入，
+进程启动（每个 worker）要多花约 1 秒和几十 MB 常驻内存，而实际用到的通常只有几个交易所。
+
+install_lazy_ccxt() 在导入 ccxt 之前调用，接管这三个包的初始化：
+- 照常执行包的 __init__，只是跳过 `from ccxt.<交易所> import <交易所>` 这类导入
+  （版本号、Exchange 基类、错误类型、exchanges 列表等都不变）
+- 第一次访问 ccxt.binance / ccxt_async.okx ... 时才导入对应模块
+- 不在 exchanges 列表里的名字照常抛 AttributeError，getattr(ccxt, name, None) 的用法不受影响
+
+环境变量：
+    CCXT_LAZY_IMPORT   设为 0 时恢复 ccxt 默认的全部导入
+"""
+import ast
+import importlib
+import importlib.abc
+import importlib.machinery
+import logging
+import os
+import sys
+import types
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LAZY_PACKAGES = ("ccxt", "ccxt.async_support", "ccxt.pro")
+
+
+class LazyExchangeModule(types.ModuleType):
+    """交易所类按需导入的包模块"""
+
+    def __getattr__(self, name: str):
+        if name.startswith("__") or name not in self.__dict__.get("_lazy_exchanges", ()):
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        module = importlib.import_module(f"{self.__name__}.{name}")
+        return getattr(module, name)
+
+    def __setattr__(self, name: str, value):
+        # 导入子模块 ccxt.binance 时，导入系统会把模块对象挂到父包上，
+        # 而原 __init__ 在同名位置放的是交易所类，这里保持一致
+        if (
+            isinstance(value, types.ModuleType)
+            and name in self.__dict__.get("_lazy_exchanges", ())
+            and value.__name__ == f"{self.__name__}.{name}"
+        ):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self.__dict__.get("_lazy_exchanges", ())))
+
+
+def _strip_exchange_imports(source: str, package: str, filename: str):
+    """去掉 `from <package>.<x> import <x>` 形式的交易所导入，返回 (code, 交易所名集合)"""
+    tree = ast.parse(source, filename)
+    body = []
+    skipped = set()
+    prefix = package + "."
+    for node in tree.body:
+        if (
+            isinstance(node, ast.ImportFrom)
+            and node.level == 0
+            and node.module
+            and node.module.startswith(prefix)
+            and "." not in node.module[len(prefix):]
+            and len(node.names) == 1
+            and node.names[0].name == node.module[len(prefix):]
+            and node.names[0].asname is None
+        ):
+            skipped.add(node.names[0].name)
+            continue
+        body.append(node)
+    tree.body = body
+    return compile(tree, filename, "exec"), skipped
+
+
+class _LazyPackageLoader(importlib.abc.Loader):
+    def __init__(self, origin: str):
+        self.origin = origin
+
+    def create_module(self, spec):
+        return LazyExchangeModule(spec.name)
+
+    def exec_module(self, module):
+        with open(self.origin, encoding="utf-8") as f:
+            source = f.read()
+        code, skipped = _strip_exchange_imports(source, module.__name__, self.origin)
+        module.__dict__["_lazy_exchanges"] = frozenset()
+        exec(code, module.__dict__)
+        # 只有 exchanges 列表里的名字按需导入
+        module.__dict__["_lazy_exchanges"] = frozenset(skipped & set(module.__dict__.get("exchanges", ())))
+
+
+class _LazyPackageFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in LAZY_PACKAGES:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or spec.origin is None:
+            return None
+        spec.loader = _LazyPackageLoader(spec.origin)
+        return spec
+
+
+_finder: Optional[_LazyPackageFinder] = None
+
+
+def install_lazy_ccxt() -> bool:
+    """必须在任何 ccxt 导入之前调用；ccxt 已经导入时不生效"""
+    global _finder
+    if os.getenv("CCXT_LAZY_IMPORT", "1") == "0":
+        return False
+    if _finder is not None:
+        return True
+    if any(name in sys.modules for name in LAZY_PACKAGES):
+        logger.warning("ccxt 已导入，按需导入未生效")
+        return False
+    _finder = _LazyPackageFinder()
+    sys.meta_path.insert(0, _finder)
+    return True
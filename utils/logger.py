@@ -1,7 +1,25 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import random
 import sys
 import json
-from typing import Any
+import time
+from typing import Any, Dict, Optional
+
+from utils.metrics import Counter
+
+# 日志队列满时丢弃的条数（说明日志量已超过输出能力）
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "日志队列已满被丢弃的日志条数",
+)
+
+# 队列上限：写 stdout 跟不上时丢弃，而不是让事件循环阻塞或内存无限增长
+LOG_QUEUE_SIZE = 10000
+
+_listener: Optional[logging.handlers.QueueListener] = None
 
 
 class PrettyFormatter(logging.Formatter):
@@ -26,7 +44,27 @@ class PrettyFormatter(logging.Formatter):
         return super().format(record)
 
 
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把 LogRecord 放进队列，格式化和写 stdout 都在后台线程完成
+    - 不在调用方线程做 msg % args / json.dumps，事件循环只付出一次入队的开销
+    - 队列满时直接丢弃并计数，不阻塞调用方
+    注意：参数对象会在后台线程格式化，记录之后不要再原地修改它
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
 def setup_logging(level: int = logging.INFO):
+    global _listener
+
     handler = logging.StreamHandler(sys.stdout)
     handler.setLevel(level)
 
@@ -35,10 +73,104 @@ def setup_logging(level: int = logging.INFO):
     )
     handler.setFormatter(formatter)
 
+    # 重复调用时先停掉旧的后台线程（会先写完队列里剩余的日志）
+    if _listener is not None:
+        _listener.stop()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+    _listener.start()
+
     root = logging.getLogger()
     root.setLevel(level)
     root.handlers.clear()
-    root.addHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+
+    # uvicorn 自带的 handler 在事件循环里同步写 stdout（access log 每个请求一条），
+    # 改为走根 logger 的队列
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+# 进程退出前把队列中剩余日志写完
+atexit.register(_stop_listener)
+
+
+class LazyPretty:
+    """延迟到真正输出时才 json.dumps(indent=2) 的包装对象"""
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        if isinstance(self.payload, (dict, list)):
+            return json.dumps(self.payload, indent=2, ensure_ascii=False, default=str)
+        return str(self.payload)
+
+
+class SampledLogger:
+    """
+    单个调用点的限频 + 采样日志，用于行情推送这类高频路径
+
+    - interval: 同一个 key 两条日志之间的最小间隔（秒），期间的日志被抑制
+    - sample_rate: 通过限频后再按概率采样（1.0 表示不采样）
+    - 级别未开启时直接返回，参数不会被格式化
+    - 下一条输出的日志会带上期间被抑制的条数
+
+    用法：
+        _push_log = SampledLogger(logger, interval=5.0)
+        _push_log.debug("📤 %s 更新推送: %s", symbol, LazyPretty(payload), key=symbol)
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = 1.0, sample_rate: float = 1.0):
+        self.logger = logger
+        self.interval = interval
+        self.sample_rate = sample_rate
+        # key -> [上次输出时间, 抑制条数]
+        self._state: Dict[Any, list] = {}
+
+    def log(self, level: int, msg: str, *args: Any, key: Any = None) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+
+        now = time.monotonic()
+        state = self._state.get(key)
+        if state is None:
+            state = self._state[key] = [float("-inf"), 0]
+
+        if now - state[0] < self.interval or (
+            self.sample_rate < 1.0 and random.random() >= self.sample_rate
+        ):
+            state[1] += 1
+            return
+
+        suppressed = state[1]
+        state[0] = now
+        state[1] = 0
+        if suppressed:
+            self.logger.log(level, msg + " (+%d suppressed)", *args, suppressed, stacklevel=3)
+        else:
+            self.logger.log(level, msg, *args, stacklevel=3)
+
+    def debug(self, msg: str, *args: Any, key: Any = None) -> None:
+        self.log(logging.DEBUG, msg, *args, key=key)
+
+    def info(self, msg: str, *args: Any, key: Any = None) -> None:
+        self.log(logging.INFO, msg, *args, key=key)
+
+    def warning(self, msg: str, *args: Any, key: Any = None) -> None:
+        self.log(logging.WARNING, msg, *args, key=key)
 
 
 def log_pretty(
@@ -49,29 +181,19 @@ def log_pretty(
 ):
     """
     Unified helper for pretty logging complex objects (e.g. ccxt ticker).
+    json.dumps 延迟到后台线程输出时执行，级别未开启时没有任何格式化开销
 
     Usage:
         log_pretty(logger, "ticker raw", ticker_dict)
     """
-    logger.log(
-        level,
-        "%s:\n%s",
-        title,
-        json.dumps(payload, indent=2, ensure_ascii=False, default=str),
-    )
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, "%s:\n%s", title, LazyPretty(payload))
 
-def _logger_pretty(self, payload):
-    if isinstance(payload, (dict, list)):
-        self.info(
-            json.dumps(
-                payload,
-                indent=2,
-                ensure_ascii=False,
-                default=str,
-            )
-        )
-    else:
-        self.info(payload)
+def _logger_pretty(self, payload, level=logging.INFO):
+    if not self.isEnabledFor(level):
+        return
+    self.log(level, "%s", LazyPretty(payload))
 
 
-logging.Logger.pretty = _logger_pretty
\ No newline at end of file
+logging.Logger.pretty = _logger_pretty
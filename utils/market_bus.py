@@ -0,0 +1,324 @@
+"""
+跨 worker 行情总线
+
+多 worker 部署时每个 worker 各自向交易所建立 WebSocket 订阅，N 个 worker 就是 N 倍的
+上游连接和限速消耗。总线模式下由单独的 ingest 进程（python -m ingest）持有全部
+ccxt.pro 订阅，worker 通过 Unix socket 订阅归一化后的行情：
+
+    python -m ingest
+    MARKET_DATA_MODE=bus uvicorn main:app --workers 4
+
+环境变量：
+    MARKET_DATA_MODE            direct（默认，worker 直连交易所）/ bus
+    MARKET_BUS_PATH             Unix socket 路径，默认 /tmp/ccxt-proxy-bus.sock
+    MARKET_BUS_IDLE_UNSUBSCRIBE worker 端某个订阅多久没人 watch 就退订（秒），默认 30
+    MARKET_BUS_BOOK_DEPTH       ingest 发布的盘口档数，默认 50
+    ORDERBOOK_SHM_MAX_AGE_MS    REST 读共享内存盘口时允许的最大数据年龄，默认 5000
+
+帧格式：4 字节大端长度 + orjson 消息
+    worker → ingest   {"op": "sub" | "unsub", "key": "exchange|marketType|method|symbol"}
+    ingest → worker   {"key": ..., "data": ...} 或 {"key": ..., "error": {"type": 异常类名, "msg": ...}}
+                      盘口为 {"key": ..., "shm": "exchange|symbol"}，数据从共享内存读（见 utils/shm_orderbook.py）
+"""
+import asyncio
+import logging
+import os
+import struct
+import time
+from typing import Any, Dict, List, Optional
+
+import ccxt
+import ccxt.pro as ccxt_pro
+
+from utils.json_response import dumps, loads
+from utils.metrics import Counter
+from utils.shm_orderbook import book_key, get_orderbook_reader
+
+logger = logging.getLogger(__name__)
+
+MODE_DIRECT = "direct"
+MODE_BUS = "bus"
+
+BUS_PATH = os.getenv("MARKET_BUS_PATH", "/tmp/ccxt-proxy-bus.sock")
+IDLE_UNSUBSCRIBE = float(os.getenv("MARKET_BUS_IDLE_UNSUBSCRIBE", "30"))
+BOOK_DEPTH = int(os.getenv("MARKET_BUS_BOOK_DEPTH", "50"))
+SHM_MAX_AGE_MS = int(os.getenv("ORDERBOOK_SHM_MAX_AGE_MS", "5000"))
+
+# 总线上转发的方法
+BUS_METHODS = ("watch_ticker", "watch_order_book", "watch_trades", "watch_mark_price")
+
+BUS_MESSAGES = Counter(
+    "market_bus_messages_total",
+    "worker 从行情总线收到的消息数",
+    ("method",),
+)
+BUS_RECONNECTS = Counter(
+    "market_bus_reconnects_total",
+    "worker 与 ingest 进程的重连次数",
+)
+
+_HEADER = struct.Struct(">I")
+
+
+def market_data_mode() -> str:
+    return os.getenv("MARKET_DATA_MODE", MODE_DIRECT).lower()
+
+
+def make_key(exchange_id: str, market_type: str, method: str, symbol: str) -> str:
+    return f"{exchange_id}|{market_type}|{method}|{symbol}"
+
+
+def split_key(key: str):
+    exchange_id, market_type, method, symbol = key.split("|", 3)
+    return exchange_id, market_type, method, symbol
+
+
+def encode_frame(message: Any) -> bytes:
+    body = dumps(message)
+    return _HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    header = await reader.readexactly(_HEADER.size)
+    (size,) = _HEADER.unpack(header)
+    return loads(await reader.readexactly(size))
+
+
+def normalize(method: str, result: Any) -> Any:
+    """ingest 端把 ccxt.pro 的结果转成可序列化的快照（盘口只保留前 BOOK_DEPTH 档）"""
+    if method == "watch_order_book":
+        return {
+            "symbol": result.get("symbol"),
+            "bids": result["bids"][:BOOK_DEPTH],
+            "asks": result["asks"][:BOOK_DEPTH],
+            "timestamp": result.get("timestamp"),
+            "datetime": result.get("datetime"),
+            "nonce": result.get("nonce"),
+        }
+    if method == "watch_trades":
+        return list(result)
+    return result
+
+
+# =======================================================================
+# worker 端
+# =======================================================================
+
+
+class BusClient:
+    """
+    worker 进程内唯一的总线连接
+
+    - 第一次 watch 某个 key 时向 ingest 订阅，之后每条消息唤醒所有等待者
+    - 连接断开后自动重连并重新订阅
+    - 超过 IDLE_UNSUBSCRIBE 秒没有 watch 的 key 自动退订
+    """
+
+    def __init__(self, path: str = BUS_PATH):
+        self.path = path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def _ensure_started(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run()),
+                asyncio.create_task(self._sweep_idle()),
+            ]
+
+    async def next(self, key: str) -> Any:
+        self._ensure_started()
+        if not self._connected.is_set():
+            try:
+                await asyncio.wait_for(self._connected.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                raise ccxt.ExchangeNotAvailable(f"行情总线不可用: {self.path}")
+
+        if key not in self._last_used:
+            self._send({"op": "sub", "key": key})
+        self._last_used[key] = time.monotonic()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(future)
+        return await future
+
+    def touch(self, key: str) -> None:
+        """订阅但不等待（用于 REST 按需预热共享内存盘口），之后同样按空闲时间退订"""
+        self._ensure_started()
+        if key not in self._last_used:
+            self._send({"op": "sub", "key": key})
+        self._last_used[key] = time.monotonic()
+
+    def _send(self, message: dict) -> None:
+        if self._writer is not None:
+            self._writer.write(encode_frame(message))
+
+    async def _run(self) -> None:
+        delay = 0.5
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                logger.warning(f"连接行情总线失败 {self.path}: {e}，{delay:.1f}s 后重试")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+                continue
+
+            delay = 0.5
+            for key in self._last_used:
+                self._send({"op": "sub", "key": key})
+            self._connected.set()
+            logger.info(f"已连接行情总线: {self.path}")
+            try:
+                while True:
+                    self._dispatch(await read_frame(reader))
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                logger.warning(f"行情总线连接断开: {e}")
+            finally:
+                self._connected.clear()
+                self._writer.close()
+                self._writer = None
+                BUS_RECONNECTS.inc()
+
+    def _dispatch(self, message: dict) -> None:
+        key = message["key"]
+        waiters = self._waiters.get(key)
+        if not waiters:
+            return
+        if "shm" in message:
+            data = _read_shared_book(message["shm"], split_key(key)[3])
+            if data is None:
+                return
+            message["data"] = data
+        del self._waiters[key]
+        BUS_MESSAGES.inc(split_key(key)[2])
+        error = message.get("error")
+        for future in waiters:
+            if future.done():
+                continue
+            if error:
+                exc_class = getattr(ccxt, error["type"], ccxt.ExchangeError)
+                future.set_exception(exc_class(error["msg"]))
+            else:
+                future.set_result(message["data"])
+
+    async def _sweep_idle(self) -> None:
+        while True:
+            await asyncio.sleep(max(IDLE_UNSUBSCRIBE / 3, 1))
+            now = time.monotonic()
+            for key, last_used in list(self._last_used.items()):
+                waiters = [f for f in self._waiters.get(key, []) if not f.done()]
+                if waiters:
+                    self._waiters[key] = waiters
+                    continue
+                self._waiters.pop(key, None)
+                if now - last_used > IDLE_UNSUBSCRIBE:
+                    del self._last_used[key]
+                    self._send({"op": "unsub", "key": key})
+
+
+def _read_shared_book(shm_key: str, symbol: str) -> Optional[dict]:
+    store = get_orderbook_reader()
+    book = store.read(shm_key) if store is not None else None
+    if book is None:
+        return None
+    book["symbol"] = symbol
+    book["datetime"] = ccxt.Exchange.iso8601(book["timestamp"]) if book["timestamp"] else None
+    return book
+
+
+def shared_orderbook_snapshot(exchange_id: str, symbol: str, limit: Optional[int]) -> Optional[dict]:
+    """
+    REST 读 ingest 写入共享内存的盘口，超过 SHM_MAX_AGE_MS 视为没有
+    同时让 ingest 订阅该 symbol（空闲后自动退订），之后的请求都能命中共享内存
+    """
+    market_type = "swap" if ":" in symbol else "spot"
+    get_bus_client().touch(make_key(exchange_id, market_type, "watch_order_book", symbol))
+    store = get_orderbook_reader()
+    if store is None:
+        return None
+    book = store.read(book_key(exchange_id, symbol), limit)
+    if book is None or time.time() * 1000 - book["writtenAt"] > SHM_MAX_AGE_MS:
+        return None
+    return book
+
+
+_client: Optional[BusClient] = None
+
+
+def get_bus_client() -> BusClient:
+    global _client
+    if _client is None:
+        _client = BusClient()
+    return _client
+
+
+# exchange_id -> 总线代理对外声明的 has（只含总线能转发的能力）
+_bus_has: Dict[str, dict] = {}
+
+
+def bus_has(exchange_id: str) -> dict:
+    """
+    按 ccxt.pro 实例的 has 声明 watchMarkPrice（合并永续流据此订阅 mark price）；
+    不声明 watchTickers：总线按单个 symbol 转发，hub 逐个订阅
+    """
+    has = _bus_has.get(exchange_id)
+    if has is None:
+        upstream = getattr(ccxt_pro, exchange_id)().has
+        has = {"watchMarkPrice": bool(upstream.get("watchMarkPrice"))}
+        _bus_has[exchange_id] = has
+    return has
+
+
+class BusExchange:
+    """
+    行情总线上的交易所代理，提供路由用到的 ccxt.pro 子集：
+    id / options / has / milliseconds() / watch_ticker / watch_order_book / watch_trades /
+    watch_mark_price / close()
+    与 ccxt.pro 一样，市场类型取调用时的 options["defaultType"]
+    """
+
+    def __init__(self, exchange_id: str, config: Optional[dict] = None):
+        config = config or {}
+        self.id = exchange_id
+        self.options = {"defaultType": "spot", **config.get("options", {})}
+        self.has = bus_has(exchange_id)
+
+    @staticmethod
+    def milliseconds() -> int:
+        return int(time.time() * 1000)
+
+    async def _watch(self, method: str, symbol: str) -> Any:
+        key = make_key(self.id, self.options.get("defaultType", "spot"), method, symbol)
+        return await get_bus_client().next(key)
+
+    async def watch_ticker(self, symbol, params={}):
+        return await self._watch("watch_ticker", symbol)
+
+    async def watch_order_book(self, symbol, limit=None, params={}):
+        return await self._watch("watch_order_book", symbol)
+
+    async def watch_trades(self, symbol, since=None, limit=None, params={}):
+        return await self._watch("watch_trades", symbol)
+
+    async def watch_mark_price(self, symbol, params={}):
+        return await self._watch("watch_mark_price", symbol)
+
+    async def close(self):
+        return None
+
+
+def create_stream_exchange(exchange_id: str, config: Optional[dict] = None):
+    """
+    WS 路由获取行情源的统一入口：
+    direct 模式返回 ccxt.pro 实例，bus 模式返回 BusExchange
+    交易所不存在时返回 None
+    """
+    if getattr(ccxt_pro, exchange_id, None) is None:
+        return None
+    if market_data_mode() == MODE_BUS:
+        return BusExchange(exchange_id, config)
+    return getattr(ccxt_pro, exchange_id)(config or {})
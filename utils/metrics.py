@@ -0,0 +1,266 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+from urllib.parse import parse_qs
+
+# =======================================================================
+# 轻量 Prometheus 指标
+#
+# 热路径无锁：每个线程写自己的分片（threading.local），事件循环线程和
+# 线程池线程互不竞争；只有线程第一次写入时注册分片需要加一次锁。
+# 导出时合并所有分片：dict.copy() / list 切片在 GIL 下是原子的，
+# 所以合并和文本渲染可以放到线程池里做，不阻塞事件循环。
+# =======================================================================
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard: dict = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _format_labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def inc(self, *label_values: str, value: float = 1) -> None:
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + value
+
+    def collect(self) -> Dict[LabelValues, float]:
+        merged: Dict[LabelValues, float] = {}
+        for shard in list(self._shards):
+            for labels, value in shard.copy().items():
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{self._format_labels(labels)} {_format_value(value)}"
+            for labels, value in sorted(self.collect().items())
+        ]
+
+
+class Histogram(_Metric):
+    """分桶直方图，shard 中每个 label 组合存 [各桶计数..., sum, count]"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        shard = self._shard()
+        series = shard.get(label_values)
+        if series is None:
+            series = [0] * (len(self.buckets) + 3)
+            shard[label_values] = series
+        # 落入第一个 >= value 的桶；超过最大桶记入 +Inf
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def collect(self) -> Dict[LabelValues, List[float]]:
+        merged: Dict[LabelValues, List[float]] = {}
+        for shard in list(self._shards):
+            for labels, series in shard.copy().items():
+                series = series[:]
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = series
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return merged
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = self._format_labels(labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = self._format_labels(labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {series[-1]}")
+        return lines
+
+
+def histogram_quantile(buckets: Sequence[float], series: Sequence[float], q: float) -> float:
+    """
+    根据分桶计数估算分位数（桶内线性插值，与 Prometheus histogram_quantile 一致）
+    series 为 Histogram.collect() 返回的 [各桶计数..., +Inf 计数, sum, count]
+    """
+    count = series[-1]
+    if not count:
+        return 0.0
+    rank = q * count
+    cumulative = 0
+    lower = 0.0
+    for bound, bucket_count in zip(buckets, series):
+        if bucket_count and cumulative + bucket_count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+        lower = bound
+    # 落在 +Inf 桶：只能返回最大的有限边界
+    return buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式（可在线程池中调用）"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# =======================================================================
+# HTTP 请求指标
+# =======================================================================
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP 请求总数",
+    ("route", "method", "exchange", "status"),
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP 请求耗时（秒）",
+    ("route", "exchange"),
+)
+HTTP_ERRORS = Counter(
+    "http_errors_total",
+    "错误响应数：HTTP 状态码 >= 400，或响应体中的业务 code != 0",
+    ("route", "exchange", "code"),
+)
+
+# 统一响应结构以 {"code": N 开头（dict 保持插入顺序），只需看响应体开头几个字节
+_BODY_CODE_RE = re.compile(rb'^\{\s*"code"\s*:\s*(-?\d+)')
+
+# exchange 参数来自客户端，限制不同取值的数量，防止标签基数爆炸
+MAX_EXCHANGE_LABELS = 200
+_seen_exchanges: set = set()
+
+
+def exchange_label(query_string: bytes) -> str:
+    if b"exchange=" not in query_string:
+        return ""
+    values = parse_qs(query_string.decode("latin-1")).get("exchange")
+    if not values:
+        return ""
+    value = values[0].lower().strip()
+    if value in _seen_exchanges:
+        return value
+    if len(_seen_exchanges) >= MAX_EXCHANGE_LABELS or not value.isalnum():
+        return "other"
+    _seen_exchanges.add(value)
+    return value
+
+
+class MetricsMiddleware:
+    """
+    纯 ASGI 中间件：按路由模板 + exchange 参数统计请求数、耗时和错误码
+    WebSocket 连接不计入（长连接耗时没有意义）
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "code": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body" and state["code"] is None:
+                match = _BODY_CODE_RE.match(message.get("body", b"")[:32])
+                state["code"] = match.group(1).decode() if match else ""
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            exchange = exchange_label(scope.get("query_string", b""))
+            status = str(state["status"])
+
+            HTTP_REQUESTS.inc(route_label, scope.get("method", ""), exchange, status)
+            HTTP_LATENCY.observe(elapsed, route_label, exchange)
+            if state["status"] >= 400:
+                HTTP_ERRORS.inc(route_label, exchange, status)
+            elif state["code"] not in (None, "", "0"):
+                HTTP_ERRORS.inc(route_label, exchange, state["code"])
@@ -0,0 +1,363 @@
+"""
+上游代理池：按交易所分配、按实例轮换、带健康检查
+
+原来所有 ccxt 实例都写死走 http://127.0.0.1:7890，全部上游流量共用一个出口 IP、
+一份交易所按 IP 计算的限额。这里：
+
+- CCXT_PROXIES 配置多个出口（"direct" 表示直连），CCXT_PROXY_MAP 可限定某个交易所只用其中几个
+- 每创建一个 ccxt 实例（同步 / 异步 / pro）按交易所轮询分配下一个健康的出口；
+  调用方在 config 里自己指定了代理时不接管
+- 被动健康检查：只有传输层失败（连不上代理、连接被拒、没拿到 HTTP 响应的超时）计入出口健康，
+  连续 PROXY_MAX_FAILURES 次标记为不可用；
+  429 / DDoS 保护只让该出口对这个交易所冷却 PROXY_RATE_LIMIT_COOLDOWN 秒；
+  交易所返回的网络类错误（ExchangeNotAvailable、OnMaintenance、InvalidNonce、5xx / 504 超时等）
+  按 (交易所, 出口) 计数，连续 PROXY_MAX_FAILURES 次后该出口对这个交易所冷却 PROXY_EXCHANGE_ERROR_COOLDOWN 秒；
+  实例当前出口不可用时自动换到下一个
+- 主动健康检查：每 PROXY_HEALTH_INTERVAL 秒 TCP 探测一次每个代理，恢复后重新参与分配
+- 全局限速（utils/rate_limiter.py）按 (交易所, 出口) 分桶，每个出口各自一份限额，总吞吐随出口数增加
+- 没有健康的出口时仍按轮询分配（总比直接失败好），并记录告警
+
+环境变量：
+    CCXT_PROXIES                逗号分隔，默认 http://127.0.0.1:7890
+    CCXT_PROXY_MAP              如 "binance=http://a:7890,http://b:7890;okx=direct"
+    PROXY_MAX_FAILURES          默认 3
+    PROXY_HEALTH_INTERVAL       默认 30
+    PROXY_HEALTH_TIMEOUT        默认 5
+    PROXY_RATE_LIMIT_COOLDOWN   默认 60
+    PROXY_EXCHANGE_ERROR_COOLDOWN 默认 30
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import ccxt
+import ccxt.async_support as ccxt_async
+import requests
+
+from utils.logger import SampledLogger
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+# 没有可用出口的告警：每个交易所每 60 秒最多一条
+_no_proxy_log = SampledLogger(logger, interval=60.0)
+
+DIRECT = "direct"
+
+PROXY_MAX_FAILURES = int(os.getenv("PROXY_MAX_FAILURES", "3"))
+PROXY_HEALTH_INTERVAL = float(os.getenv("PROXY_HEALTH_INTERVAL", "30"))
+PROXY_HEALTH_TIMEOUT = float(os.getenv("PROXY_HEALTH_TIMEOUT", "5"))
+PROXY_RATE_LIMIT_COOLDOWN = float(os.getenv("PROXY_RATE_LIMIT_COOLDOWN", "60"))
+PROXY_EXCHANGE_ERROR_COOLDOWN = float(os.getenv("PROXY_EXCHANGE_ERROR_COOLDOWN", "30"))
+
+# ccxt 把没有拿到 HTTP 响应的失败包装成 NetworkError 时，__cause__ 是这些异常之一
+# （交易所返回状态码 / 错误体时由 handle_errors 直接抛出，没有 __cause__）
+_TRANSPORT_ERRORS = (
+    OSError,  # 连接被拒 / 重置、DNS 失败、asyncio 超时（3.11 起是 OSError 子类）
+    asyncio.TimeoutError,
+    concurrent.futures.TimeoutError,
+    aiohttp.ClientConnectionError,  # 含 ClientProxyConnectionError、ServerDisconnectedError
+    requests.exceptions.ConnectionError,  # 含 ProxyError
+    requests.exceptions.Timeout,
+)
+
+PROXY_REQUESTS = Counter(
+    "proxy_requests_total",
+    "经各出口的上游请求数，outcome 为 ok / failure（传输层失败）/ ratelimited / exchange_error",
+    ("proxy", "outcome"),
+)
+PROXY_STATE_CHANGES = Counter(
+    "proxy_state_changes_total",
+    "出口健康状态变化次数，state 为 up / down",
+    ("proxy", "state"),
+)
+
+
+def redact(url: str) -> str:
+    """指标 / 日志里去掉代理 URL 中的账号密码"""
+    if url == DIRECT:
+        return url
+    parts = urlsplit(url)
+    if parts.username or parts.password:
+        host = parts.hostname or ""
+        if parts.port:
+            host = f"{host}:{parts.port}"
+        return parts._replace(netloc=host).geturl()
+    return url
+
+
+def is_transport_failure(exc: BaseException) -> bool:
+    """请求没有拿到交易所的 HTTP 响应（问题在出口这一段），而不是交易所返回了错误"""
+    return isinstance(exc.__cause__, _TRANSPORT_ERRORS)
+
+
+def _split_urls(value: str) -> List[str]:
+    return [u.strip() for u in value.split(",") if u.strip()]
+
+
+class ProxyState:
+    __slots__ = ("url", "label", "healthy", "failures", "checked_at")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.label = redact(url)
+        self.healthy = True
+        self.failures = 0
+        self.checked_at: Optional[float] = None
+
+
+class ProxyPool:
+    def __init__(self, proxies: List[str], exchange_map: Dict[str, List[str]]):
+        self._lock = threading.Lock()
+        self._proxies: Dict[str, ProxyState] = {}
+        for url in proxies + [u for urls in exchange_map.values() for u in urls]:
+            self._proxies.setdefault(url, ProxyState(url))
+        self._default = proxies
+        self._exchange_map = exchange_map
+        self._cursor: Dict[str, int] = {}
+        # (交易所, 出口) -> 冷却结束时间（被该交易所限流 / 连续返回错误）
+        self._benched: Dict[Tuple[str, str], float] = {}
+        # (交易所, 出口) -> 交易所侧连续错误数
+        self._exchange_failures: Dict[Tuple[str, str], int] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "ProxyPool":
+        proxies = _split_urls(os.getenv("CCXT_PROXIES", "http://127.0.0.1:7890")) or [DIRECT]
+        exchange_map = {}
+        for group in os.getenv("CCXT_PROXY_MAP", "").split(";"):
+            exchange_id, _, urls = group.partition("=")
+            if exchange_id.strip() and _split_urls(urls):
+                exchange_map[exchange_id.strip().lower()] = _split_urls(urls)
+        return cls(proxies, exchange_map)
+
+    def candidates(self, exchange_id: str) -> List[str]:
+        return self._exchange_map.get(exchange_id, self._default)
+
+    def _usable(self, exchange_id: str, url: str, now: float) -> bool:
+        """调用方需持有 _lock"""
+        return self._proxies[url].healthy and self._benched.get((exchange_id, url), 0) <= now
+
+    def assign(self, exchange_id: str) -> str:
+        """轮询取该交易所下一个可用出口"""
+        urls = self.candidates(exchange_id)
+        now = time.monotonic()
+        with self._lock:
+            start = self._cursor.get(exchange_id, 0)
+            self._cursor[exchange_id] = start + 1
+            for i in range(len(urls)):
+                url = urls[(start + i) % len(urls)]
+                if self._usable(exchange_id, url, now):
+                    self._cursor[exchange_id] = start + i + 1
+                    return url
+        _no_proxy_log.warning("%s 没有可用的代理出口，仍按轮询分配", exchange_id, key=exchange_id)
+        return urls[start % len(urls)]
+
+    def alternate(self, exchange_id: str, current: Optional[str]) -> Optional[str]:
+        """除 current 以外下一个可用出口（对冲请求走另一条线路）；没有时返回 None"""
+        urls = [u for u in self.candidates(exchange_id) if u != current]
+        now = time.monotonic()
+        with self._lock:
+            start = self._cursor.get(exchange_id, 0)
+            for i in range(len(urls)):
+                url = urls[(start + i) % len(urls)]
+                if self._usable(exchange_id, url, now):
+                    return url
+        return None
+
+    def usable(self, exchange_id: str, url: str) -> bool:
+        with self._lock:
+            return self._usable(exchange_id, url, time.monotonic())
+
+    # ---------------- 实例 ----------------
+
+    def bind(self, ex) -> None:
+        """给新建的 ccxt 实例分配出口"""
+        apply_proxy(ex, self.assign(ex.id))
+
+    def rotate(self, ex) -> None:
+        """实例当前出口对该交易所不可用时换下一个"""
+        current = getattr(ex, "_egress", None)
+        if current is not None and not self.usable(ex.id, current):
+            url = self.assign(ex.id)
+            if url != current:
+                logger.info(f"{ex.id} 切换代理出口: {redact(current)} -> {redact(url)}")
+                apply_proxy(ex, url)
+
+    # ---------------- 健康状态 ----------------
+
+    def _set_health(self, state: ProxyState, healthy: bool) -> None:
+        """调用方需持有 _lock"""
+        if state.healthy != healthy:
+            state.healthy = healthy
+            PROXY_STATE_CHANGES.inc(state.label, "up" if healthy else "down")
+            if healthy:
+                logger.info(f"代理出口恢复: {state.label}")
+            else:
+                logger.warning(f"代理出口不可用: {state.label}")
+
+    def report_success(self, exchange_id: str, url: str) -> None:
+        PROXY_REQUESTS.inc(self._proxies[url].label, "ok")
+        with self._lock:
+            state = self._proxies[url]
+            state.failures = 0
+            self._set_health(state, True)
+            self._exchange_failures.pop((exchange_id, url), None)
+
+    def report_failure(self, exchange_id: str, url: str, exc: Exception) -> None:
+        state = self._proxies[url]
+        if isinstance(exc, (ccxt.DDoSProtection, ccxt.RateLimitExceeded)):
+            # 这个出口被该交易所限流：只对该交易所冷却
+            PROXY_REQUESTS.inc(state.label, "ratelimited")
+            with self._lock:
+                self._benched[(exchange_id, url)] = time.monotonic() + PROXY_RATE_LIMIT_COOLDOWN
+            return
+        if not is_transport_failure(exc):
+            # 交易所维护 / 过载 / 返回超时：出口本身是通的，只对该交易所计数
+            PROXY_REQUESTS.inc(state.label, "exchange_error")
+            with self._lock:
+                key = (exchange_id, url)
+                failures = self._exchange_failures.get(key, 0) + 1
+                self._exchange_failures[key] = failures
+                if failures >= PROXY_MAX_FAILURES:
+                    self._exchange_failures.pop(key)
+                    self._benched[key] = time.monotonic() + PROXY_EXCHANGE_ERROR_COOLDOWN
+                    logger.warning(
+                        f"{exchange_id} 经 {state.label} 连续 {failures} 次交易所错误，"
+                        f"冷却 {PROXY_EXCHANGE_ERROR_COOLDOWN:.0f}s: {type(exc).__name__}"
+                    )
+            return
+        PROXY_REQUESTS.inc(state.label, "failure")
+        if url == DIRECT:
+            return
+        with self._lock:
+            state.failures += 1
+            if state.failures >= PROXY_MAX_FAILURES:
+                self._set_health(state, False)
+
+    async def check(self, state: ProxyState) -> bool:
+        """TCP 探测代理端口"""
+        parts = urlsplit(state.url)
+        default_port = 443 if parts.scheme == "https" else 1080 if parts.scheme.startswith("socks") else 80
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, parts.port or default_port), timeout=PROXY_HEALTH_TIMEOUT
+            )
+            writer.close()
+            healthy = True
+        except (OSError, asyncio.TimeoutError):
+            healthy = False
+        with self._lock:
+            state.checked_at = time.monotonic()
+            if healthy:
+                state.failures = 0
+            self._set_health(state, healthy)
+        return healthy
+
+    async def check_all(self) -> None:
+        states = [s for s in self._proxies.values() if s.url != DIRECT]
+        await asyncio.gather(*(self.check(s) for s in states))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(PROXY_HEALTH_INTERVAL)
+
+    def start(self) -> None:
+        if self._health_task is None and any(url != DIRECT for url in self._proxies):
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    def report(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "proxy": state.label,
+                    "healthy": state.healthy,
+                    "failures": state.failures,
+                    "benched": sorted(ex for (ex, url), until in self._benched.items() if url == state.url and until > now),
+                }
+                for state in self._proxies.values()
+            ]
+
+
+def apply_proxy(ex, url: str) -> None:
+    """把出口写到实例对应的代理属性上（同步版 proxies，异步版 aiohttp_proxy + WS 代理）"""
+    proxy = None if url == DIRECT else url
+    if isinstance(ex, ccxt_async.Exchange):
+        ex.aiohttp_proxy = proxy
+        ws_options = ex.options.setdefault("ws", {})
+        if proxy:
+            ws_options["proxy"] = proxy
+        else:
+            ws_options.pop("proxy", None)
+    else:
+        ex.proxies = {"http": proxy, "https": proxy} if proxy else None
+    ex._egress = url
+
+
+def egress_of(ex) -> Optional[str]:
+    """实例的出口（由代理池分配的），全局限速按 (交易所, 出口) 分桶"""
+    return getattr(ex, "_egress", None)
+
+
+def install_proxy_hooks() -> None:
+    """包装同步 / 异步基类的 fetch：上报每个出口的成败，出口不可用时实例换下一个（进程内执行一次）"""
+    if getattr(ccxt.Exchange, "__proxy_hooks__", False):
+        return
+
+    original_sync_fetch = ccxt.Exchange.fetch
+    original_async_fetch = ccxt_async.Exchange.fetch
+
+    def sync_fetch(self, url, method="GET", headers=None, body=None):
+        egress = egress_of(self)
+        if egress is None:
+            return original_sync_fetch(self, url, method, headers, body)
+        try:
+            result = original_sync_fetch(self, url, method, headers, body)
+        except ccxt.NetworkError as e:
+            PROXY_POOL.report_failure(self.id, egress, e)
+            PROXY_POOL.rotate(self)
+            raise
+        PROXY_POOL.report_success(self.id, egress)
+        return result
+
+    async def async_fetch(self, url, method="GET", headers=None, body=None):
+        egress = egress_of(self)
+        if egress is None:
+            return await original_async_fetch(self, url, method, headers, body)
+        try:
+            result = await original_async_fetch(self, url, method, headers, body)
+        except ccxt.NetworkError as e:
+            PROXY_POOL.report_failure(self.id, egress, e)
+            PROXY_POOL.rotate(self)
+            raise
+        PROXY_POOL.report_success(self.id, egress)
+        return result
+
+    ccxt.Exchange.fetch = sync_fetch
+    ccxt_async.Exchange.fetch = async_fetch
+    ccxt.Exchange.__proxy_hooks__ = True
+
+
+PROXY_POOL = ProxyPool.from_env()
+
+
+async def start_proxy_health() -> None:
+    """应用启动时调用：启动主动健康检查"""
+    PROXY_POOL.start()
+
+
+async def stop_proxy_health() -> None:
+    await PROXY_POOL.stop()
@@ -0,0 +1,271 @@
+"""
+进程级上游限速调度（每个交易所一个令牌桶，所有实例共享）
+
+ccxt 的 enableRateLimit 只按实例限速，而路由会为同一个交易所创建很多实例，
+合起来很容易超过交易所按 IP 计算的限额（429 / 封禁）。这里替换 ccxt 的 throttle：
+
+- 每个 (交易所 id, 代理出口) 一个令牌桶（交易所按 IP 限额，出口见 utils/proxy_pool.py），参数取自 ccxt 的 tokenBucket（refillRate = 1 / rateLimit，
+  capacity 默认 1），与 ccxt 内置限速器语义相同：令牌 >= 0 即可放行并扣除权重（可透支）
+- 权重取 ccxt 按接口计算的 cost（calculate_rate_limiter_cost），与交易所文档的 weight 一致
+- 两个优先级：INTERACTIVE（用户请求，默认）先于 BACKGROUND（行情 / 资金费率等后台刷新）；
+  后台请求排队超过 RATE_LIMIT_BACKGROUND_MAX_WAIT 秒后按排队先后参与，避免饿死
+- 同步（线程池里的 ccxt）和异步调用共用同一个桶，由一个后台线程按顺序放行
+
+用法：
+    with background_priority():
+        await ex.fetch_funding_rates()
+
+环境变量：
+    RATE_LIMIT_SCHEDULER              设为 0 时恢复 ccxt 按实例限速
+    RATE_LIMIT_OVERRIDES              JSON，按交易所覆盖，如 {"binance": {"rateLimit": 60, "capacity": 5}}
+    RATE_LIMIT_BACKGROUND_MAX_WAIT    默认 10
+    RATE_LIMIT_MAX_QUEUE              每个交易所最多排队的请求数，默认 1000
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+import ccxt
+import ccxt.async_support as ccxt_async
+
+from utils.metrics import Counter, Histogram
+from utils.proxy_pool import egress_of
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = ("interactive", "background")
+
+BACKGROUND_MAX_WAIT = float(os.getenv("RATE_LIMIT_BACKGROUND_MAX_WAIT", "10"))
+MAX_QUEUE = int(os.getenv("RATE_LIMIT_MAX_QUEUE", "1000"))
+
+RATE_LIMIT_WAIT = Histogram(
+    "ratelimit_wait_seconds",
+    "全局限速调度的排队时间（秒）",
+    ("exchange", "priority"),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+RATE_LIMIT_REJECTED = Counter(
+    "ratelimit_rejected_total",
+    "排队已满被拒绝的上游请求数",
+    ("exchange",),
+)
+
+# 当前上下文发起的上游请求的优先级；asyncio task / run_in_threadpool 都会复制上下文
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextmanager
+def background_priority():
+    """代码块内发起的上游请求按后台优先级排队"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _load_overrides() -> Dict[str, dict]:
+    raw = os.getenv("RATE_LIMIT_OVERRIDES")
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.error(f"RATE_LIMIT_OVERRIDES 不是合法 JSON: {raw}")
+        return {}
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    __slots__ = ("cost", "priority", "enqueued", "loop", "future", "event", "bucket")
+
+    def __init__(self, cost: float, priority: int):
+        self.cost = cost
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.event: Optional[threading.Event] = None
+        self.bucket: Optional["ExchangeBucket"] = None
+
+    def grant(self) -> None:
+        if self.future is not None:
+            try:
+                self.loop.call_soon_threadsafe(_resolve, self.future)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+        else:
+            self.event.set()
+
+
+class ExchangeBucket:
+    def __init__(self, exchange_id: str, refill_per_second: float, capacity: float):
+        self.exchange_id = exchange_id
+        self.rate = refill_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.queues = (deque(), deque())
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pending(self) -> int:
+        return len(self.queues[INTERACTIVE]) + len(self.queues[BACKGROUND])
+
+    def pop_next(self, now: float) -> _Waiter:
+        interactive, background = self.queues
+        if background and (
+            not interactive
+            or (now - background[0].enqueued > BACKGROUND_MAX_WAIT and background[0].enqueued < interactive[0].enqueued)
+        ):
+            return background.popleft()
+        return interactive.popleft()
+
+
+class RateLimitScheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        # (交易所 id, 出口) -> 令牌桶
+        self._buckets: Dict[Tuple[str, Optional[str]], ExchangeBucket] = {}
+        self._overrides = _load_overrides()
+        self._thread: Optional[threading.Thread] = None
+
+    def _bucket(self, ex) -> Optional[ExchangeBucket]:
+        """调用方需持有 _cond；rateLimit <= 0 的交易所（如模拟交易所）不限速，返回 None"""
+        key = (ex.id, egress_of(ex))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            override = self._overrides.get(ex.id, {})
+            rate_limit = override.get("rateLimit", ex.rateLimit)
+            if not rate_limit or rate_limit <= 0:
+                return None
+            token_bucket = ex.tokenBucket or {}
+            capacity = override.get("capacity", token_bucket.get("capacity", 1))
+            bucket = ExchangeBucket(ex.id, 1000.0 / rate_limit, capacity)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _enter(self, ex, cost: Optional[float], priority: int) -> Optional[_Waiter]:
+        """能立即放行返回 None，否则返回已入队的等待者；调用方需持有 _cond"""
+        bucket = self._bucket(ex)
+        if bucket is None:
+            return None
+        cost = 1 if cost is None else cost
+        now = time.monotonic()
+        bucket.refill(now)
+        if not bucket.pending() and bucket.tokens >= 0:
+            bucket.tokens -= cost
+            return None
+        if bucket.pending() >= MAX_QUEUE:
+            RATE_LIMIT_REJECTED.inc(ex.id)
+            raise ccxt.RateLimitExceeded(f"{ex.id} 全局限速队列已满（{MAX_QUEUE}）")
+        waiter = _Waiter(cost, priority)
+        waiter.bucket = bucket
+        bucket.queues[priority].append(waiter)
+        self._ensure_thread()
+        self._cond.notify()
+        return waiter
+
+    async def acquire_async(self, ex, cost: Optional[float] = None) -> None:
+        priority = _priority.get()
+        with self._cond:
+            waiter = self._enter(ex, cost, priority)
+            if waiter is None:
+                return
+            waiter.loop = asyncio.get_running_loop()
+            waiter.future = waiter.loop.create_future()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._discard(waiter)
+            raise
+
+    def acquire_sync(self, ex, cost: Optional[float] = None) -> None:
+        priority = _priority.get()
+        with self._cond:
+            waiter = self._enter(ex, cost, priority)
+            if waiter is None:
+                return
+            waiter.event = threading.Event()
+        waiter.event.wait()
+
+    def has_headroom(self, exchange_id: str, egress: Optional[str]) -> bool:
+        """该 (交易所, 出口) 的桶现在能否不排队直接放行（还没有桶的视为满额）"""
+        with self._cond:
+            bucket = self._buckets.get((exchange_id, egress))
+            if bucket is None:
+                return True
+            bucket.refill(time.monotonic())
+            return not bucket.pending() and bucket.tokens >= 0
+
+    def _discard(self, waiter: _Waiter) -> None:
+        with self._cond:
+            queue = waiter.bucket.queues[waiter.priority]
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                pass  # 已经放行，令牌已扣除
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ratelimit-scheduler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        with self._cond:
+            while True:
+                timeout = None
+                now = time.monotonic()
+                for bucket in self._buckets.values():
+                    while bucket.pending():
+                        bucket.refill(now)
+                        if bucket.tokens < 0:
+                            delay = -bucket.tokens / bucket.rate
+                            timeout = delay if timeout is None else min(timeout, delay)
+                            break
+                        waiter = bucket.pop_next(now)
+                        bucket.tokens -= waiter.cost
+                        waiter.grant()
+                        RATE_LIMIT_WAIT.observe(now - waiter.enqueued, bucket.exchange_id, PRIORITY_NAMES[waiter.priority])
+                self._cond.wait(timeout)
+
+
+SCHEDULER = RateLimitScheduler()
+
+
+def install_rate_limit_scheduler() -> bool:
+    """用全局调度替换 ccxt 同步 / 异步基类的 throttle（需在埋点钩子之前安装）"""
+    if os.getenv("RATE_LIMIT_SCHEDULER", "1") == "0":
+        return False
+    if getattr(ccxt.Exchange, "__global_rate_limit__", False):
+        return True
+
+    async def async_throttle(self, cost=None):
+        await SCHEDULER.acquire_async(self, cost)
+
+    def sync_throttle(self, cost=None):
+        SCHEDULER.acquire_sync(self, cost)
+
+    ccxt_async.Exchange.throttle = async_throttle
+    ccxt.Exchange.throttle = sync_throttle
+    ccxt.Exchange.__global_rate_limit__ = True
+    return True
@@ -0,0 +1,290 @@
+"""
+行情回放交易所
+
+把 utils/feed_recorder.py 录制的文件按原始时间间隔重新推送，注册为 ccxt.pro 下的 "replay"，
+WS 接口通过 ?exchange=replay 即可消费录制的真实流量（突发、空档都和线上一致）。
+
+配置（环境变量，或实例 options["replay"] 覆盖）：
+    FEED_REPLAY_PATH      录制文件路径（必填）
+    FEED_REPLAY_SPEED     回放倍速：1 为原速，10 为 10 倍速，max 为不等待尽快推送，默认 1
+    FEED_REPLAY_LOOP      播完后是否从头循环，默认 1
+    FEED_REPLAY_EXCHANGE  只回放某个交易所录制的数据，默认全部
+    FEED_REPLAY_PAUSE_AFTER  没有订阅者多少秒后暂停播放，默认 1
+
+- 同一进程内相同配置的实例共享一个播放器，watch_* 的语义与 ccxt.pro 相同：等待下一条更新
+- 推出的数据 timestamp 改写为当前时间，原始时间放在 recordedAt
+- fetch_ticker / fetch_order_book 返回最近一条已回放的数据
+- 录制文件里没有的 symbol 直接抛 BadSymbol
+- 没有人在 watch 时暂停播放（不再空转，max 倍速循环时尤其明显），有新的 watch 后继续；
+  按原速回放时暂停的时间顺延，不会恢复后一下子补推
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter as CountMap
+from typing import Any, Dict, List, Optional, Tuple
+
+import ccxt
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
+
+from utils.json_response import loads
+from utils.metrics import Counter, Histogram
+from utils.sim_exchange import build_market
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE_ID = "replay"
+
+# 连续两次 watch 之间的短暂空档不算没人订阅
+PAUSE_AFTER = float(os.getenv("FEED_REPLAY_PAUSE_AFTER", "1"))
+
+REPLAY_EVENTS = Counter(
+    "feed_replay_events_total",
+    "已回放的行情条数",
+    ("method",),
+)
+REPLAY_LAG = Histogram(
+    "feed_replay_lag_seconds",
+    "回放落后于计划时间的秒数（持续偏大说明服务处理不过来）",
+    ("method",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+def default_config() -> Dict[str, Any]:
+    return {
+        "path": os.getenv("FEED_REPLAY_PATH", ""),
+        "speed": os.getenv("FEED_REPLAY_SPEED", "1"),
+        "loop": os.getenv("FEED_REPLAY_LOOP", "1") != "0",
+        "exchange": os.getenv("FEED_REPLAY_EXCHANGE") or None,
+    }
+
+
+def scan_recording(path: str, exchange: Optional[str] = None) -> Dict[str, CountMap]:
+    """统计录制文件里每个方法下各 symbol 的条数：{method: Counter(symbol)}"""
+    index: Dict[str, CountMap] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            _, exchange_id, method, symbol, _ = loads(line)
+            if exchange and exchange_id != exchange:
+                continue
+            index.setdefault(method, CountMap())[symbol] += 1
+    return index
+
+
+class FeedPlayer:
+    """按录制时间间隔推进的播放器，等待者按 (method, symbol) 挂起"""
+
+    def __init__(self, config: Dict[str, Any]):
+        if not config["path"]:
+            raise ccxt.ExchangeNotAvailable("replay: 未配置录制文件（FEED_REPLAY_PATH）")
+        self.path = config["path"]
+        self.speed = 0.0 if str(config["speed"]).lower() == "max" else float(config["speed"])
+        self.loop = config["loop"]
+        self.exchange = config["exchange"]
+        self.index = scan_recording(self.path, self.exchange)
+        self.finished = False
+        self._latest: Dict[Tuple[str, str], dict] = {}
+        self._waiters: Dict[Tuple[str, str], List[asyncio.Future]] = {}
+        self._demand = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def symbols(self) -> List[str]:
+        result = set()
+        for counts in self.index.values():
+            result.update(counts)
+        return sorted(result)
+
+    def check_symbol(self, method: str, symbol: str) -> None:
+        if symbol not in self.index.get(method, ()):
+            raise ccxt.BadSymbol(f"replay: 录制文件里没有 {symbol} 的 {method} 数据")
+
+    def latest(self, method: str, symbol: str) -> Optional[dict]:
+        return self._latest.get((method, symbol))
+
+    async def next(self, method: str, symbol: str) -> dict:
+        # 不在录制文件里的 symbol 永远等不到数据
+        self.check_symbol(method, symbol)
+        self._ensure_running()
+        if self.finished:
+            raise ccxt.ExchangeNotAvailable("replay: 录制文件已播放完毕")
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault((method, symbol), []).append(future)
+        self._demand.set()
+        return await future
+
+    def _has_waiters(self) -> bool:
+        # watch 被取消时 future 也会被取消，只看未完成的
+        return any(not f.done() for waiters in self._waiters.values() for f in waiters)
+
+    async def _await_demand(self) -> float:
+        """没有等待者时暂停，返回需要顺延的秒数（空档短于 PAUSE_AFTER 时不顺延）"""
+        if self._has_waiters():
+            return 0.0
+        paused_at = time.monotonic()
+        self._demand.clear()
+        try:
+            await asyncio.wait_for(self._demand.wait(), timeout=PAUSE_AFTER)
+            return 0.0
+        except asyncio.TimeoutError:
+            pass
+        logger.info(f"回放暂停（没有订阅者）: {self.path}")
+        while not self._has_waiters():
+            self._demand.clear()
+            await self._demand.wait()
+        logger.info(f"回放继续: {self.path}")
+        return time.monotonic() - paused_at
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            if self.finished:
+                return
+            self._task = asyncio.get_running_loop().create_task(self._drive())
+
+    async def _drive(self) -> None:
+        try:
+            while True:
+                await self._play_once()
+                if not self.loop:
+                    break
+            self.finished = True
+            error = ccxt.ExchangeNotAvailable("replay: 录制文件已播放完毕")
+            for waiters in self._waiters.values():
+                for future in waiters:
+                    if not future.done():
+                        future.set_exception(error)
+            self._waiters.clear()
+            logger.info(f"回放结束: {self.path}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"回放异常: {e}")
+            raise
+
+    async def _play_once(self) -> None:
+        started = time.monotonic()
+        first_ts = None
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                recorded_at, exchange_id, method, symbol, data = loads(line)
+                if self.exchange and exchange_id != self.exchange:
+                    continue
+                if first_ts is None:
+                    first_ts = recorded_at
+
+                started += await self._await_demand()
+                lag = 0.0
+                if self.speed:
+                    due = started + (recorded_at - first_ts) / 1000.0 / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        lag = -delay
+                else:
+                    # 最大速度：每条都让出一次事件循环，消费方才有机会处理
+                    await asyncio.sleep(0)
+
+                self._publish(method, symbol, data, recorded_at)
+                REPLAY_EVENTS.inc(method)
+                REPLAY_LAG.observe(lag, method)
+
+    def _publish(self, method: str, symbol: str, data: dict, recorded_at: float) -> None:
+        now = int(time.time() * 1000)
+        data["symbol"] = symbol
+        data["recordedAt"] = data.get("timestamp") or int(recorded_at)
+        data["timestamp"] = now
+        data["datetime"] = ccxt.Exchange.iso8601(now)
+        key = (method, symbol)
+        self._latest[key] = data
+        waiters = self._waiters.pop(key, None)
+        if waiters:
+            for future in waiters:
+                if not future.done():
+                    future.set_result(data)
+
+
+_players: Dict[Tuple, FeedPlayer] = {}
+
+
+def get_player(config: Dict[str, Any]) -> FeedPlayer:
+    key = tuple(sorted(config.items()))
+    player = _players.get(key)
+    if player is None:
+        player = FeedPlayer(config)
+        _players[key] = player
+    return player
+
+
+def _market_for(symbol: str) -> dict:
+    base, rest = symbol.split("/", 1)
+    quote, _, settle = rest.partition(":")
+    if not settle:
+        return build_market(symbol, base, quote, None, "spot", None)
+    return build_market(symbol, base, quote, settle, "swap", None, linear=settle == quote)
+
+
+class ReplayExchange(ccxt_async.Exchange):
+    """回放录制文件的 ccxt.pro 交易所"""
+
+    def describe(self):
+        return self.deep_extend(super().describe(), {
+            "id": EXCHANGE_ID,
+            "name": "Feed Replay",
+            "rateLimit": 0,
+            "pro": True,
+            "has": {
+                "fetchTicker": True,
+                "fetchOrderBook": True,
+                "watchTicker": True,
+                "watchOrderBook": True,
+            },
+        })
+
+    def _player(self) -> FeedPlayer:
+        player = getattr(self, "_feed_player", None)
+        if player is None:
+            config = default_config()
+            config.update(self.safe_dict(self.options, "replay", {}))
+            player = get_player(config)
+            self._feed_player = player
+        return player
+
+    async def load_markets(self, reload=False, params={}):
+        if not self.markets or reload:
+            self.set_markets([_market_for(s) for s in self._player().symbols()])
+        return self.markets
+
+    def _latest_or_raise(self, method: str, symbol: str) -> dict:
+        self._player().check_symbol(method, symbol)
+        data = self._player().latest(method, symbol)
+        if data is None:
+            raise ccxt.ExchangeNotAvailable(f"replay: {symbol} 还没有回放到数据")
+        return data
+
+    async def fetch_ticker(self, symbol, params={}):
+        return self._latest_or_raise("watch_ticker", symbol)
+
+    async def fetch_order_book(self, symbol, limit=None, params={}):
+        data = self._latest_or_raise("watch_order_book", symbol)
+        if limit:
+            return {**data, "bids": data["bids"][:limit], "asks": data["asks"][:limit]}
+        return data
+
+    async def watch_ticker(self, symbol, params={}):
+        return await self._player().next("watch_ticker", symbol)
+
+    async def watch_order_book(self, symbol, limit=None, params={}):
+        return await self._player().next("watch_order_book", symbol)
+
+
+def register_replay_exchange() -> None:
+    """挂到 ccxt.pro / ccxt.async_support 命名空间，?exchange=replay 即可选中"""
+    setattr(ccxt_async, EXCHANGE_ID, ReplayExchange)
+    setattr(ccxt_pro, EXCHANGE_ID, ReplayExchange)
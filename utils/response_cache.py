@@ -0,0 +1,206 @@
+"""
+REST 行情接口的服务端缓存（stale-while-revalidate）
+
+/api/summary、/pairs、/orderbook、/trades、/ohlc 原来每个请求都在请求内同步访问交易所。这里：
+
+- 按 (接口, 查询参数) 缓存路由算好的数据，新鲜期内直接返回，不创建交易所实例
+- 过期后 RESPONSE_CACHE_STALE 秒内：立即返回旧数据，同时在后台刷新一次
+  （同一个 key 同一时间只有一个刷新任务；按后台优先级排队限速，见 utils/rate_limiter.py）；
+  路由用 mark_stale() 给旧数据加上和熔断兜底相同的 "stale": true、"staleAgeMs" 标记
+- 没有缓存或旧数据太旧：同一个 key 的并发请求共用一次上游调用（单飞），
+  调用方断开不会取消这次调用
+- 所有接口共用一个内存上限（按 JSON 编码后的字节数估算），超出时按 LRU 淘汰
+- 后台刷新失败只记日志，旧数据继续按原时间过期；前台失败照常抛给路由
+  （由路由的 NetworkError 分支和熔断旧数据兜底处理，见 utils/circuit_breaker.py）
+
+环境变量：
+    RESPONSE_CACHE_ENABLED   设为 0 时关闭（每个请求都直接访问交易所）
+    RESPONSE_CACHE_TTL       各接口新鲜期（秒），如 "summary=2,orderbook=1"，未列出的用默认值
+    RESPONSE_CACHE_STALE     过期后仍可先返回旧数据的秒数，格式同上
+    RESPONSE_CACHE_MAX_MB    缓存总大小上限，默认 64
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from utils.json_response import dumps
+from utils.metrics import Counter
+from utils.rate_limiter import background_priority
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") != "0"
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "64"))
+
+# 盘口、成交变化最快；交易对列表变化很慢
+DEFAULT_TTL = {"summary": 2.0, "pairs": 60.0, "orderbook": 1.0, "trades": 2.0, "ohlc": 5.0}
+DEFAULT_STALE = {"summary": 30.0, "pairs": 600.0, "orderbook": 10.0, "trades": 30.0, "ohlc": 120.0}
+
+CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "服务端缓存查询数，outcome 为 hit / stale（返回旧数据并后台刷新）/ miss",
+    ("endpoint", "outcome"),
+)
+CACHE_REFRESHES = Counter(
+    "response_cache_refreshes_total",
+    "上游拉取次数，kind 为 foreground / background，outcome 为 ok 或异常类名",
+    ("endpoint", "kind", "outcome"),
+)
+CACHE_EVICTIONS = Counter(
+    "response_cache_evictions_total",
+    "超出内存上限被 LRU 淘汰的条目数",
+    ("endpoint",),
+)
+
+CacheKey = Tuple[str, Hashable]
+
+
+def parse_seconds_map(value: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """"summary=2,orderbook=1" -> 在默认值基础上覆盖"""
+    result = dict(defaults)
+    for item in value.split(","):
+        endpoint, _, seconds = item.partition("=")
+        if endpoint.strip() and seconds.strip():
+            result[endpoint.strip().lower()] = float(seconds)
+    return result
+
+
+class _Entry:
+    __slots__ = ("value", "stored_at", "size")
+
+    def __init__(self, value: Any, size: int):
+        self.value = value
+        self.stored_at = time.monotonic()
+        self.size = size
+
+
+class ResponseCache:
+    def __init__(self, ttl: Dict[str, float], stale: Dict[str, float], max_bytes: int):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # key -> 正在进行的上游拉取（前台单飞和后台刷新共用）
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            parse_seconds_map(os.getenv("RESPONSE_CACHE_TTL", ""), DEFAULT_TTL),
+            parse_seconds_map(os.getenv("RESPONSE_CACHE_STALE", ""), DEFAULT_STALE),
+            int(RESPONSE_CACHE_MAX_MB * 1024 * 1024),
+        )
+
+    async def get(self, endpoint: str, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        返回 (value, outcome)，outcome 为 hit / stale / miss（关闭缓存时为 bypass）
+        fetch 必须自己创建并关闭交易所实例：后台刷新时原请求可能早已结束
+        """
+        if not RESPONSE_CACHE_ENABLED:
+            return await fetch(), "bypass"
+
+        cache_key = (endpoint, key)
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            ttl = self.ttl.get(endpoint, 0.0)
+            if age <= ttl + self.stale.get(endpoint, 0.0):
+                self._entries.move_to_end(cache_key)
+                if age <= ttl:
+                    CACHE_REQUESTS.inc(endpoint, "hit")
+                    return entry.value, "hit"
+                if cache_key not in self._inflight:
+                    self._start(cache_key, fetch, "background")
+                CACHE_REQUESTS.inc(endpoint, "stale")
+                return entry.value, "stale"
+
+        CACHE_REQUESTS.inc(endpoint, "miss")
+        task = self._inflight.get(cache_key) or self._start(cache_key, fetch, "foreground")
+        return await asyncio.shield(task), "miss"
+
+    def mark_stale(self, endpoint: str, key: Hashable, data: dict) -> dict:
+        """get() 返回 stale 时调用：data 带 stale 标记和数据年龄（与 utils/circuit_breaker.stale_response 一致）"""
+        entry = self._entries.get((endpoint, key))
+        age = time.monotonic() - entry.stored_at if entry is not None else 0.0
+        return {**data, "stale": True, "staleAgeMs": int(age * 1000)}
+
+    def _start(self, cache_key: CacheKey, fetch: Callable[[], Awaitable[Any]], kind: str) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(self._refresh(cache_key, fetch, kind))
+        self._inflight[cache_key] = task
+        task.add_done_callback(lambda t: self._done(cache_key, t))
+        return task
+
+    async def _refresh(self, cache_key: CacheKey, fetch: Callable[[], Awaitable[Any]], kind: str) -> Any:
+        endpoint = cache_key[0]
+        try:
+            # 后台刷新时已经有旧数据返回给用户，不和用户请求抢限速额度（优先级随 context 带进线程池）
+            with background_priority() if kind == "background" else nullcontext():
+                value = await fetch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            CACHE_REFRESHES.inc(endpoint, kind, type(e).__name__)
+            if kind == "background":
+                logger.warning(f"{endpoint} 后台刷新失败 {cache_key[1]}: {type(e).__name__}: {e}")
+            raise
+        CACHE_REFRESHES.inc(endpoint, kind, "ok")
+        self._store(cache_key, value)
+        return value
+
+    def _done(self, cache_key: CacheKey, task: asyncio.Task) -> None:
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        # 后台刷新的异常没有人 await，这里取走，避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def _store(self, cache_key: CacheKey, value: Any) -> None:
+        size = len(dumps(value))
+        old = self._entries.pop(cache_key, None)
+        if old is not None:
+            self._bytes -= old.size
+        if size > self.max_bytes:
+            return
+        self._entries[cache_key] = _Entry(value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            (endpoint, _), evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            CACHE_EVICTIONS.inc(endpoint)
+
+    def report(self) -> Dict[str, Any]:
+        endpoints: Dict[str, Dict[str, Any]] = {}
+        for (endpoint, _), entry in list(self._entries.items()):
+            stats = endpoints.setdefault(endpoint, {"entries": 0, "bytes": 0})
+            stats["entries"] += 1
+            stats["bytes"] += entry.size
+        for endpoint, stats in endpoints.items():
+            stats["ttl"] = self.ttl.get(endpoint)
+            stats["stale"] = self.stale.get(endpoint)
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "refreshing": len(self._inflight),
+            "endpoints": endpoints,
+        }
+
+    async def close(self) -> None:
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._inflight.clear()
+
+
+RESPONSE_CACHE = ResponseCache.from_env()
+
+
+async def close_response_cache() -> None:
+    """应用退出时调用：取消进行中的后台刷新"""
+    await RESPONSE_CACHE.close()
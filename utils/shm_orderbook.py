@@ -0,0 +1,275 @@
+"""
+共享内存盘口快照（一个写进程，多个 worker 读）
+
+ingest 进程把每个 symbol 的前 N 档写进 /dev/shm 下的固定布局文件，
+所有 worker mmap 同一个文件直接读取：不经过 socket、不做 JSON 编解码，
+每个 symbol 全机只有一份权威盘口。
+
+布局（小端）：
+    头部 64 字节: magic(8) | generation u64 | slots u32 | depth u32
+    每个槽位:     seq u64 | key 64 字节 | timestamp i64 | nonce i64 | written_at i64
+                 | nbids u32 | nasks u32 | bids depth×2 f64 | asks depth×2 f64
+
+- key 为 "exchange|symbol"（ccxt 统一 symbol 在各市场类型间不重复），
+  按 crc32 开放寻址找槽位，槽位分配后不再变化
+- 每个槽位一个 seqlock：写之前 seq 变奇数，写完变偶数；
+  读者读前后 seq 相同且为偶数才算一致快照，否则重读
+- ingest 重启时原地重建文件并更换 generation，槽位按新的顺序重新分配：
+  每次读都核对头部 generation 和槽位里的 key，缓存的槽位已被别的 key 占用时重新查找，
+  不会把别的 symbol 的盘口当成这个 symbol 返回
+
+环境变量：
+    ORDERBOOK_SHM_PATH   默认 /dev/shm/ccxt-proxy-orderbooks
+    ORDERBOOK_SHM_SLOTS  槽位数，默认 4096
+    ORDERBOOK_SHM_DEPTH  每边档数，默认 50
+"""
+import logging
+import mmap
+import os
+import random
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SHM_PATH = os.getenv("ORDERBOOK_SHM_PATH", "/dev/shm/ccxt-proxy-orderbooks")
+SHM_SLOTS = int(os.getenv("ORDERBOOK_SHM_SLOTS", "4096"))
+SHM_DEPTH = int(os.getenv("ORDERBOOK_SHM_DEPTH", "50"))
+
+MAGIC = b"OBSHM001"
+KEY_SIZE = 64
+
+_HEADER = struct.Struct("<8sQII")
+HEADER_SIZE = 64
+_SEQ = struct.Struct("<Q")
+_META = struct.Struct("<qqqII")
+_META_OFFSET = _SEQ.size + KEY_SIZE
+_LEVELS_OFFSET = _META_OFFSET + _META.size
+
+# 读者重试次数上限（写一次只需几微秒，正常一两次就能读到一致快照）
+READ_RETRIES = 100
+
+
+def book_key(exchange_id: str, symbol: str) -> str:
+    return f"{exchange_id}|{symbol}"
+
+
+class OrderBookStore:
+    def __init__(self, path: str, mm: mmap.mmap, slots: int, depth: int, generation: int):
+        self.path = path
+        self._mm = mm
+        self.slots = slots
+        self.depth = depth
+        self.generation = generation
+        self._levels = struct.Struct(f"<{depth * 2}d")
+        self._slot_size = _LEVELS_OFFSET + 2 * self._levels.size
+        self._slot_cache: Dict[str, int] = {}
+
+    # ---------------- 打开 ----------------
+
+    @classmethod
+    def create(cls, path: str = SHM_PATH, slots: int = SHM_SLOTS, depth: int = SHM_DEPTH) -> "OrderBookStore":
+        """写进程调用：原地重建文件（保持同一个 inode，已 mmap 的读者能看到新内容）"""
+        slot_size = _LEVELS_OFFSET + 2 * struct.calcsize(f"<{depth * 2}d")
+        size = HEADER_SIZE + slots * slot_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # 只扩不缩：已映射旧布局的读者访问超出文件末尾的位置会 SIGBUS
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        mm[HEADER_SIZE:size] = bytes(size - HEADER_SIZE)
+        generation = random.getrandbits(63)
+        _HEADER.pack_into(mm, 0, MAGIC, generation, slots, depth)
+        logger.info(f"共享内存盘口已创建: {path} ({slots} 槽位 × {depth} 档, {size // 1024} KiB)")
+        return cls(path, mm, slots, depth, generation)
+
+    @classmethod
+    def open(cls, path: str = SHM_PATH) -> Optional["OrderBookStore"]:
+        """读进程调用：文件不存在或格式不对时返回 None"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER_SIZE:
+                return None
+            mm = mmap.mmap(fd, size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        magic, generation, slots, depth = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            mm.close()
+            return None
+        store = cls(path, mm, slots, depth, generation)
+        if HEADER_SIZE + slots * store._slot_size > size:
+            mm.close()
+            return None
+        return store
+
+    def is_stale(self) -> bool:
+        """写进程已重建文件（generation 或布局变化）"""
+        magic, generation, slots, depth = _HEADER.unpack_from(self._mm, 0)
+        return generation != self.generation or slots != self.slots or depth != self.depth
+
+    def close(self) -> None:
+        self._mm.close()
+
+    # ---------------- 槽位 ----------------
+
+    def _offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * self._slot_size
+
+    def _slot_key(self, offset: int) -> bytes:
+        return self._mm[offset + _SEQ.size: offset + _META_OFFSET].rstrip(b"\0")
+
+    def _generation_changed(self) -> bool:
+        return _HEADER.unpack_from(self._mm, 0)[1] != self.generation
+
+    def _find_slot(self, key: str, claim: bool) -> Optional[int]:
+        raw = key.encode()[:KEY_SIZE]
+        slot = self._slot_cache.get(key)
+        if slot is not None:
+            if self._slot_key(self._offset(slot)) == raw:
+                return slot
+            # 文件被重建过，槽位换了主人
+            del self._slot_cache[key]
+        start = zlib.crc32(raw) % self.slots
+        for i in range(self.slots):
+            slot = (start + i) % self.slots
+            offset = self._offset(slot)
+            existing = self._slot_key(offset)
+            if existing == raw:
+                self._slot_cache[key] = slot
+                return slot
+            if not existing:
+                if not claim:
+                    return None
+                self._mm[offset + _SEQ.size: offset + _SEQ.size + len(raw)] = raw
+                self._slot_cache[key] = slot
+                return slot
+        if claim:
+            logger.warning(f"共享内存盘口槽位已满，丢弃 {key}")
+        return None
+
+    # ---------------- 读写 ----------------
+
+    def write(
+        self,
+        key: str,
+        bids: Sequence[Sequence[float]],
+        asks: Sequence[Sequence[float]],
+        timestamp: Optional[int],
+        nonce: Optional[int],
+    ) -> bool:
+        slot = self._find_slot(key, claim=True)
+        if slot is None:
+            return False
+        offset = self._offset(slot)
+        depth = self.depth
+        nbids = min(len(bids), depth)
+        nasks = min(len(asks), depth)
+        bid_values = [0.0] * (depth * 2)
+        ask_values = [0.0] * (depth * 2)
+        for i in range(nbids):
+            bid_values[2 * i] = bids[i][0]
+            bid_values[2 * i + 1] = bids[i][1]
+        for i in range(nasks):
+            ask_values[2 * i] = asks[i][0]
+            ask_values[2 * i + 1] = asks[i][1]
+
+        mm = self._mm
+        seq = _SEQ.unpack_from(mm, offset)[0]
+        _SEQ.pack_into(mm, offset, seq + 1)
+        _META.pack_into(
+            mm, offset + _META_OFFSET,
+            _as_int(timestamp), _as_int(nonce), int(time.time() * 1000), nbids, nasks,
+        )
+        self._levels.pack_into(mm, offset + _LEVELS_OFFSET, *bid_values)
+        self._levels.pack_into(mm, offset + _LEVELS_OFFSET + self._levels.size, *ask_values)
+        _SEQ.pack_into(mm, offset, seq + 2)
+        return True
+
+    def read(self, key: str, limit: Optional[int] = None) -> Optional[dict]:
+        """
+        读一份一致快照；没有该 key、文件已被写进程重建或一直读不到一致版本时返回 None
+        """
+        raw = key.encode()[:KEY_SIZE]
+        slot = self._find_slot(key, claim=False)
+        if slot is None:
+            return None
+        offset = self._offset(slot)
+        mm = self._mm
+        for _ in range(READ_RETRIES):
+            if self._generation_changed():
+                # 旧映射的槽位缓存已不可信，由 get_orderbook_reader 重新打开
+                self._slot_cache.clear()
+                return None
+            seq = _SEQ.unpack_from(mm, offset)[0]
+            if seq & 1:
+                continue
+            if self._slot_key(offset) != raw:
+                # 读的过程中槽位换了主人：重新查找
+                self._slot_cache.pop(key, None)
+                slot = self._find_slot(key, claim=False)
+                if slot is None:
+                    return None
+                offset = self._offset(slot)
+                continue
+            timestamp, nonce, written_at, nbids, nasks = _META.unpack_from(mm, offset + _META_OFFSET)
+            if limit:
+                nbids = min(nbids, limit)
+                nasks = min(nasks, limit)
+            bids = struct.unpack_from(f"<{nbids * 2}d", mm, offset + _LEVELS_OFFSET)
+            asks = struct.unpack_from(f"<{nasks * 2}d", mm, offset + _LEVELS_OFFSET + self._levels.size)
+            if _SEQ.unpack_from(mm, offset)[0] == seq and self._slot_key(offset) == raw:
+                return {
+                    "bids": _pairs(bids),
+                    "asks": _pairs(asks),
+                    "timestamp": timestamp or None,
+                    "nonce": nonce,
+                    "writtenAt": written_at,
+                }
+        return None
+
+
+def _as_int(value) -> int:
+    # 个别交易所的 nonce 是字符串或缺失
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _pairs(flat: Sequence[float]) -> List[List[float]]:
+    return [[flat[i], flat[i + 1]] for i in range(0, len(flat), 2)]
+
+
+# =======================================================================
+# worker 端：懒打开只读映射
+# =======================================================================
+
+_reader: Optional[OrderBookStore] = None
+_next_open_attempt = 0.0
+
+
+def get_orderbook_reader() -> Optional[OrderBookStore]:
+    """
+    返回只读映射；文件还不存在时每 5 秒最多重试一次
+    每次调用都检查写进程是否重建了文件（只读一次头部），重建后立即重新打开
+    """
+    global _reader, _next_open_attempt
+    if _reader is not None and _reader.is_stale():
+        _reader.close()
+        _reader = None
+        _next_open_attempt = 0.0
+    now = time.monotonic()
+    if _reader is None and now >= _next_open_attempt:
+        _next_open_attempt = now + 5.0
+        _reader = OrderBookStore.open()
+    return _reader
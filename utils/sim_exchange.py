@@ -0,0 +1,580 @@
+"""
+确定性模拟交易所（离线测试 / 基准）
+
+实现路由用到的 ccxt / ccxt.pro 方法：
+    load_markets, fetch_ticker, fetch_tickers, fetch_order_book, fetch_trades,
+    fetch_ohlcv, fetch_funding_rates,
+    watch_ticker, watch_order_book, watch_trades, watch_mark_price
+
+注册为 ccxt / ccxt.async_support / ccxt.pro 下的 "sim"，
+所有路由都可以通过 ?exchange=sim 使用它，整个服务无需网络即可运行。
+
+确定性：
+- 每个 symbol 的价格是以 (seed, symbol) 为种子的随机游走，从该 symbol 第一次被访问的节拍开始，
+  之后第 n 次更新的价格在不同进程 / 不同运行之间完全一致（时间戳取真实时钟）；
+  第一次访问前的节拍不回放，空闲超过 MAX_CATCH_UP 个节拍后再访问时跳过中间的游走
+  （补算在事件循环里、持锁进行，不能随运行时长无限增长）
+- 同一进程内的所有实例共享同一个行情（像真实交易所一样），
+  更新按全局节拍推进：所有 watch 调用在同一个节拍拿到同一份数据
+- 盘口、成交、K 线、资金费率由 (seed, symbol, 序号) 推导，不影响价格游走
+
+配置（环境变量，或实例 options["sim"] 覆盖）：
+    SIM_EXCHANGE_SEED         随机种子，默认 42
+    SIM_EXCHANGE_UPDATE_HZ    watch_ticker / order_book / trades 更新频率，默认 10
+    SIM_EXCHANGE_MARK_HZ      watch_mark_price 更新频率，默认 1
+    SIM_EXCHANGE_LATENCY_MS   REST 方法模拟延迟，默认 0
+    SIM_EXCHANGE_JITTER_MS    REST 延迟的随机抖动上限，默认 0
+    SIM_EXCHANGE_MARKETS      币种数量（每个币种生成现货 + U 本位永续 + 币本位永续），默认 50
+    SIM_EXCHANGE_ENABLED      设为 1 时注册（默认不注册：生产环境不能让 ?exchange=sim 返回假行情）
+"""
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import ccxt
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
+
+EXCHANGE_ID = "sim"
+
+# 资金费率结算周期（8 小时）
+FUNDING_INTERVAL_MS = 8 * 3600 * 1000
+
+# 一次最多补算的游走步数（10Hz 下约 100 秒）
+MAX_CATCH_UP = 1000
+
+KNOWN_BASES = [
+    "BTC", "ETH", "SOL", "XRP", "DOGE", "ADA", "TRX", "BNB", "LTC", "DOT",
+    "AVAX", "LINK", "MATIC", "UNI", "ATOM", "ETC", "FIL", "APT", "ARB", "OP",
+]
+
+
+def default_config() -> Dict[str, Any]:
+    return {
+        "seed": int(os.getenv("SIM_EXCHANGE_SEED", "42")),
+        "updateHz": float(os.getenv("SIM_EXCHANGE_UPDATE_HZ", "10")),
+        "markHz": float(os.getenv("SIM_EXCHANGE_MARK_HZ", "1")),
+        "latencyMs": float(os.getenv("SIM_EXCHANGE_LATENCY_MS", "0")),
+        "jitterMs": float(os.getenv("SIM_EXCHANGE_JITTER_MS", "0")),
+        "markets": int(os.getenv("SIM_EXCHANGE_MARKETS", "50")),
+        # 每次更新价格对数收益率的标准差
+        "volatility": 0.0005,
+    }
+
+
+# =======================================================================
+# 行情核心（进程内按配置共享）
+# =======================================================================
+
+
+class _SymbolFeed:
+    """单个 symbol 的随机游走状态，step 只会向前推进"""
+
+    __slots__ = ("symbol", "rng", "step", "price", "open", "high", "low", "volume")
+
+    def __init__(self, seed: int, symbol: str, start_price: float, step: int):
+        self.symbol = symbol
+        self.rng = random.Random(f"{seed}:{symbol}:walk")
+        # 从第一次访问的节拍开始游走，不回放之前的节拍
+        self.step = step
+        self.price = start_price
+        self.open = start_price
+        self.high = start_price
+        self.low = start_price
+        self.volume = 0.0
+
+    def advance(self, target: int, volatility: float) -> None:
+        if target - self.step > MAX_CATCH_UP:
+            self.step = target - MAX_CATCH_UP
+        while self.step < target:
+            self.price *= math.exp(self.rng.gauss(0.0, volatility))
+            self.high = max(self.high, self.price)
+            self.low = min(self.low, self.price)
+            self.volume += self.rng.uniform(0.1, 5.0)
+            self.step += 1
+
+
+class SimMarket:
+    """一份模拟行情：市场列表 + 每个 symbol 的游走状态 + 全局节拍"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.seed = config["seed"]
+        self.interval = 1.0 / config["updateHz"]
+        self.mark_interval = 1.0 / config["markHz"]
+        self.volatility = config["volatility"]
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._feeds: Dict[str, _SymbolFeed] = {}
+        self.markets = self._build_markets(config["markets"])
+        self._base_prices = self._build_base_prices()
+
+    # ---------------- 市场 ----------------
+
+    def _build_markets(self, count: int) -> List[dict]:
+        bases = (KNOWN_BASES + [f"SIM{i}" for i in range(count)])[:count]
+        rng = random.Random(f"{self.seed}:markets")
+        markets = []
+        for base in bases:
+            max_leverage = rng.choice([20, 50, 75, 100, 125])
+            markets.append(build_market(f"{base}/USDT", base, "USDT", None, "spot", None))
+            markets.append(build_market(f"{base}/USDT:USDT", base, "USDT", "USDT", "swap", max_leverage, linear=True))
+            markets.append(build_market(f"{base}/USD:{base}", base, "USD", base, "swap", max_leverage, linear=False))
+        return markets
+
+    def _build_base_prices(self) -> Dict[str, float]:
+        prices = {}
+        for market in self.markets:
+            base = market["base"]
+            if base not in prices:
+                rng = random.Random(f"{self.seed}:{base}:price")
+                prices[base] = round(10 ** rng.uniform(-1, 4.7), 4)
+        return prices
+
+    # ---------------- 节拍 ----------------
+
+    def current_step(self, interval: Optional[float] = None) -> int:
+        return int((time.time() - self.started) / (interval or self.interval))
+
+    async def wait_next_step(self, interval: Optional[float] = None) -> int:
+        """等到下一个全局节拍，返回节拍序号（同一节拍的所有等待者拿到相同序号）"""
+        interval = interval or self.interval
+        target = self.current_step(interval) + 1
+        delay = self.started + target * interval - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return target
+
+    def feed(self, symbol: str, step: Optional[int] = None) -> _SymbolFeed:
+        """把 symbol 的游走推进到 step（默认当前节拍）并返回"""
+        if step is None:
+            step = self.current_step()
+        with self._lock:
+            feed = self._feeds.get(symbol)
+            if feed is None:
+                base = symbol.split("/")[0]
+                feed = _SymbolFeed(self.seed, symbol, self._base_prices.get(base, 100.0), step)
+                self._feeds[symbol] = feed
+            feed.advance(step, self.volatility)
+        return feed
+
+    # ---------------- 数据构造 ----------------
+
+    def ticker(self, symbol: str, step: Optional[int] = None) -> dict:
+        feed = self.feed(symbol, step)
+        now = _now_ms()
+        last = feed.price
+        spread = last * 0.0001
+        change = last - feed.open
+        return {
+            "symbol": symbol,
+            "timestamp": now,
+            "datetime": ccxt.Exchange.iso8601(now),
+            "high": feed.high,
+            "low": feed.low,
+            "bid": last - spread / 2,
+            "bidVolume": None,
+            "ask": last + spread / 2,
+            "askVolume": None,
+            "vwap": (feed.high + feed.low + last) / 3,
+            "open": feed.open,
+            "close": last,
+            "last": last,
+            "previousClose": None,
+            "change": change,
+            "percentage": change / feed.open * 100 if feed.open else None,
+            "average": (feed.open + last) / 2,
+            "baseVolume": feed.volume,
+            "quoteVolume": feed.volume * last,
+            "info": {"step": feed.step},
+        }
+
+    def order_book(self, symbol: str, limit: Optional[int], step: Optional[int] = None) -> dict:
+        feed = self.feed(symbol, step)
+        depth = limit or 100
+        rng = random.Random(f"{self.seed}:{symbol}:book:{feed.step}")
+        mid = feed.price
+        tick = mid * 0.00005
+        bids, asks = [], []
+        for i in range(depth):
+            bids.append([mid - tick * (i + 1), round(rng.uniform(0.01, 10.0), 4)])
+            asks.append([mid + tick * (i + 1), round(rng.uniform(0.01, 10.0), 4)])
+        now = _now_ms()
+        return {
+            "symbol": symbol,
+            "bids": bids,
+            "asks": asks,
+            "timestamp": now,
+            "datetime": ccxt.Exchange.iso8601(now),
+            "nonce": feed.step,
+        }
+
+    def trades(self, symbol: str, limit: Optional[int], step: Optional[int] = None) -> List[dict]:
+        feed = self.feed(symbol, step)
+        count = limit or 50
+        now = _now_ms()
+        result = []
+        for i in range(count):
+            trade_step = feed.step - i
+            rng = random.Random(f"{self.seed}:{symbol}:trade:{trade_step}")
+            price = feed.price * (1 + rng.uniform(-0.0002, 0.0002))
+            amount = round(rng.uniform(0.001, 2.0), 4)
+            timestamp = now - int(i * self.interval * 1000)
+            result.append({
+                "id": f"{trade_step}",
+                "timestamp": timestamp,
+                "datetime": ccxt.Exchange.iso8601(timestamp),
+                "symbol": symbol,
+                "order": None,
+                "type": None,
+                "side": "buy" if rng.random() < 0.5 else "sell",
+                "takerOrMaker": "taker",
+                "price": price,
+                "amount": amount,
+                "cost": price * amount,
+                "fee": None,
+                "info": {},
+            })
+        result.reverse()
+        return result
+
+    def ohlcv(self, symbol: str, timeframe_sec: int, since: Optional[int], limit: Optional[int]) -> List[list]:
+        """
+        历史 K 线：第 idx 根的开盘价是 idx 的确定性函数（几条正弦叠加），
+        相邻 K 线首尾相接，任意时间段都可以 O(limit) 生成
+        """
+        count = limit or 200
+        period_ms = timeframe_sec * 1000
+        now = _now_ms()
+        if since:
+            first = since // period_ms
+        else:
+            first = now // period_ms - count + 1
+        last_idx = now // period_ms
+        base = symbol.split("/")[0]
+        anchor = self._base_prices.get(base, 100.0)
+        rng = random.Random(f"{self.seed}:{symbol}:ohlcv")
+        phases = [rng.uniform(0, 2 * math.pi) for _ in range(3)]
+
+        def open_price(idx: int) -> float:
+            t = idx * timeframe_sec / 3600.0
+            drift = (
+                0.05 * math.sin(t / 240 + phases[0])
+                + 0.02 * math.sin(t / 24 + phases[1])
+                + 0.005 * math.sin(t + phases[2])
+            )
+            return anchor * math.exp(drift)
+
+        candles = []
+        for idx in range(first, min(first + count, last_idx + 1)):
+            o = open_price(idx)
+            c = open_price(idx + 1)
+            noise = random.Random(f"{self.seed}:{symbol}:{timeframe_sec}:{idx}")
+            h = max(o, c) * (1 + noise.uniform(0, 0.002))
+            low = min(o, c) * (1 - noise.uniform(0, 0.002))
+            v = round(noise.uniform(1, 1000), 4)
+            candles.append([idx * period_ms, o, h, low, c, v])
+        return candles
+
+    def funding_rate(self, symbol: str) -> dict:
+        now = _now_ms()
+        period = now // FUNDING_INTERVAL_MS
+        rng = random.Random(f"{self.seed}:{symbol}:funding:{period}")
+        next_funding = (period + 1) * FUNDING_INTERVAL_MS
+        feed = self.feed(symbol)
+        return {
+            "symbol": symbol,
+            "markPrice": feed.price,
+            "indexPrice": feed.price * (1 + rng.uniform(-0.0005, 0.0005)),
+            "interestRate": 0.0001,
+            "fundingRate": round(rng.uniform(-0.0005, 0.001), 6),
+            "fundingTimestamp": next_funding,
+            "fundingDatetime": ccxt.Exchange.iso8601(next_funding),
+            "nextFundingTime": next_funding,
+            "interval": "8h",
+            "timestamp": now,
+            "datetime": ccxt.Exchange.iso8601(now),
+            "info": {},
+        }
+
+    def mark_price(self, symbol: str, step: int) -> dict:
+        funding = self.funding_rate(symbol)
+        rng = random.Random(f"{self.seed}:{symbol}:oi:{step}")
+        return {
+            "symbol": symbol,
+            "markPrice": funding["markPrice"],
+            "indexPrice": funding["indexPrice"],
+            "fundingRate": funding["fundingRate"],
+            "nextFundingTime": funding["nextFundingTime"],
+            "openInterest": round(rng.uniform(1e5, 1e7), 2),
+            "timestamp": funding["timestamp"],
+            "datetime": funding["datetime"],
+            "info": {},
+        }
+
+
+def build_market(symbol, base, quote, settle, market_type, max_leverage, linear=None) -> dict:
+    is_swap = market_type == "swap"
+    market_id = symbol.replace("/", "").replace(":", "_")
+    return {
+        "id": market_id,
+        "symbol": symbol,
+        "base": base,
+        "quote": quote,
+        "settle": settle,
+        "baseId": base,
+        "quoteId": quote,
+        "settleId": settle,
+        "type": market_type,
+        "spot": not is_swap,
+        "margin": False,
+        "swap": is_swap,
+        "future": False,
+        "option": False,
+        "active": True,
+        "contract": is_swap,
+        "linear": linear if is_swap else None,
+        "inverse": (not linear) if is_swap else None,
+        "contractSize": 1 if is_swap else None,
+        "expiry": None,
+        "expiryDatetime": None,
+        "strike": None,
+        "optionType": None,
+        "taker": 0.0005 if is_swap else 0.001,
+        "maker": 0.0002 if is_swap else 0.001,
+        "precision": {"amount": 0.0001, "price": 0.0001},
+        "limits": {
+            "leverage": {"min": 1 if is_swap else None, "max": max_leverage},
+            "amount": {"min": 0.0001, "max": None},
+            "price": {"min": None, "max": None},
+            "cost": {"min": None, "max": None},
+        },
+        "created": None,
+        "info": {},
+    }
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+_markets_by_config: Dict[Tuple, SimMarket] = {}
+_markets_lock = threading.Lock()
+
+
+def get_sim_market(config: Dict[str, Any]) -> SimMarket:
+    """相同配置共享同一份行情"""
+    key = tuple(sorted(config.items()))
+    with _markets_lock:
+        market = _markets_by_config.get(key)
+        if market is None:
+            market = SimMarket(config)
+            _markets_by_config[key] = market
+        return market
+
+
+# =======================================================================
+# ccxt 交易所类
+# =======================================================================
+
+_DESCRIBE = {
+    "id": EXCHANGE_ID,
+    "name": "Simulated Exchange",
+    "countries": [],
+    "rateLimit": 0,
+    "pro": True,
+    "has": {
+        "fetchTicker": True,
+        "fetchTickers": True,
+        "fetchOrderBook": True,
+        "fetchTrades": True,
+        "fetchOHLCV": True,
+        "fetchFundingRates": True,
+        "watchTicker": True,
+        "watchTickers": True,
+        "watchOrderBook": True,
+        "watchTrades": True,
+        "watchMarkPrice": True,
+    },
+    "timeframes": {
+        "1m": "1m", "3m": "3m", "5m": "5m", "15m": "15m", "30m": "30m",
+        "1h": "1h", "2h": "2h", "4h": "4h", "1d": "1d", "1w": "1w",
+    },
+}
+
+
+class _SimMixin:
+    """同步 / 异步版本共用的配置与校验"""
+
+    def _sim(self) -> SimMarket:
+        market = getattr(self, "_sim_market", None)
+        if market is None:
+            config = default_config()
+            config.update(self.safe_dict(self.options, "sim", {}))
+            market = get_sim_market(config)
+            self._sim_market = market
+        return market
+
+    def _sim_latency(self) -> float:
+        config = self._sim().config
+        latency = config["latencyMs"]
+        if config["jitterMs"]:
+            latency += random.uniform(0, config["jitterMs"])
+        return latency / 1000.0
+
+    def _sim_symbol(self, symbol: str) -> str:
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"{self.id} does not have market symbol {symbol}")
+        return symbol
+
+    def _sim_load(self, reload: bool) -> dict:
+        if not self.markets or reload:
+            self.set_markets(self._sim().markets)
+        return self.markets
+
+
+class SimExchangeSync(_SimMixin, ccxt.Exchange):
+    """同步版（ccxt）"""
+
+    def describe(self):
+        return self.deep_extend(super().describe(), _DESCRIBE)
+
+    def _sleep_latency(self):
+        latency = self._sim_latency()
+        if latency:
+            time.sleep(latency)
+
+    def load_markets(self, reload=False, params={}):
+        self._sleep_latency()
+        return self._sim_load(reload)
+
+    def fetch_ticker(self, symbol, params={}):
+        self.load_markets()
+        self._sleep_latency()
+        return self._sim().ticker(self._sim_symbol(symbol))
+
+    def fetch_tickers(self, symbols=None, params={}):
+        self.load_markets()
+        self._sleep_latency()
+        return {s: self._sim().ticker(self._sim_symbol(s)) for s in (symbols or self.symbols)}
+
+    def fetch_order_book(self, symbol, limit=None, params={}):
+        self.load_markets()
+        self._sleep_latency()
+        return self._sim().order_book(self._sim_symbol(symbol), limit)
+
+    def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        self.load_markets()
+        self._sleep_latency()
+        return self._sim().trades(self._sim_symbol(symbol), limit)
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        self.load_markets()
+        self._sleep_latency()
+        return self._sim().ohlcv(self._sim_symbol(symbol), self.parse_timeframe(timeframe), since, limit)
+
+    def fetch_funding_rates(self, symbols=None, params={}):
+        self.load_markets()
+        self._sleep_latency()
+        if symbols is None:
+            symbols = [m["symbol"] for m in self.markets.values() if m["swap"]]
+        return {s: self._sim().funding_rate(self._sim_symbol(s)) for s in symbols}
+
+
+class SimExchange(_SimMixin, ccxt_async.Exchange):
+    """异步版（ccxt.async_support），同时实现 ccxt.pro 的 watch_* 方法"""
+
+    def describe(self):
+        return self.deep_extend(super().describe(), _DESCRIBE)
+
+    async def _sleep_latency(self):
+        latency = self._sim_latency()
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def load_markets(self, reload=False, params={}):
+        await self._sleep_latency()
+        return self._sim_load(reload)
+
+    async def fetch_ticker(self, symbol, params={}):
+        await self.load_markets()
+        await self._sleep_latency()
+        return self._sim().ticker(self._sim_symbol(symbol))
+
+    async def fetch_tickers(self, symbols=None, params={}):
+        await self.load_markets()
+        await self._sleep_latency()
+        return {s: self._sim().ticker(self._sim_symbol(s)) for s in (symbols or self.symbols)}
+
+    async def fetch_order_book(self, symbol, limit=None, params={}):
+        await self.load_markets()
+        await self._sleep_latency()
+        return self._sim().order_book(self._sim_symbol(symbol), limit)
+
+    async def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        await self.load_markets()
+        await self._sleep_latency()
+        return self._sim().trades(self._sim_symbol(symbol), limit)
+
+    async def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        await self.load_markets()
+        await self._sleep_latency()
+        return self._sim().ohlcv(self._sim_symbol(symbol), self.parse_timeframe(timeframe), since, limit)
+
+    async def fetch_funding_rates(self, symbols=None, params={}):
+        await self.load_markets()
+        await self._sleep_latency()
+        if symbols is None:
+            symbols = [m["symbol"] for m in self.markets.values() if m["swap"]]
+        return {s: self._sim().funding_rate(self._sim_symbol(s)) for s in symbols}
+
+    # ---------------- ccxt.pro ----------------
+
+    async def watch_ticker(self, symbol, params={}):
+        await self.load_markets()
+        symbol = self._sim_symbol(symbol)
+        step = await self._sim().wait_next_step()
+        return self._sim().ticker(symbol, step)
+
+    async def watch_tickers(self, symbols=None, params={}):
+        await self.load_markets()
+        if symbols is None:
+            symbols = list(self.markets)
+        symbols = [self._sim_symbol(s) for s in symbols]
+        step = await self._sim().wait_next_step()
+        # 同一节拍内所有 symbol 一起更新
+        return {s: self._sim().ticker(s, step) for s in symbols}
+
+    async def watch_order_book(self, symbol, limit=None, params={}):
+        await self.load_markets()
+        symbol = self._sim_symbol(symbol)
+        step = await self._sim().wait_next_step()
+        return self._sim().order_book(symbol, limit, step)
+
+    async def watch_trades(self, symbol, since=None, limit=None, params={}):
+        await self.load_markets()
+        symbol = self._sim_symbol(symbol)
+        step = await self._sim().wait_next_step()
+        # 每个节拍产生 1 笔新成交
+        return self._sim().trades(symbol, 1, step)
+
+    async def watch_mark_price(self, symbol, params={}):
+        await self.load_markets()
+        symbol = self._sim_symbol(symbol)
+        sim = self._sim()
+        step = await sim.wait_next_step(sim.mark_interval)
+        return sim.mark_price(symbol, step)
+
+
+def register_sim_exchange() -> bool:
+    """把模拟交易所挂到 ccxt 各命名空间，之后 ?exchange=sim 即可选中"""
+    if os.getenv("SIM_EXCHANGE_ENABLED", "0") != "1":
+        return False
+    setattr(ccxt, EXCHANGE_ID, SimExchangeSync)
+    setattr(ccxt_async, EXCHANGE_ID, SimExchange)
+    setattr(ccxt_pro, EXCHANGE_ID, SimExchange)
+    return True
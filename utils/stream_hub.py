@@ -0,0 +1,468 @@
+"""
+共享行情 hub：同一 (exchange, marketType) 的所有 WS 连接共用一个上游实例，
+同一个 symbol 只有一个上游订阅，更新扇出给所有订阅者
+
+- 交易所支持 watch_tickers 时，按 WATCH_TICKERS_CHUNK 把 symbol 分批合并成多 symbol 订阅，
+  否则（或批量订阅报错时）退回每个 symbol 一个 watch_ticker
+- 永续合约（PERPETUAL_TYPES）的 hub 同时订阅 mark price，推送 ticker + 标记价 / 资金费率的合并状态
+- 订阅者是 ConflatingQueue：每个 symbol 只保留最新一条，慢客户端只会丢中间值，不会积压
+- 最后一个订阅者退订后停止该 symbol 的 watch 循环；hub 内没有任何 symbol 时，
+  HUB_IDLE_CLOSE 秒后关闭上游实例并从 hub 表中移除（下次订阅时重建）
+- 上游实例通过 create_stream_exchange 创建，总线模式下同样适用
+
+    hub = get_ticker_hub("okx", "swap")
+    queue = ConflatingQueue()
+    hub.subscribe("BTC/USDT:USDT", queue)
+    for symbol, ticker in (await queue.get()).items():
+        ...
+    hub.unsubscribe("BTC/USDT:USDT", queue)
+
+环境变量：
+    HUB_IDLE_CLOSE           hub 空闲多久关闭上游实例（秒），默认 30
+    WATCH_TICKERS_BATCHING   设为 0 时总是逐个 watch_ticker
+    WATCH_TICKERS_CHUNK      未在 WATCH_TICKERS_CHUNK 表里的交易所每批 symbol 数，默认 50
+    MERGED_PERPETUAL_STREAM  设为 0 时永续合约也只订阅 ticker
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import ccxt
+import ccxt.pro as ccxt_pro
+
+from utils.market_bus import create_stream_exchange
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+HUB_IDLE_CLOSE = float(os.getenv("HUB_IDLE_CLOSE", "30"))
+MERGED_PERPETUAL_STREAM = os.getenv("MERGED_PERPETUAL_STREAM", "1") != "0"
+WATCH_TICKERS_BATCHING = os.getenv("WATCH_TICKERS_BATCHING", "1") != "0"
+WATCH_TICKERS_CHUNK_DEFAULT = int(os.getenv("WATCH_TICKERS_CHUNK", "50"))
+
+# 走合并流（ticker + mark price）的市场类型；inverse 为 /ws/contracts 币本位使用的 defaultType
+PERPETUAL_TYPES = ("swap", "perpetual", "inverse")
+
+# 单个 watch_tickers 订阅的 symbol 数上限（按交易所单连接 / 单请求的订阅参数限制取保守值）
+WATCH_TICKERS_CHUNK = {
+    "binance": 200,
+    "binanceusdm": 200,
+    "binancecoinm": 200,
+    "okx": 100,
+    "bybit": 10,
+    "bitget": 50,
+    "gate": 100,
+    "kucoin": 100,
+    "kucoinfutures": 100,
+}
+
+# watch 出错后的重试间隔（秒）
+RETRY_DELAY = 5.0
+
+HUB_UPDATES = Counter(
+    "stream_hub_updates_total",
+    "hub 收到的上游更新数",
+    ("exchange", "market_type"),
+)
+HUB_CONFLATED = Counter(
+    "stream_hub_conflated_total",
+    "订阅者还没发出就被新值覆盖的更新数",
+    ("exchange", "market_type"),
+)
+
+class ConflatingQueue:
+    """按 key 合并的队列：put 覆盖同 key 的未取值，get 一次取走全部"""
+
+    def __init__(self):
+        self._items: Dict[str, Any] = {}
+        self._event = asyncio.Event()
+        self.conflated = 0
+
+    def put(self, key: str, value: Any) -> bool:
+        """返回 False 表示覆盖了还没取走的旧值"""
+        fresh = key not in self._items
+        if not fresh:
+            self.conflated += 1
+        self._items[key] = value
+        self._event.set()
+        return fresh
+
+    def discard(self, key: str) -> None:
+        self._items.pop(key, None)
+
+    async def get(self) -> Dict[str, Any]:
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        items, self._items = self._items, {}
+        return items
+
+
+class HubError:
+    """推给订阅者的上游错误（放进队列，由连接决定怎么通知客户端）"""
+
+    __slots__ = ("exc", "fatal")
+
+    def __init__(self, exc: Exception, fatal: bool):
+        self.exc = exc
+        self.fatal = fatal
+
+
+class _Batch:
+    """一组合并成一个 watch_tickers 调用的 symbol"""
+
+    __slots__ = ("symbols", "task", "dirty")
+
+    def __init__(self):
+        self.symbols: Set[str] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.dirty = False
+
+
+class TickerHub:
+    def __init__(self, exchange_id: str, market_type: str, load_params: Optional[dict] = None):
+        self.exchange_id = exchange_id
+        self.market_type = market_type
+        self.load_params = load_params or {}
+        self.subscribers: Dict[str, Set[ConflatingQueue]] = {}
+        # 单独 watch_ticker 的 symbol
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # watch_tickers 批次
+        self.batches: List[_Batch] = []
+        self._symbol_batch: Dict[str, _Batch] = {}
+        self._batching: Optional[bool] = None
+        self._exchange = None
+        self._markets_loaded: Optional[asyncio.Task] = None
+        self._close_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def labels(self) -> Tuple[str, str]:
+        return self.exchange_id, self.market_type
+
+    def _get_exchange(self):
+        if self._exchange is None:
+            self._exchange = create_stream_exchange(
+                self.exchange_id, {"options": {"defaultType": self.market_type}}
+            )
+            self._markets_loaded = asyncio.create_task(self._load_markets(self._exchange))
+        return self._exchange
+
+    async def _load_markets(self, ex) -> None:
+        if not hasattr(ex, "load_markets"):
+            return  # 总线代理由 ingest 进程加载
+        try:
+            await ex.load_markets(params=self.load_params)
+        except Exception as e:
+            logger.warning(f"{self.exchange_id} markets加载失败: {e}")
+
+    @property
+    def batching(self) -> bool:
+        """交易所支持 watch_tickers 时按批订阅（总线代理不声明 watchTickers，逐个订阅）"""
+        if self._batching is None:
+            has = getattr(self._get_exchange(), "has", None) or {}
+            self._batching = bool(has.get("watchTickers")) and WATCH_TICKERS_BATCHING
+        return self._batching
+
+    def _chunk_size(self) -> int:
+        return WATCH_TICKERS_CHUNK.get(self.exchange_id, WATCH_TICKERS_CHUNK_DEFAULT)
+
+    def active(self) -> bool:
+        return bool(self.tasks or self._symbol_batch)
+
+    # ---------------- 订阅 ----------------
+
+    def subscribe(self, symbol: str, queue: ConflatingQueue) -> None:
+        if self._close_handle is not None:
+            self._close_handle.cancel()
+            self._close_handle = None
+        self.subscribers.setdefault(symbol, set()).add(queue)
+        if symbol not in self.tasks and symbol not in self._symbol_batch:
+            self._start(symbol)
+
+    def unsubscribe(self, symbol: str, queue: ConflatingQueue) -> None:
+        queue.discard(symbol)
+        subscribers = self.subscribers.get(symbol)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            self._drop(symbol)
+
+    def _start(self, symbol: str) -> None:
+        if not self.batching:
+            self.tasks[symbol] = asyncio.create_task(self._watch(symbol))
+            return
+        chunk = self._chunk_size()
+        batch = next((b for b in self.batches if len(b.symbols) < chunk), None)
+        if batch is None:
+            batch = _Batch()
+            self.batches.append(batch)
+        batch.symbols.add(symbol)
+        self._symbol_batch[symbol] = batch
+        self._restart_later(batch)
+
+    def _restart_later(self, batch: _Batch) -> None:
+        # 同一轮事件循环里的多次增减合并成一次重订阅
+        if not batch.dirty:
+            batch.dirty = True
+            asyncio.get_running_loop().call_soon(self._restart_batch, batch)
+
+    def _restart_batch(self, batch: _Batch) -> None:
+        batch.dirty = False
+        if batch.task is not None:
+            batch.task.cancel()
+            batch.task = None
+        if batch not in self.batches:
+            return
+        if not batch.symbols:
+            self.batches.remove(batch)
+            return
+        batch.task = asyncio.create_task(self._watch_batch(batch, sorted(batch.symbols)))
+
+    def _drop(self, symbol: str) -> None:
+        self.subscribers.pop(symbol, None)
+        task = self.tasks.pop(symbol, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        batch = self._symbol_batch.pop(symbol, None)
+        if batch is not None:
+            batch.symbols.discard(symbol)
+            self._restart_later(batch)
+        if not self.active() and self._exchange is not None and self._close_handle is None:
+            self._close_handle = asyncio.get_running_loop().call_later(
+                HUB_IDLE_CLOSE, lambda: asyncio.create_task(self.close())
+            )
+
+    # ---------------- 上游 ----------------
+
+    def _publish(self, symbol: str, value: Any) -> None:
+        for queue in self.subscribers.get(symbol, ()):
+            if not queue.put(symbol, value):
+                HUB_CONFLATED.inc(*self.labels)
+
+    async def _watch(self, symbol: str) -> None:
+        ex = self._get_exchange()
+        await self._markets_loaded
+        while True:
+            try:
+                ticker = await ex.watch_ticker(symbol)
+            except asyncio.CancelledError:
+                raise
+            except ccxt.BadSymbol as e:
+                # 不可恢复：通知订阅者后停止该 symbol
+                logger.warning(f"{self.exchange_id} {symbol} 不存在: {e}")
+                self._publish(symbol, HubError(e, fatal=True))
+                self._drop(symbol)
+                return
+            except Exception as e:
+                # 网络抖动、临时错误，稍后重试
+                logger.warning(f"{self.exchange_id} {symbol} ticker 临时异常: {type(e).__name__}: {e}")
+                self._publish(symbol, HubError(e, fatal=False))
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            HUB_UPDATES.inc(*self.labels)
+            self._publish(symbol, ticker)
+
+    async def _watch_batch(self, batch: _Batch, symbols: List[str]) -> None:
+        ex = self._get_exchange()
+        await self._markets_loaded
+        while True:
+            try:
+                tickers = await ex.watch_tickers(symbols)
+            except asyncio.CancelledError:
+                raise
+            except (ccxt.BadSymbol, ccxt.NotSupported) as e:
+                # 批次里有无效 symbol，或交易所不支持按列表订阅：拆成逐个订阅，
+                # 无效的 symbol 由单独的 watch_ticker 报告给订阅者
+                logger.warning(f"{self.exchange_id} watch_tickers 失败，拆分订阅: {type(e).__name__}: {e}")
+                if isinstance(e, ccxt.NotSupported):
+                    self._batching = False
+                    self._unbatch(batch, symbols)
+                else:
+                    # 市场已加载时只拆出不存在的 symbol，其余继续合并订阅
+                    markets = getattr(ex, "markets", None) or {}
+                    invalid = [symbol for symbol in symbols if symbol not in markets]
+                    self._unbatch(batch, invalid or symbols)
+                return
+            except Exception as e:
+                logger.warning(f"{self.exchange_id} watch_tickers 临时异常: {type(e).__name__}: {e}")
+                for symbol in symbols:
+                    self._publish(symbol, HubError(e, fatal=False))
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            HUB_UPDATES.inc(*self.labels, value=len(tickers))
+            for symbol, ticker in tickers.items():
+                self._publish(symbol, ticker)
+
+    def _unbatch(self, batch: _Batch, symbols: List[str]) -> None:
+        """把批次里的 symbol 改为单独 watch_ticker，批次用剩下的 symbol 重新订阅"""
+        batch.task = None
+        for symbol in symbols:
+            if self._symbol_batch.get(symbol) is batch:
+                del self._symbol_batch[symbol]
+                batch.symbols.discard(symbol)
+                self.tasks[symbol] = asyncio.create_task(self._watch(symbol))
+        self._restart_later(batch)
+
+    async def close(self) -> None:
+        self._close_handle = None
+        if self.active() or self._exchange is None:
+            return
+        ex, self._exchange = self._exchange, None
+        # 先移出 hub 表（同步完成）：之后的 get_ticker_hub 建新 hub，不会拿到正在关闭的这个
+        key = (self.exchange_id, self.market_type)
+        if _hubs.get(key) is self:
+            del _hubs[key]
+        logger.info(f"hub 空闲，关闭上游实例: {self.exchange_id}:{self.market_type}")
+        try:
+            await ex.close()
+        except Exception as e:
+            logger.warning(f"关闭上游实例失败 {self.exchange_id}: {e}")
+
+    async def stop(self) -> None:
+        self.subscribers.clear()
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        for batch in self.batches:
+            if batch.task is not None:
+                batch.task.cancel()
+        self.batches.clear()
+        self._symbol_batch.clear()
+        if self._close_handle is not None:
+            self._close_handle.cancel()
+        await self.close()
+
+
+def _pick(data: dict, *keys):
+    """从 ccxt 统一字段或原始 info 里取第一个非空值"""
+    info = data.get("info") or {}
+    for key in keys:
+        value = data.get(key)
+        if value is None:
+            value = info.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+class MergedPerpetualHub(TickerHub):
+    """
+    永续合约合并流：每个 symbol 持续运行 ticker 和 mark price 两路上游订阅，
+    维护合并状态（last / markPrice / indexPrice / fundingRate / openInterest），
+    任一路有变化就发布一份合并后的 ticker（订阅者队列按 symbol 合并，只保留最新）
+
+    ticker 一路沿用 TickerHub 的批量订阅；交易所不支持 watch_mark_price 时只有 ticker 一路
+    """
+
+    MARK_FIELDS = {
+        "markPrice": ("markPrice", "mark_price", "p"),
+        "indexPrice": ("indexPrice", "index_price", "i"),
+        "fundingRate": ("fundingRate", "funding_rate", "r"),
+        "nextFundingTime": ("nextFundingTime", "fundingTimestamp", "next_funding_time", "T"),
+        "openInterest": ("openInterest", "open_interest"),
+    }
+
+    def __init__(self, exchange_id: str, market_type: str, load_params: Optional[dict] = None):
+        super().__init__(exchange_id, market_type, load_params)
+        self.mark_tasks: Dict[str, asyncio.Task] = {}
+        # symbol -> 最新 ticker / 最新 mark 字段
+        self._tickers: Dict[str, dict] = {}
+        self._marks: Dict[str, dict] = {}
+
+    def _start(self, symbol: str) -> None:
+        super()._start(symbol)
+        has = getattr(self._get_exchange(), "has", None) or {}
+        if has.get("watchMarkPrice"):
+            self.mark_tasks[symbol] = asyncio.create_task(self._watch_mark(symbol))
+
+    def _drop(self, symbol: str) -> None:
+        task = self.mark_tasks.pop(symbol, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        self._tickers.pop(symbol, None)
+        self._marks.pop(symbol, None)
+        super()._drop(symbol)
+
+    def active(self) -> bool:
+        return super().active() or bool(self.mark_tasks)
+
+    def _merged(self, symbol: str) -> dict:
+        mark = self._marks.get(symbol)
+        ticker = self._tickers[symbol]
+        if not mark:
+            return ticker
+        merged = dict(ticker)
+        for field, value in mark.items():
+            if value is not None:
+                merged[field] = value
+        return merged
+
+    def _publish(self, symbol: str, value: Any) -> None:
+        if isinstance(value, dict):
+            self._tickers[symbol] = value
+            value = self._merged(symbol)
+        super()._publish(symbol, value)
+
+    def _publish_mark(self, symbol: str, mark: dict) -> None:
+        fields = {field: _pick(mark, *keys) for field, keys in self.MARK_FIELDS.items()}
+        if fields == self._marks.get(symbol):
+            return
+        self._marks[symbol] = fields
+        # 还没有 ticker 时先存着，等 ticker 到了一起发
+        if symbol in self._tickers:
+            super()._publish(symbol, self._merged(symbol))
+
+    async def _watch_mark(self, symbol: str) -> None:
+        ex = self._get_exchange()
+        await self._markets_loaded
+        while True:
+            try:
+                mark = await ex.watch_mark_price(symbol)
+            except asyncio.CancelledError:
+                raise
+            except (ccxt.BadSymbol, ccxt.NotSupported) as e:
+                # 不存在的 symbol 由 ticker 一路报告；这里只停掉 mark price
+                logger.warning(f"{self.exchange_id} {symbol} mark price 订阅停止: {type(e).__name__}: {e}")
+                self.mark_tasks.pop(symbol, None)
+                return
+            except Exception as e:
+                logger.warning(f"{self.exchange_id} {symbol} mark price 临时异常: {type(e).__name__}: {e}")
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            HUB_UPDATES.inc(*self.labels)
+            self._publish_mark(symbol, mark)
+
+    async def stop(self) -> None:
+        for task in self.mark_tasks.values():
+            task.cancel()
+        self.mark_tasks.clear()
+        await super().stop()
+
+
+_hubs: Dict[Tuple[str, str], TickerHub] = {}
+
+
+def get_ticker_hub(exchange_id: str, market_type: str, load_params: Optional[dict] = None) -> TickerHub:
+    """
+    取共享 hub；ccxt.pro 不支持该交易所时抛 ValueError
+    load_params 为 load_markets 的额外参数（如 okx 合约需要 {"type": "swap"}），以第一次创建时为准
+    """
+    key = (exchange_id, market_type)
+    hub = _hubs.get(key)
+    if hub is None:
+        if getattr(ccxt_pro, exchange_id, None) is None:
+            raise ValueError(f"ccxt.pro不支持该交易所: {exchange_id}")
+        if MERGED_PERPETUAL_STREAM and market_type in PERPETUAL_TYPES:
+            hub = MergedPerpetualHub(exchange_id, market_type, load_params)
+        else:
+            hub = TickerHub(exchange_id, market_type, load_params)
+        _hubs[key] = hub
+    return hub
+
+
+async def stop_stream_hubs() -> None:
+    """应用退出时调用"""
+    await asyncio.gather(*(hub.stop() for hub in list(_hubs.values())), return_exceptions=True)
+    _hubs.clear()
@@ -0,0 +1,209 @@
+"""
+启动预热 + 就绪状态
+
+刚部署的 worker 上，第一批用户请求要承担创建实例、load_markets、建立 WS 连接的开销。
+应用启动（lifespan）时在后台并发执行：
+
+- WARMUP_MARKETS 中的每个 (exchange, type) 预加载市场：
+  spot / swap / future ... 进共享市场缓存（utils/exchange_manager.py，REST 路由直接复用），
+  linear / inverse 启动合约轮询并等第一张合约表（utils/contract_cache.py）
+- WARMUP_STREAMS 中的热门 symbol 预先在共享行情 hub（utils/stream_hub.py）上订阅，
+  等到每个 symbol 的第一条推送；这些订阅在进程退出前一直保持，hub 不会因空闲关闭
+
+所有步骤结束（成功、失败或超时）后 WARMUP.ready 为 True，/ready 返回 200；
+失败的步骤只记录在报告里，不会让 worker 一直处于未就绪状态。
+
+环境变量：
+    WARMUP_MARKETS   如 "binance:spot,okx:swap,okx:linear"，type 省略时为 spot
+    WARMUP_STREAMS   如 "binance:spot=BTC/USDT,ETH/USDT;okx:swap=BTC/USDT:USDT"
+    WARMUP_TIMEOUT   每个步骤最多等待的秒数，默认 30
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import ccxt.async_support as ccxt_async
+
+from utils.contract_cache import CONTRACT_CACHE, SPECIAL_LOAD_PARAMS, contract_client
+from utils.exchange_manager import load_rest_markets
+from utils.metrics import Counter
+from utils.rate_limiter import background_priority
+from utils.stream_hub import ConflatingQueue, HubError, TickerHub, get_ticker_hub
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "30"))
+
+# 走合约轮询的类型（/api/contracts/markets 的 type 参数）
+CONTRACT_TYPES = ("linear", "inverse")
+
+WARMUP_STEPS = Counter(
+    "warmup_steps_total",
+    "启动预热步骤数，outcome 为 ok / timeout 或异常类名",
+    ("kind", "outcome"),
+)
+
+
+def parse_market_targets(value: str) -> List[Tuple[str, str]]:
+    """"binance:spot,okx:linear" -> [("binance", "spot"), ("okx", "linear")]"""
+    targets = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        exchange_id, _, market_type = item.partition(":")
+        targets.append((exchange_id.strip().lower(), market_type.strip().lower() or "spot"))
+    return targets
+
+
+def parse_stream_targets(value: str) -> List[Tuple[str, str, List[str]]]:
+    """"binance:spot=BTC/USDT,ETH/USDT;okx:swap=BTC/USDT:USDT" -> [(exchange, type, symbols), ...]"""
+    targets = []
+    for group in value.split(";"):
+        target, _, symbols = group.partition("=")
+        if not target.strip():
+            continue
+        exchange_id, _, market_type = target.strip().partition(":")
+        symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+        if symbol_list:
+            targets.append((exchange_id.strip().lower(), market_type.strip().lower() or "spot", symbol_list))
+    return targets
+
+
+class Warmup:
+    """预热进度；state 为 pending / running / done"""
+
+    def __init__(self):
+        self.state = "pending"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        # 预热订阅的 (hub, symbol, queue)，退出时退订
+        self._holds: List[Tuple[TickerHub, str, ConflatingQueue]] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "done"
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round(((self.finished_at or time.monotonic()) - self.started_at) * 1000, 1)
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "elapsed_ms": elapsed,
+            "steps": self.steps,
+        }
+
+    async def run(self, markets: List[Tuple[str, str]], streams: List[Tuple[str, str, List[str]]]) -> None:
+        self.state = "running"
+        self.started_at = time.monotonic()
+        jobs = [
+            self._step("markets", f"{exchange_id}:{market_type}", self._load_markets(exchange_id, market_type))
+            for exchange_id, market_type in markets
+        ]
+        jobs += [
+            self._step("stream", f"{exchange_id}:{market_type}", self._open_stream(exchange_id, market_type, symbols))
+            for exchange_id, market_type, symbols in streams
+        ]
+        try:
+            await asyncio.gather(*jobs)
+        finally:
+            self.finished_at = time.monotonic()
+            self.state = "done"
+        failed = [s for s in self.steps if s["outcome"] != "ok"]
+        logger.info(
+            f"🔥 预热完成：{len(self.steps)} 个步骤，失败 {len(failed)} 个，"
+            f"耗时 {(self.finished_at - self.started_at):.2f}s"
+        )
+
+    async def _step(self, kind: str, target: str, coro) -> None:
+        step: Dict[str, Any] = {"kind": kind, "target": target, "outcome": "running", "ms": None}
+        self.steps.append(step)
+        started = time.monotonic()
+        try:
+            detail = await asyncio.wait_for(coro, timeout=WARMUP_TIMEOUT)
+            step["outcome"] = "ok"
+            if detail:
+                step.update(detail)
+        except asyncio.TimeoutError:
+            step["outcome"] = "timeout"
+        except Exception as e:
+            step["outcome"] = type(e).__name__
+            step["error"] = str(e)
+        step["ms"] = round((time.monotonic() - started) * 1000, 1)
+        WARMUP_STEPS.inc(kind, step["outcome"])
+        if step["outcome"] != "ok":
+            logger.warning(f"预热 {kind} {target} 失败: {step['outcome']} {step.get('error', '')}")
+
+    async def _load_markets(self, exchange_id: str, market_type: str) -> Dict[str, Any]:
+        if market_type in CONTRACT_TYPES:
+            contract_client(exchange_id, market_type)  # 交易所不存在时抛 ValueError
+            table = await CONTRACT_CACHE.get(exchange_id, market_type, wait=WARMUP_TIMEOUT)
+            if table is None:
+                raise asyncio.TimeoutError()
+            return {"markets": table.total}
+
+        ex_class = getattr(ccxt_async, exchange_id, None)
+        if ex_class is None:
+            raise ValueError(f"CCXT不支持的交易所名称: {exchange_id}")
+        ex = ex_class({"enableRateLimit": True, "options": {"defaultType": market_type}})
+        try:
+            # 预加载是后台工作，启动期间到达的用户请求优先
+            with background_priority():
+                markets = await load_rest_markets(ex, market_type)
+        finally:
+            await ex.close()
+        return {"markets": len(markets)}
+
+    async def _open_stream(self, exchange_id: str, market_type: str, symbols: List[str]) -> Dict[str, Any]:
+        # 合约类型与 /ws/contracts 使用同一个 hub 和 load_markets 参数
+        load_params = SPECIAL_LOAD_PARAMS.get(exchange_id) if market_type in ("swap", "inverse") else None
+        hub = get_ticker_hub(exchange_id, market_type, load_params)
+        queue = ConflatingQueue()
+        for symbol in symbols:
+            hub.subscribe(symbol, queue)
+            self._holds.append((hub, symbol, queue))
+
+        pending = set(symbols)
+        rejected = []
+        while pending:
+            for symbol, update in (await queue.get()).items():
+                if symbol not in pending:
+                    continue
+                if isinstance(update, HubError):
+                    if not update.fatal:
+                        continue  # 上游重试中，继续等
+                    rejected.append(symbol)
+                pending.discard(symbol)
+        return {"symbols": len(symbols) - len(rejected), "rejected": rejected}
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        for hub, symbol, queue in self._holds:
+            hub.unsubscribe(symbol, queue)
+        self._holds.clear()
+
+
+WARMUP = Warmup()
+
+
+async def start_warmup() -> None:
+    """应用启动时调用：在后台执行预热，不阻塞启动（进度见 /ready）"""
+    markets = parse_market_targets(os.getenv("WARMUP_MARKETS", ""))
+    streams = parse_stream_targets(os.getenv("WARMUP_STREAMS", ""))
+    if not markets and not streams:
+        WARMUP.state = "done"
+        return
+    logger.info(f"🔥 开始预热：markets={markets} streams={streams}")
+    WARMUP.task = asyncio.create_task(WARMUP.run(markets, streams))
+
+
+async def stop_warmup() -> None:
+    await WARMUP.stop()